@@ -692,4 +692,485 @@ double jaccard (
 
     // Return jaccard index.
     return ((double)inter) / ((double) uni);
-}
\ No newline at end of file
+}
+
+/*
+ * Coded interface
+ * ===============
+ * The following functions take the chromosomes as integer codes instead of names. Both sets have to use the same
+ * coding, in which the order of the codes is the order of the chromosome names. Positions are compared as genomic
+ * keys (code << 32) + position, so that the sets are sorted by these keys.
+ * A region with initial == final occupies its initial position (see reachKey), as in GenomicRegion.overlap.
+ * The result buffers are provided by the caller and the number of result regions is returned.
+ */
+
+/**
+ * Return the genomic key of a position.
+ */
+static long long genomeKey(const int chromosome, const int position) {
+    return ((long long) chromosome << 32) + position;
+}
+
+/**
+ * Return the genomic key of the first position after a region; empty regions reach beyond their initial position.
+ */
+static long long reachKey(const int chromosome, const int initial, const int final) {
+    return genomeKey(chromosome, max(final, initial + 1));
+}
+
+/**
+ * Return the number of regions of a sorted set whose genomic key of the initial position is smaller than key
+ * (or smaller or equal, if inclusive is true).
+ */
+static int countStartsBefore(
+    const int *chromosomes,
+    const int *initials,
+    const int size,
+    const long long key,
+    const bool inclusive
+) {
+    int lo = 0;
+    int hi = size;
+    while (lo < hi) {
+        const int mid = lo + (hi - lo) / 2;
+        const long long start = genomeKey(chromosomes[mid], initials[mid]);
+        if (start < key || (inclusive && start == key)) {
+            lo = mid + 1;
+        } else {
+            hi = mid;
+        }
+    }
+    return lo;
+}
+
+/**
+ * Compute the intersection of two sorted and merged genomic region sets using the OVERLAP mode.
+ *
+ * @param const int *chromosomesA The chromosome codes of the genomic regions of the first set.
+ * @param const int *initialsA    The initial positions of the genomic regions of the first set.
+ * @param const int *finalsA      The final positions of the genomic regions of the first set.
+ * @param const int sizeA         The number of genomic regions in the first set.
+ * @param const int *chromosomesB The chromosome codes of the genomic regions of the second set.
+ * @param const int *initialsB    The initial positions of the genomic regions of the second set.
+ * @param const int *finalsB      The final positions of the genomic regions of the second set.
+ * @param const int sizeB         The number of genomic regions in the second set.
+ * @param int *indicesR           Used to return the result. The indices of the regions of the first set, the result
+ *                                regions belong to. It has to hold sizeA + sizeB values.
+ * @param int *initialsR          Used to return the result. The initial positions of the result regions.
+ * @param int *finalsR            Used to return the result. The final positions of the result regions.
+ *
+ * @return The number of regions in the result set.
+ */
+int intersectCodedOverlap (
+    const int *chromosomesA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromosomesB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *indicesR,
+    int *initialsR,
+    int *finalsR
+) {
+    int i, j = 0, k = 0;
+    for (i = 0; i < sizeA; i++) {
+        const long long start = genomeKey(chromosomesA[i], initialsA[i]);
+        const long long end = genomeKey(chromosomesA[i], finalsA[i]);
+        // Skip the regions of the second set which end before the current region starts
+        while (j < sizeB && reachKey(chromosomesB[j], initialsB[j], finalsB[j]) <= start) {
+            j++;
+        }
+        // The following regions overlap as long as they start before the current region ends
+        int l;
+        for (l = j; l < sizeB && genomeKey(chromosomesB[l], initialsB[l]) < end; l++) {
+            indicesR[k] = i;
+            initialsR[k] = max(initialsA[i], initialsB[l]);
+            finalsR[k] = min(finalsA[i], finalsB[l]);
+            k++;
+        }
+    }
+    return k;
+}
+
+/**
+ * Find the regions of a sorted genomic region set which overlap (mode OVERLAP_TYPE_ORIGINAL) or are completely
+ * included (mode OVERLAP_TYPE_COMP_INCL) by any region of a second sorted genomic region set.
+ *
+ * @param const int overlapType   OVERLAP_TYPE_ORIGINAL or OVERLAP_TYPE_COMP_INCL.
+ * @param const int *chromosomesA The chromosome codes of the genomic regions of the first set.
+ * @param const int *initialsA    The initial positions of the genomic regions of the first set.
+ * @param const int *finalsA      The final positions of the genomic regions of the first set.
+ * @param const int sizeA         The number of genomic regions in the first set.
+ * @param const int *chromosomesB The chromosome codes of the genomic regions of the second set.
+ * @param const int *initialsB    The initial positions of the genomic regions of the second set.
+ * @param const int *finalsB      The final positions of the genomic regions of the second set.
+ * @param const int sizeB         The number of genomic regions in the second set.
+ * @param int *indicesR           Used to return the result. The indices of the selected regions of the first set.
+ *                                It has to hold sizeA values.
+ *
+ * @return The number of regions in the result set, or -1 if the memory could not be allocated.
+ */
+int selectCodedRegions (
+    const int overlapType,
+    const int *chromosomesA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromosomesB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *indicesR
+) {
+    int i, j, k = 0;
+    // The maximum reach (ORIGINAL) or final position (COMP_INCL) of the first j + 1 regions of the second set
+    long long *maxEnd = malloc(sizeB * sizeof(long long));
+    if (maxEnd == NULL && sizeB > 0) {
+        return -1;
+    }
+    for (j = 0; j < sizeB; j++) {
+        const long long end = (overlapType == OVERLAP_TYPE_ORIGINAL) ?
+            reachKey(chromosomesB[j], initialsB[j], finalsB[j]) : genomeKey(chromosomesB[j], finalsB[j]);
+        maxEnd[j] = (j > 0 && maxEnd[j - 1] > end) ? maxEnd[j - 1] : end;
+    }
+    for (i = 0; i < sizeA; i++) {
+        const long long start = genomeKey(chromosomesA[i], initialsA[i]);
+        const long long end = genomeKey(chromosomesA[i], finalsA[i]);
+        bool hit;
+        if (overlapType == OVERLAP_TYPE_ORIGINAL) {
+            // Any region starting before the end of the current region has to reach beyond its initial position
+            const int before = countStartsBefore(chromosomesB, initialsB, sizeB, end, false);
+            hit = before > 0 && maxEnd[before - 1] > start;
+        } else if (initialsA[i] == finalsA[i]) {
+            // An empty region has to lie strictly inside a region starting before it
+            const int before = countStartsBefore(chromosomesB, initialsB, sizeB, start, false);
+            hit = before > 0 && maxEnd[before - 1] > start;
+        } else {
+            // A region starting at or before the current region has to end at or after its final position
+            const int before = countStartsBefore(chromosomesB, initialsB, sizeB, start, true);
+            hit = before > 0 && maxEnd[before - 1] >= end;
+        }
+        if (hit) {
+            indicesR[k] = i;
+            k++;
+        }
+    }
+    free(maxEnd);
+    return k;
+}
+
+/**
+ * Return the jaccard index of two sorted and merged genomic region sets: the coverage of their intersection divided by
+ * the coverage of their union.
+ *
+ * @param const int *chromosomesA The chromosome codes of the genomic regions of the first set.
+ * @param const int *initialsA    The initial positions of the genomic regions of the first set.
+ * @param const int *finalsA      The final positions of the genomic regions of the first set.
+ * @param const int sizeA         The number of genomic regions in the first set.
+ * @param const int *chromosomesB The chromosome codes of the genomic regions of the second set.
+ * @param const int *initialsB    The initial positions of the genomic regions of the second set.
+ * @param const int *finalsB      The final positions of the genomic regions of the second set.
+ * @param const int sizeB         The number of genomic regions in the second set.
+ */
+double jaccardCoded (
+    const int *chromosomesA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromosomesB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB
+) {
+    int i, j = 0;
+    long long inter = 0, coverageA = 0, coverageB = 0;
+    for (i = 0; i < sizeA; i++) {
+        const long long start = genomeKey(chromosomesA[i], initialsA[i]);
+        const long long end = genomeKey(chromosomesA[i], finalsA[i]);
+        coverageA += finalsA[i] - initialsA[i];
+        while (j < sizeB && reachKey(chromosomesB[j], initialsB[j], finalsB[j]) <= start) {
+            j++;
+        }
+        int l;
+        for (l = j; l < sizeB && genomeKey(chromosomesB[l], initialsB[l]) < end; l++) {
+            inter += min(finalsA[i], finalsB[l]) - max(initialsA[i], initialsB[l]);
+        }
+    }
+    for (j = 0; j < sizeB; j++) {
+        coverageB += finalsB[j] - initialsB[j];
+    }
+    // Size(A u B) = Size(A) + Size(B) - Size(A n B)
+    return ((double) inter) / ((double) (coverageA + coverageB - inter));
+}
+
+/**
+ * Store a region in the result buffers, if they can hold it.
+ */
+static void appendRegion(
+    const int capacity,
+    const int k,
+    const int index,
+    const int initial,
+    const int final,
+    int *indicesR,
+    int *initialsR,
+    int *finalsR
+) {
+    if (k < capacity) {
+        indicesR[k] = index;
+        initialsR[k] = initial;
+        finalsR[k] = final;
+    }
+}
+
+/**
+ * Subtract a sorted and merged genomic region set from a sorted genomic region set: every region of the first set is
+ * cut into the parts which are not covered by the second set.
+ *
+ * @param const int *chromosomesA The chromosome codes of the genomic regions of the first set.
+ * @param const int *initialsA    The initial positions of the genomic regions of the first set.
+ * @param const int *finalsA      The final positions of the genomic regions of the first set.
+ * @param const int sizeA         The number of genomic regions in the first set.
+ * @param const int *chromosomesB The chromosome codes of the genomic regions of the second set.
+ * @param const int *initialsB    The initial positions of the genomic regions of the second set.
+ * @param const int *finalsB      The final positions of the genomic regions of the second set.
+ * @param const int sizeB         The number of genomic regions in the second set.
+ * @param const bool wholeRegion  Remove the regions of the first set which overlap the second set instead of cutting
+ *                                them.
+ * @param const int capacity      The number of regions the result buffers can hold.
+ * @param int *indicesR           Used to return the result. The indices of the regions of the first set, the result
+ *                                regions belong to.
+ * @param int *initialsR          Used to return the result. The initial positions of the result regions.
+ * @param int *finalsR            Used to return the result. The final positions of the result regions.
+ *
+ * @return The number of regions in the result set. If it is greater than capacity, only the first capacity regions
+ *         were stored and the function has to be called again with larger buffers.
+ */
+int subtractCoded (
+    const int *chromosomesA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromosomesB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    const bool wholeRegion,
+    const int capacity,
+    int *indicesR,
+    int *initialsR,
+    int *finalsR
+) {
+    int i, j = 0, k = 0;
+    for (i = 0; i < sizeA; i++) {
+        const long long start = genomeKey(chromosomesA[i], initialsA[i]);
+        const long long end = genomeKey(chromosomesA[i], finalsA[i]);
+        while (j < sizeB && reachKey(chromosomesB[j], initialsB[j], finalsB[j]) <= start) {
+            j++;
+        }
+        // The overlapping regions of the second set are disjoint, the gaps between them remain
+        bool cut = false;
+        int cursor = initialsA[i];
+        int l;
+        for (l = j; l < sizeB && genomeKey(chromosomesB[l], initialsB[l]) < end; l++) {
+            cut = true;
+            if (wholeRegion) {
+                break;
+            }
+            if (initialsB[l] > cursor) {
+                appendRegion(capacity, k++, i, cursor, initialsB[l], indicesR, initialsR, finalsR);
+            }
+            cursor = max(cursor, finalsB[l]);
+        }
+        if (!cut) {
+            appendRegion(capacity, k++, i, initialsA[i], finalsA[i], indicesR, initialsR, finalsR);
+        } else if (!wholeRegion && cursor < finalsA[i]) {
+            appendRegion(capacity, k++, i, cursor, finalsA[i], indicesR, initialsR, finalsR);
+        }
+    }
+    return k;
+}
+
+/**
+ * Merge the regions of a sorted genomic region set which overlap or lie closer than a distance to each other. Only
+ * neighbouring regions of the same segment are merged (e.g. the segments of the regions with the same name).
+ *
+ * @param const int *chromosomes The chromosome codes of the genomic regions.
+ * @param const int *initials    The initial positions of the genomic regions.
+ * @param const int *finals      The final positions of the genomic regions.
+ * @param const int *segments    The segment of every region; the segments of neighbouring regions differ at every
+ *                               boundary of a segment.
+ * @param const int size         The number of genomic regions.
+ * @param const int distance     A region is merged if its initial position minus distance lies before the end of the
+ *                               current cluster.
+ * @param int *indicesR          Used to return the result. The index of the first region of every cluster. It has to
+ *                               hold size values.
+ * @param int *finalsR           Used to return the result. The final positions of the clusters.
+ *
+ * @return The number of clusters.
+ */
+int clusterCodedRegions (
+    const int *chromosomes,
+    const int *initials,
+    const int *finals,
+    const int *segments,
+    const int size,
+    const int distance,
+    int *indicesR,
+    int *finalsR
+) {
+    int i, k = -1;
+    for (i = 0; i < size; i++) {
+        if (k >= 0 && chromosomes[i] == chromosomes[i - 1] && segments[i] == segments[i - 1] &&
+                (long long) initials[i] - distance < finalsR[k]) {
+            finalsR[k] = max(finalsR[k], finals[i]);
+        } else {
+            k++;
+            indicesR[k] = i;
+            finalsR[k] = finals[i];
+        }
+    }
+    return k + 1;
+}
+
+/**
+ * A key together with the length of the region it belongs to.
+ */
+typedef struct {
+    long long key;
+    long long length;
+} KeyedLength;
+
+static int compareKeyedLengths(const void *a, const void *b) {
+    const long long keyA = ((const KeyedLength *) a)->key;
+    const long long keyB = ((const KeyedLength *) b)->key;
+    return (keyA > keyB) - (keyA < keyB);
+}
+
+/**
+ * Count the regions of a sorted genomic region set which overlap each region of another sorted genomic region set and
+ * sum up their lengths.
+ *
+ * @param const int *chromosomesA The chromosome codes of the genomic regions of the first set.
+ * @param const int *initialsA    The initial positions of the genomic regions of the first set.
+ * @param const int *finalsA      The final positions of the genomic regions of the first set.
+ * @param const int sizeA         The number of genomic regions in the first set.
+ * @param const int *chromosomesB The chromosome codes of the genomic regions of the second set.
+ * @param const int *initialsB    The initial positions of the genomic regions of the second set.
+ * @param const int *finalsB      The final positions of the genomic regions of the second set.
+ * @param const int sizeB         The number of genomic regions in the second set.
+ * @param int *countsR            Used to return the result. The number of overlapping regions of the second set for
+ *                                every region of the first set.
+ * @param double *lengthsR        Used to return the result. The total length of the overlapping regions of the second
+ *                                set for every region of the first set.
+ *
+ * @return 0, or -1 if the memory could not be allocated.
+ */
+int sumCodedOverlaps (
+    const int *chromosomesA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromosomesB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *countsR,
+    double *lengthsR
+) {
+    int i, j;
+    // Lengths of the first j regions of the second set in the order of their initial and of their reach positions
+    long long *startLengths = malloc((sizeB + 1) * sizeof(long long));
+    long long *reachLengths = malloc((sizeB + 1) * sizeof(long long));
+    KeyedLength *reaches = malloc(sizeB * sizeof(KeyedLength));
+    if (startLengths == NULL || reachLengths == NULL || (reaches == NULL && sizeB > 0)) {
+        free(startLengths);
+        free(reachLengths);
+        free(reaches);
+        return -1;
+    }
+    startLengths[0] = 0;
+    for (j = 0; j < sizeB; j++) {
+        reaches[j].key = reachKey(chromosomesB[j], initialsB[j], finalsB[j]);
+        reaches[j].length = finalsB[j] - initialsB[j];
+        startLengths[j + 1] = startLengths[j] + reaches[j].length;
+    }
+    qsort(reaches, sizeB, sizeof(KeyedLength), compareKeyedLengths);
+    reachLengths[0] = 0;
+    for (j = 0; j < sizeB; j++) {
+        reachLengths[j + 1] = reachLengths[j] + reaches[j].length;
+    }
+
+    // The regions starting before the end of a region, minus those ending before its start
+    j = 0;
+    for (i = 0; i < sizeA; i++) {
+        const long long start = genomeKey(chromosomesA[i], initialsA[i]);
+        const int started = countStartsBefore(chromosomesB, initialsB, sizeB,
+                                              genomeKey(chromosomesA[i], finalsA[i]), false);
+        while (j < sizeB && reaches[j].key <= start) {
+            j++;
+        }
+        countsR[i] = started - j;
+        lengthsR[i] = (double) (startLengths[started] - reachLengths[j]);
+    }
+    free(startLengths);
+    free(reachLengths);
+    free(reaches);
+    return 0;
+}
+
+/**
+ * Return 1, if two neighbouring regions of a sorted genomic region set overlap, and 0 otherwise.
+ *
+ * @param const int *chromosomes The chromosome codes of the genomic regions.
+ * @param const int *initials    The initial positions of the genomic regions.
+ * @param const int *finals      The final positions of the genomic regions.
+ * @param const int size         The number of genomic regions.
+ */
+int withinCodedOverlap (
+    const int *chromosomes,
+    const int *initials,
+    const int *finals,
+    const int size
+) {
+    int i;
+    for (i = 1; i < size; i++) {
+        if (chromosomes[i] == chromosomes[i - 1] && (initials[i] < finals[i - 1] ||
+                (initials[i] == initials[i - 1] && finals[i] > initials[i]))) {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+/**
+ * Find the regions of a sorted genomic region set which differ in position from their predecessor.
+ *
+ * @param const int *chromosomes The chromosome codes of the genomic regions.
+ * @param const int *initials    The initial positions of the genomic regions.
+ * @param const int *finals      The final positions of the genomic regions.
+ * @param const int size         The number of genomic regions.
+ * @param int *indicesR          Used to return the result. The indices of the selected regions. It has to hold size
+ *                               values.
+ *
+ * @return The number of selected regions.
+ */
+int selectUniqueRegions (
+    const int *chromosomes,
+    const int *initials,
+    const int *finals,
+    const int size,
+    int *indicesR
+) {
+    int i, k = 0;
+    for (i = 0; i < size; i++) {
+        if (i == 0 || chromosomes[i] != chromosomes[i - 1] || initials[i] != initials[i - 1] ||
+                finals[i] != finals[i - 1]) {
+            indicesR[k] = i;
+            k++;
+        }
+    }
+    return k;
+}
@@ -78,4 +78,97 @@ double jaccard (
     const int sizeB
 );
 
+int intersectCodedOverlap (
+    const int *chromsA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromsB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *indicesR,
+    int *initialsR,
+    int *finalsR
+);
+
+int selectCodedRegions (
+    const int overlapType,
+    const int *chromsA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromsB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *indicesR
+);
+
+double jaccardCoded (
+    const int *chromsA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromsB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB
+);
+
+int subtractCoded (
+    const int *chromsA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromsB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    const bool wholeRegion,
+    const int capacity,
+    int *indicesR,
+    int *initialsR,
+    int *finalsR
+);
+
+int clusterCodedRegions (
+    const int *chroms,
+    const int *initials,
+    const int *finals,
+    const int *segments,
+    const int size,
+    const int distance,
+    int *indicesR,
+    int *finalsR
+);
+
+int sumCodedOverlaps (
+    const int *chromsA,
+    const int *initialsA,
+    const int *finalsA,
+    const int sizeA,
+    const int *chromsB,
+    const int *initialsB,
+    const int *finalsB,
+    const int sizeB,
+    int *countsR,
+    double *lengthsR
+);
+
+int withinCodedOverlap (
+    const int *chroms,
+    const int *initials,
+    const int *finals,
+    const int size
+);
+
+int selectUniqueRegions (
+    const int *chroms,
+    const int *initials,
+    const int *finals,
+    const int size,
+    int *indicesR
+);
+
 #endif // _LIBRGT_H_
@@ -0,0 +1,225 @@
+"""
+BedReader
+===================
+BedReader parses BED and bedGraph files into GenomicRegionColumns. The file is read in large blocks of bytes; the
+fields of all lines of a block are located and the coordinates converted with NumPy, so that Python objects are only
+created for the names and the extra columns of the regions.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import numpy as np
+# Internal
+from rgt.GenomicRegionColumns import GenomicRegionColumns, DEFAULT_ORIENTATIONS, STRAND_TYPE
+
+# Number of bytes parsed at once
+BLOCK_SIZE = 1 << 24
+# Maximum number of digits of a position
+MAX_DIGITS = 10
+MAX_POSITION = np.iinfo(np.int32).max
+# Fields longer than this are sliced one by one instead of being copied into a padded array
+MAX_FIELD_WIDTH = 256
+# Maximum number of padded characters copied at once
+FIELD_BATCH_SIZE = 1 << 20
+
+NEWLINE = ord("\n")
+TAB = ord("\t")
+
+
+def separator_table(characters):
+    """Return a lookup table marking the given characters among all byte values."""
+    table = np.zeros(256, dtype=bool)
+    table[[ord(c) for c in characters]] = True
+    return table
+
+# Bytes separating the fields of a line (str.split() for BED, tabs for bedGraph)
+BED_SEPARATORS = separator_table(" \t\n\r\x0b\x0c")
+BEDGRAPH_SEPARATORS = separator_table("\t\n\r")
+
+
+class BedReader(object):
+    """*Keyword arguments:*
+
+        - filename -- Path to the BED or bedGraph file.
+        - bedgraph -- Read the file as bedGraph: exactly four tab-separated fields, the fourth one is kept as data.
+
+    .. note:: Lines which can not be parsed (e.g. track lines) are skipped and collected in errors. As in
+              GenomicRegionSet.read_bed, BED regions with initial > final are swapped and zero-length BED regions
+              are errors. BED columns 5 and 7, 8, ... are joined by tabs as the data of a region.
+    """
+
+    def __init__(self, filename, bedgraph=False):
+        self.filename = filename
+        self.bedgraph = bedgraph
+        self.errors = []
+
+    def read(self):
+        """Return all regions of the file as GenomicRegionColumns in the order of the file."""
+        return GenomicRegionColumns.join(list(self.iter_blocks()))
+
+    def iter_columns(self, chunk_size):
+        """Iterate over the regions of the file as GenomicRegionColumns of chunk_size regions (the last one may be
+        smaller), in the order of the file."""
+        pending = []
+        size = 0
+        for columns in self.iter_blocks(min(BLOCK_SIZE, max(chunk_size * 64, 1 << 16))):
+            pending.append(columns)
+            size += len(columns)
+            if size >= chunk_size:
+                columns = GenomicRegionColumns.join(pending)
+                stop = size - size % chunk_size
+                for i in xrange(0, stop, chunk_size):
+                    yield columns.take(slice(i, i + chunk_size))
+                pending = [columns.take(slice(stop, size))]
+                size -= stop
+        if size > 0:
+            yield GenomicRegionColumns.join(pending)
+
+    def iter_blocks(self, block_size=BLOCK_SIZE):
+        """Iterate over the regions of the file as GenomicRegionColumns, one for every block of block_size bytes."""
+        self.errors = []
+        rest = ""
+        with open(self.filename, "rb") as f:
+            while True:
+                block = f.read(block_size)
+                if not block:
+                    break
+                # Keep the incomplete last line for the next block
+                cut = block.rfind("\n") + 1
+                if cut == 0:
+                    rest += block
+                    continue
+                text = rest + block[:cut]
+                rest = block[cut:]
+                yield self.parse(text)
+        if rest:
+            yield self.parse(rest + "\n")
+
+    def parse(self, text):
+        """Return the regions of the given lines as GenomicRegionColumns; the lines have to end with a newline."""
+        buf = np.frombuffer(text, dtype=np.uint8)
+        line_ends = np.flatnonzero(buf == NEWLINE)
+        line_starts = np.concatenate(([0], line_ends[:-1] + 1))
+
+        # Fields are the maximal runs of non-separator bytes
+        field = ~(BEDGRAPH_SEPARATORS if self.bedgraph else BED_SEPARATORS)[buf]
+        edge = np.diff(np.concatenate(([0], field.view(np.int8), [0])))
+        field_starts = np.flatnonzero(edge == 1)
+        field_ends = np.flatnonzero(edge == -1)
+        field_lines = np.searchsorted(line_ends, field_starts)
+        field_counts = np.bincount(field_lines, minlength=len(line_ends))
+        line_first = np.concatenate(([0], np.cumsum(field_counts)[:-1]))
+
+        if self.bedgraph:
+            tabs = np.bincount(np.searchsorted(line_ends, np.flatnonzero(buf == TAB)), minlength=len(line_ends))
+            valid = (field_counts == 4) & (tabs == 3)
+        else:
+            valid = field_counts >= 3
+
+        def column(i, lines):
+            """Return the (start, end) positions of the i-th field of the given lines."""
+            k = line_first[lines] + i
+            return field_starts[k], field_ends[k]
+
+        lines = np.flatnonzero(valid)
+        initials, ok_initial = parse_positions(buf, *column(1, lines))
+        finals, ok_final = parse_positions(buf, *column(2, lines))
+        ok = ok_initial & ok_final
+        if not self.bedgraph:
+            initials, finals = np.minimum(initials, finals), np.maximum(initials, finals)
+            ok &= initials != finals
+        valid[lines[~ok]] = False
+        lines = lines[ok]
+        initials = initials[ok]
+        finals = finals[ok]
+
+        # Lines with fields which are not regions
+        bad = np.flatnonzero(~valid & (field_counts > 0))
+        self.errors.extend(text[line_starts[i]:line_ends[i]] for i in bad.tolist())
+
+        # Chromosomes come in runs, only the first region of each run has to be looked up
+        chroms = field_strings(buf, *column(0, lines))
+        runs = np.flatnonzero(np.concatenate(([True], chroms[1:] != chroms[:-1])))
+        chrom_names, run_chroms = np.unique(chroms[runs], return_inverse=True)
+        chroms = np.repeat(run_chroms, np.diff(np.append(runs, len(chroms))))
+        counts = field_counts[lines]
+        names = data = strands = None
+        labels = list(DEFAULT_ORIENTATIONS)
+        if self.bedgraph:
+            data = field_strings(buf, *column(3, lines)).tolist()
+        else:
+            if np.any(counts > 3):
+                names = optional_strings(buf, column, lines, counts, 3)
+            if np.any(counts > 4):
+                data = optional_strings(buf, column, lines, counts, 4)
+                # Columns 7, 8, ... are appended to the score
+                for i in np.flatnonzero(counts > 6).tolist():
+                    line = lines[i]
+                    start = field_starts[line_first[line] + 6]
+                    data[i] = "\t".join([data[i]] + text[start:line_ends[line]].split())
+            if np.any(counts > 5):
+                has_strand = counts > 5
+                values = np.array([None] * len(lines), dtype=object)
+                values[has_strand] = field_strings(buf, *column(5, lines[has_strand])).tolist()
+                strands = np.zeros(len(lines), dtype=STRAND_TYPE)
+                for o in set(values[has_strand].tolist()):
+                    if o not in labels:
+                        labels.append(o)
+                    strands[values == o] = labels.index(o)
+
+        return GenomicRegionColumns(chrom_names=chrom_names.tolist(), chroms=chroms, initials=initials,
+                                    finals=finals, strands=strands, orientation_labels=labels, names=names,
+                                    data=data)
+
+
+def field_strings(buf, starts, ends):
+    """Return the fields between the given start and end positions of buf as an array of byte strings, or of objects
+    if a field is longer than MAX_FIELD_WIDTH."""
+    lengths = ends - starts
+    longer = lengths > MAX_FIELD_WIDTH
+    if not np.any(longer):
+        return padded_strings(buf, starts, lengths)
+    values = np.empty(len(starts), dtype=object)
+    shorter = ~longer
+    values[shorter] = padded_strings(buf, starts[shorter], lengths[shorter]).tolist()
+    values[longer] = [buf[s:e].tostring() for s, e in zip(starts[longer].tolist(), ends[longer].tolist())]
+    return values
+
+
+def padded_strings(buf, starts, lengths):
+    """Return the fields of the given lengths starting at the given positions of buf as an array of byte strings of
+    the longest length. The fields are copied in batches of at most FIELD_BATCH_SIZE characters."""
+    width = max(int(lengths.max()) if len(lengths) else 0, 1)
+    offsets = np.arange(width)
+    chars = np.zeros((len(starts), width), dtype=np.uint8)
+    step = max(FIELD_BATCH_SIZE // width, 1)
+    for i in xrange(0, len(starts), step):
+        index = np.minimum(starts[i:i + step, None] + offsets, len(buf) - 1)
+        chars[i:i + step] = np.where(offsets < lengths[i:i + step, None], buf[index], 0)
+    return chars.view("S%d" % width).ravel()
+
+
+def optional_strings(buf, column, lines, counts, i):
+    """Return the i-th fields of the given lines as a list, with None for lines which have no i-th field."""
+    present = counts > i
+    if np.all(present):
+        return field_strings(buf, *column(i, lines)).tolist()
+    values = np.empty(len(lines), dtype=object)
+    values[present] = field_strings(buf, *column(i, lines[present])).tolist()
+    return values.tolist()
+
+
+def parse_positions(buf, starts, ends):
+    """Return the non-negative integers written between the given start and end positions of buf, and a mask of the
+    fields which are valid positions."""
+    lengths = ends - starts
+    values = np.zeros(len(starts), dtype=np.int64)
+    ok = (lengths > 0) & (lengths <= MAX_DIGITS)
+    for k in range(MAX_DIGITS):
+        inside = ok & (k < lengths)
+        digits = buf[np.minimum(starts + k, len(buf) - 1)].astype(np.int64) - ord("0")
+        ok &= ~inside | ((digits >= 0) & (digits <= 9))
+        values = np.where(inside, values * 10 + digits, values)
+    ok &= values <= MAX_POSITION
+    return values, ok
@@ -0,0 +1,130 @@
+"""
+BigWigWriter
+===================
+BigWigWriter writes binned coverage (see CoverageSet) directly into a bigWig file with pyBigWig, without a
+temporary wig file and the UCSC tools. The coverage of several CoverageSets (e.g. one per chromosome) can be appended
+to one open file.
+
+"""
+
+from __future__ import print_function
+import numpy as np
+import pyBigWig
+
+
+def read_chrom_sizes(chrom_file):
+    """Return the list of (chromosome, size) pairs of a tab-separated chromosome size file, in the order of the file."""
+    chrom_sizes = []
+    with open(chrom_file) as f:
+        for line in f:
+            line = line.strip().split('\t')
+            if len(line) >= 2:
+                chrom_sizes.append((line[0], int(line[1])))
+    return chrom_sizes
+
+
+def coverage_bins(cs):
+    """Return the bins of the CoverageSet <cs> as list of (chromosome, start, values) triples, one per region.
+
+    .. note:: The bins are placed at the positions of CoverageSet.write_wig (which are 1-based), so that the bigWig
+              files equal those converted from wig files.
+    """
+    shift = (cs.binsize - cs.stepsize) // 2 - 1
+    regions = list(cs.genomicRegions)
+    return [(regions[i].chrom, regions[i].initial + shift, cs.coverage[i])
+            for i in range(len(regions)) if i < len(cs.coverage)]
+
+
+def save_chunk(filename, covs):
+    """Store the bins of the CoverageSets <covs> (see coverage_bins) in the .npz file <filename>, so that another
+    process can add them to its BigWigWriters with BigWigWriter.add_chunk."""
+    arrays = {}
+    for k, cs in enumerate(covs):
+        bins = coverage_bins(cs)
+        arrays["chroms%d" % k] = np.array([c for c, start, values in bins], dtype=str)
+        arrays["starts%d" % k] = np.array([start for c, start, values in bins], dtype=np.int64)
+        arrays["sizes%d" % k] = np.array([len(values) for c, start, values in bins], dtype=np.int64)
+        arrays["values%d" % k] = np.concatenate([np.asarray(values, dtype=np.float64).ravel()
+                                                 for c, start, values in bins] + [np.zeros(0)])
+        arrays["stepsize%d" % k] = np.array(cs.stepsize)
+    np.savez(filename, **arrays)
+
+
+class BigWigWriter(object):
+    """*Keyword arguments:*
+
+        - filename -- Path of the bigWig file.
+        - chrom_sizes -- Path of a tab-separated chromosome size file, or list of (chromosome, size) pairs.
+        - chroms -- Chromosomes in the order their coverage is added (default None: the order of chrom_sizes). The
+                    other chromosomes of chrom_sizes follow them.
+
+    .. note:: A bigWig file takes the entries of its chromosomes in the order of its header, and the entries of one
+              chromosome sorted by position. Bins with zero coverage are not written and bins beyond the end of their
+              chromosome are clipped.
+    """
+
+    def __init__(self, filename, chrom_sizes, chroms=None):
+        if isinstance(chrom_sizes, basestring):
+            chrom_sizes = read_chrom_sizes(chrom_sizes)
+        self.sizes = dict(chrom_sizes)
+        header, self.order = [], {}
+        for c in list(chroms or []) + [c for c, size in chrom_sizes]:
+            if c in self.sizes and c not in self.order:
+                self.order[c] = len(header)
+                header.append(c)
+        self.filename = filename
+        self.bw = pyBigWig.open(filename, "w")
+        self.bw.addHeader([(c, self.sizes[c]) for c in header])
+
+    def add_bins(self, chrom, initial, values, stepsize):
+        """Add consecutive bins of width <stepsize> starting at <initial> with the given values.
+
+        *Keyword arguments:*
+
+            - chrom -- Chromosome of the bins.
+            - initial -- Start of the first bin.
+            - values -- Array of the values of the bins.
+            - stepsize -- Width of the bins.
+        """
+        if chrom not in self.sizes:
+            return
+        size = self.sizes[chrom]
+        values = np.asarray(values, dtype=np.float64)
+        starts = initial + np.arange(len(values), dtype=np.int64) * stepsize
+        keep = (values != 0) & (starts >= 0) & (starts < size)
+        starts, values = starts[keep], values[keep]
+        # The last bin may end behind the chromosome
+        clipped = len(starts) > 0 and starts[-1] + stepsize > size
+        if clipped:
+            last_start, last_value = int(starts[-1]), float(values[-1])
+            starts, values = starts[:-1], values[:-1]
+        if len(starts) > 0:
+            if not pyBigWig.numpy:
+                starts, values = starts.tolist(), values.tolist()
+            self.bw.addEntries(chrom, starts, values=values, span=stepsize)
+        if clipped:
+            self.bw.addEntries([chrom], [last_start], ends=[size], values=[last_value])
+
+    def add_coverage(self, cs):
+        """Add the coverage of the CoverageSet <cs>, one entry per bin of width cs.stepsize (see coverage_bins)."""
+        self._add_sorted(coverage_bins(cs), cs.stepsize)
+
+    def add_chunk(self, filename, k):
+        """Add the bins of the k-th CoverageSet stored in the chunk file <filename> (see save_chunk)."""
+        with np.load(filename) as chunk:
+            borders = np.concatenate(([0], np.cumsum(chunk["sizes%d" % k])))
+            values = chunk["values%d" % k]
+            bins = [(c, int(start), values[borders[j]:borders[j + 1]])
+                    for j, (c, start) in enumerate(zip(chunk["chroms%d" % k].tolist(), chunk["starts%d" % k]))]
+            self._add_sorted(bins, int(chunk["stepsize%d" % k]))
+
+    def _add_sorted(self, bins, stepsize):
+        """Add the (chromosome, start, values) triples <bins> in the order of the header."""
+        for chrom, start, values in sorted(bins, key=lambda b: (self.order.get(b[0], -1), b[1])):
+            self.add_bins(chrom, start, values, stepsize)
+
+    def close(self):
+        """Write the index of the bigWig file and close it."""
+        if self.bw is not None:
+            self.bw.close()
+            self.bw = None
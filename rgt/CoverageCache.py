@@ -0,0 +1,209 @@
+"""
+CoverageCache
+===================
+CoverageCache keeps the binned coverage computed by CoverageSet.coverage_from_bam on disk, so that the same BAM file,
+regions and binning parameters are not read again by later runs (e.g. of THOR or rgt-viz). The arrays are stored as
+.npy files, which are memory-mapped when loaded, and described by a JSON manifest.
+
+"""
+
+from __future__ import print_function
+import os
+import json
+import time
+import fcntl
+import hashlib
+from contextlib import contextmanager
+import numpy as np
+
+# Version of the cache entries; entries of other versions are not found
+CACHE_VERSION = 1
+# Default maximal size of the cache in bytes
+DEFAULT_MAX_SIZE = 10 * 2 ** 30
+# Name of the manifest in the cache directory
+MANIFEST = "manifest.json"
+# Name of the lock file of the manifest in the cache directory
+LOCK = "manifest.lock"
+
+# The CoverageCache of the process (see get_coverage_cache); False until it is set up
+_cache = False
+
+
+def default_cache_dir():
+    """Return the default directory of the coverage cache, coverage_cache in the RGT data directory."""
+    try:
+        from rgt.Util import ConfigurationFile
+        data_dir = ConfigurationFile().data_dir
+    except (IOError, OSError):
+        data_dir = os.path.join(os.path.expanduser("~"), "rgtdata")
+    return os.path.join(data_dir, "coverage_cache")
+
+
+def set_coverage_cache(directory, max_size=DEFAULT_MAX_SIZE):
+    """Set the coverage cache of the process.
+
+    *Keyword arguments:*
+
+        - directory -- Directory of the cache; None or the empty string disables caching.
+        - max_size -- Maximal size of the cache in bytes.
+    """
+    global _cache
+    _cache = CoverageCache(directory, max_size) if directory else None
+
+
+def get_coverage_cache():
+    """Return the CoverageCache of the process (the default cache, unless set_coverage_cache was called), or None
+    if caching is disabled."""
+    if _cache is False:
+        set_coverage_cache(default_cache_dir())
+    return _cache
+
+
+def _file_stamp(path):
+    """Return [path, size, modification time] of an existing file, or None."""
+    if not path or not os.path.exists(path):
+        return None
+    status = os.stat(path)
+    return [os.path.realpath(path), status.st_size, int(status.st_mtime)]
+
+
+class CoverageCache(object):
+    """*Keyword arguments:*
+
+        - directory -- Directory of the cache files.
+        - max_size -- Maximal size of the cache in bytes (default DEFAULT_MAX_SIZE).
+
+    .. note:: An entry is keyed by the path, size and modification time of the BAM file and its index, the regions and
+              all parameters of coverage_from_bam (extension size, bin size, step size, rmdup, mask file, ...), so a
+              changed input is never answered from the cache. When the cache grows beyond max_size, the least recently
+              used entries are removed. Failures to read or write the cache are silently skipped.
+
+    .. note:: Several processes (e.g. the workers of THOR or runs sharing the default cache) may use the same cache:
+              the manifest is only changed while holding an exclusive lock on the file manifest.lock.
+    """
+
+    def __init__(self, directory, max_size=DEFAULT_MAX_SIZE):
+        self.directory = directory
+        self.max_size = max_size
+
+    def key(self, cs, options):
+        """Return the key of the coverage of CoverageSet <cs> for the keyword arguments <options> of
+        coverage_from_bam."""
+        bam_file = options["bam_file"]
+        index = _file_stamp(bam_file + ".bai") or _file_stamp(os.path.splitext(bam_file)[0] + ".bai")
+        regions = hashlib.sha1()
+        for r in cs.genomicRegions:
+            regions.update("%s\t%d\t%d\t%s\n" % (r.chrom, r.initial, r.final, r.orientation))
+        description = {"version": CACHE_VERSION, "bam": _file_stamp(bam_file), "index": index,
+                       "mask": _file_stamp(options["mask_file"]), "regions": regions.hexdigest()}
+        for name in ["extension_size", "binsize", "stepsize", "rmdup", "paired_reads", "get_strand_info",
+                     "get_sense_info", "no_gaps"]:
+            description[name] = options[name]
+        return hashlib.sha1(json.dumps(description, sort_keys=True)).hexdigest()
+
+    def load(self, cs, options):
+        """Set the coverage of CoverageSet <cs> from the cache and return True, or return False if it is not
+        cached."""
+        key = self.key(cs, options)
+        manifest = self._read_manifest()
+        entry = manifest.get(key)
+        if entry is None:
+            return False
+        try:
+            # Copy-on-write mappings: the coverage may be changed in memory without touching the files
+            arrays = dict((name, np.load(self._path(key, name), mmap_mode="c").view(np.ndarray))
+                          for name in entry["arrays"])
+        except (IOError, OSError, ValueError):
+            return False
+        cs.binsize = options["binsize"]
+        cs.stepsize = options["stepsize"]
+        cs.reads = entry["reads"]
+        cs.mapped_reads = entry["mapped_reads"]
+        cs.set_buffers(arrays["offsets"], arrays["cov"], arrays.get("strand"), arrays.get("sense"))
+
+        try:
+            with self._lock():
+                manifest = self._read_manifest()
+                if key in manifest:
+                    manifest[key]["used"] = time.time()
+                    self._write_manifest(manifest)
+        except (IOError, OSError):
+            pass
+        return True
+
+    def store(self, cs, options):
+        """Store the coverage of CoverageSet <cs>, computed with the keyword arguments <options> of
+        coverage_from_bam."""
+        key = self.key(cs, options)
+        arrays = {"offsets": cs.get_offsets(), "cov": cs.overall_cov}
+        if options["get_strand_info"]:
+            arrays["strand"] = cs.overall_cov_strand
+        if options["get_sense_info"]:
+            arrays["sense"] = cs.overall_cov_sense
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            # The arrays are written under the lock as well, so that _evict never sees the files of an entry which
+            # is not yet in the manifest
+            with self._lock():
+                size = 0
+                for name, array in arrays.items():
+                    temporary = self._path(key, name) + "." + str(os.getpid()) + ".npy"
+                    np.save(temporary, np.ascontiguousarray(array))
+                    os.rename(temporary, self._path(key, name))
+                    size += os.path.getsize(self._path(key, name))
+
+                manifest = self._read_manifest()
+                manifest[key] = {"arrays": sorted(arrays), "size": size, "used": time.time(), "reads": cs.reads,
+                                 "mapped_reads": cs.mapped_reads}
+                self._evict(manifest)
+                self._write_manifest(manifest)
+        except (IOError, OSError):
+            return
+
+    def _evict(self, manifest):
+        """Remove the least recently used entries until the cache is not larger than max_size, and the .npy files
+        of no entry (e.g. left by interrupted processes). Called while holding the lock."""
+        total = sum(entry["size"] for entry in manifest.values())
+        for key in sorted(manifest, key=lambda k: manifest[k]["used"]):
+            if total <= self.max_size:
+                break
+            total -= manifest[key]["size"]
+            manifest.pop(key)
+        used = set(os.path.basename(self._path(key, name)) for key in manifest for name in manifest[key]["arrays"])
+        for filename in os.listdir(self.directory):
+            if filename.endswith(".npy") and filename not in used:
+                try:
+                    os.remove(os.path.join(self.directory, filename))
+                except OSError:
+                    pass
+
+    @contextmanager
+    def _lock(self):
+        """Hold an exclusive lock on the manifest of the cache."""
+        with open(os.path.join(self.directory, LOCK), "a") as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+    def _path(self, key, name):
+        return os.path.join(self.directory, key + "." + name + ".npy")
+
+    def _read_manifest(self):
+        try:
+            with open(os.path.join(self.directory, MANIFEST)) as f:
+                return json.load(f)
+        except (IOError, OSError, ValueError):
+            return {}
+
+    def _write_manifest(self, manifest):
+        filename = os.path.join(self.directory, MANIFEST)
+        temporary = filename + "." + str(os.getpid())
+        try:
+            with open(temporary, "w") as f:
+                json.dump(manifest, f)
+            os.rename(temporary, filename)
+        except (IOError, OSError):
+            if os.path.exists(temporary): os.remove(temporary)
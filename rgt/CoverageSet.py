@@ -8,8 +8,123 @@ CoverageSet represents the coverage data of a GenomicRegionSet.
 from __future__ import print_function
 import os
 import sys
+import ctypes
+import inspect
+import multiprocessing
 import pysam
 import numpy as np
+from collections import OrderedDict
+from rgt.BedReader import BedReader
+from rgt.CoverageCache import get_coverage_cache
+from rgt.GCTrack import get_gc_track
+
+# coverage_from_bam reads every chromosome once if the regions cover at least this fraction of their chromosomes
+SINGLE_PASS_FRACTION = 0.5
+
+# The CoverageSets computed by compute_coverages. They are set before the worker processes are forked, so that the
+# workers inherit them together with their shared result buffers.
+_pending = None
+
+
+def compute_coverages(jobs, cores=1):
+    """Run CoverageSet.coverage_from_bam for several CoverageSets at once.
+
+    *Keyword arguments:*
+
+    - jobs -- list of pairs (CoverageSet, dict of keyword arguments of coverage_from_bam)
+    - cores -- number of processes
+
+    .. note:: Coverage found in the coverage cache (see CoverageCache) is loaded from there instead.
+
+    .. note:: The work is split into one unit per BAM file and chromosome. With more than one core, the units are
+              distributed among a pool of forked processes, which write the coverage directly into result buffers
+              in shared memory; nothing but the unit numbers is sent between the processes.
+    """
+    global _pending
+    cache = get_coverage_cache()
+    sets, units = [], []
+    for cs, kwargs in jobs:
+        if len(cs.genomicRegions) == 0:
+            continue
+        if cache is not None and cache.load(cs, _bam_options(kwargs)):
+            continue
+        chromosomes = cs._prepare_bam(shared=cores > 1, **kwargs)
+        units += [(len(sets), k) for k in range(len(chromosomes))]
+        sets.append((cs, kwargs))
+
+    if cores > 1 and len(units) > 1:
+        _pending = [cs for cs, kwargs in sets]
+        pool = multiprocessing.Pool(processes=min(cores, len(units)))
+        try:
+            pool.map(_fill_unit, units, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _pending = None
+    else:
+        for j, k in units:
+            sets[j][0]._fill_chromosome(k)
+
+    for cs, kwargs in sets:
+        cs._finish_bam()
+        if cache is not None:
+            cache.store(cs, _bam_options(kwargs))
+
+
+def _bam_options(kwargs):
+    """Return the keyword arguments of coverage_from_bam in <kwargs> completed with their defaults."""
+    spec = inspect.getargspec(CoverageSet._prepare_bam)
+    options = dict(zip(spec.args[-len(spec.defaults):], spec.defaults))
+    options.update(kwargs)
+    del options["shared"]
+    return options
+
+
+def _fill_unit(unit):
+    """Fill the chromosome k of the j-th pending CoverageSet (in a worker process of compute_coverages)."""
+    j, k = unit
+    _pending[j]._fill_chromosome(k)
+
+
+# The jobs of compute_read_counts, set before the worker processes are forked
+_pending_counts = None
+
+
+def compute_read_counts(jobs, cores=1):
+    """Run CoverageSet.coverage_from_genomicset for several CoverageSets at once.
+
+    *Keyword arguments:*
+
+    - jobs -- list of pairs (CoverageSet, dict of keyword arguments of coverage_from_genomicset)
+    - cores -- number of processes
+
+    .. note:: With more than one core, the BAM files are distributed among a pool of forked processes, which return
+              one array of read counts each.
+    """
+    global _pending_counts
+    if cores > 1 and len(jobs) > 1:
+        _pending_counts = jobs
+        pool = multiprocessing.Pool(processes=min(cores, len(jobs)))
+        try:
+            counts = pool.map(_count_unit, range(len(jobs)), chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+            _pending_counts = None
+    else:
+        counts = [cs._count_reads(**kwargs) for cs, kwargs in jobs]
+
+    for (cs, kwargs), c in zip(jobs, counts):
+        cs._init_read_number(kwargs["bamFile"])
+        cs.coverage = c.tolist()
+        cs.offsets = None
+        cs.coverageOrig = cs.coverage
+
+
+def _count_unit(j):
+    """Count the reads of the j-th job of compute_read_counts (in a worker process)."""
+    cs, kwargs = _pending_counts[j]
+    return cs._count_reads(**kwargs)
 
 
 class CoverageSet:
@@ -24,6 +139,7 @@ class CoverageSet:
         self.name = name
         self.genomicRegions = GenomicRegionSet
         self.coverage = [] #coverage data for genomicRegions
+        self.offsets = None #bins of genomicRegions[i] are overall_cov[offsets[i]:offsets[i+1]]
         self.binsize = 100
         self.mapped_reads = None #number of mapped read
         self.reads = None #number of reads
@@ -49,7 +165,7 @@ class CoverageSet:
             try:
                 j = cs_chroms.index(c)
                 assert len(self.coverage[i]) == len(cs.coverage[j])
-                self.coverage[i] -= cs.coverage[j]
+                self.coverage[i] = self.coverage[i] - cs.coverage[j] #not in place, coverage are views of overall_cov
                 self.coverage[i] = self.coverage[i].clip(0, max(max(self.coverage[i]), 0)) #neg. values to 0
             except ValueError:
                 pass
@@ -72,7 +188,7 @@ class CoverageSet:
             try:
                 j = cs_chroms.index(c)
                 assert len(self.coverage[i]) == len(cs.coverage[j])
-                self.coverage[i] += cs.coverage[j]
+                self.coverage[i] = self.coverage[i] + cs.coverage[j]
             except ValueError:
                 pass
             i += 1
@@ -165,16 +281,19 @@ class CoverageSet:
         
         .. note:: The <save_wig> option may cause large output files 
         
+        .. note:: The bigWig file is written directly with pyBigWig (see BigWigWriter); the wig file is only written for <save_wig>.
+        
         """
+        from rgt.BigWigWriter import BigWigWriter
 
-        tmp_path = filename + '.wig'
-        self.write_wig(tmp_path)
-        t = ['wigToBigWig', "-clip", tmp_path, chrom_file, filename]
-        c = " ".join(t)
-        os.system(c)
+        if save_wig:
+            self.write_wig(filename + '.wig')
 
-        if not save_wig:
-            os.remove(tmp_path)
+        writer = BigWigWriter(filename, chrom_file, chroms=self.genomicRegions.get_chrom())
+        try:
+            writer.add_coverage(self)
+        finally:
+            writer.close()
     
     def _init_read_number(self, bamFile):
         """Compute number of reads and number of mapped reads for CoverageSet"""
@@ -198,7 +317,7 @@ class CoverageSet:
 
         """Compute coverage based on the class variable <genomicRegions>. 
         
-        Iterate over each GenomicRegion in class variable genomicRegions (GenomicRegionSet) and set coverage to the number of reads falling into the GenomicRegion.
+        Count the reads falling into each GenomicRegion in class variable genomicRegions (GenomicRegionSet).
               
         *Keyword arguments:*
         
@@ -211,33 +330,85 @@ class CoverageSet:
         Class variable <coverage>: a list where the elements correspond to the GenomicRegion. The list elements give
         the number of reads falling into the GenomicRegion.
         
+        .. note:: A read falls into a region if its alignment overlaps the region extended by readSize on both sides.
+                  Use compute_read_counts to count the reads of several BAM files in parallel.
         """
-        
-        bam = pysam.Samfile(bamFile, "rb" )
-        self._init_read_number(bamFile)
-        
-        cov=[0]*len(self.genomicRegions)
-        for i,region in enumerate(self.genomicRegions):
-            
-            try:
-                bin_start = max(0, region.initial-readSize)
-                bin_end = region.final+readSize
+        compute_read_counts([(self, {"bamFile": bamFile, "readSize": readSize, "strand_specific": strand_specific})])
 
-                if not strand_specific:
-                    for r in bam.fetch(region.chrom,bin_start,bin_end):
-                        cov[i] += 1
-                else:
-                    for r in bam.fetch(region.chrom,bin_start,bin_end):
-                        # print(region.orientation)
-                        # print(r.is_reverse)
-                        if region.orientation == "+" and not r.is_reverse: cov[i] += 1
-                        elif region.orientation == "-" and r.is_reverse: cov[i] += 1
-                
-            except:
-                print("\tSkip: "+region.toString())
+    def _count_reads(self, bamFile, readSize=200, strand_specific=False):
+        """Return the array of the read counts of the regions (see coverage_from_genomicset).
+
+        .. note:: The regions of a chromosome are sorted and their overlapping windows merged into blocks, so that
+                  every alignment of a block is read once. The reads overlapping a window are counted by binary search
+                  in the sorted starts and ends of the reads of its block.
+        """
+        bam = pysam.Samfile(bamFile, "rb")
+        counts = np.zeros(len(self.genomicRegions), dtype=np.int64)
+        try:
+            for chrom, indices, initials, finals, orientations in self._regions_by_chromosome(bam):
+                lo = np.maximum(0, initials - readSize)
+                hi = finals + readSize
+                for first, last, start, end in self._merge_windows(lo, hi):
+                    starts, ends, reverse = self._read_positions(bam.fetch(chrom, start, end))
+                    window = slice(first, last)
+                    if not strand_specific:
+                        counts[indices[window]] = self._count_overlaps(starts, ends, lo[window], hi[window])
+                        continue
+                    for orientation, selected in [("+", ~reverse), ("-", reverse)]:
+                        rows = np.flatnonzero(orientations[window] == orientation) + first
+                        counts[indices[rows]] = self._count_overlaps(starts[selected], ends[selected], lo[rows],
+                                                                     hi[rows])
+        finally:
+            bam.close()
+        return counts
 
-        self.coverage = cov 
-        self.coverageOrig = cov
+    def _regions_by_chromosome(self, bam):
+        """Yield the regions of the chromosomes of the BAM file, sorted by their start, as tuples (chromosome, indices
+        of the regions, initials, finals, orientations). Regions on other chromosomes are skipped."""
+        references = set(bam.references)
+        chroms = OrderedDict()
+        for i, region in enumerate(self.genomicRegions):
+            if region.chrom in references:
+                chroms.setdefault(region.chrom, []).append(i)
+            else:
+                print("\tSkip: " + region.toString())
+        regions = list(self.genomicRegions)
+        for chrom, indices in chroms.items():
+            initials = np.array([regions[i].initial for i in indices], dtype=np.int64)
+            order = np.argsort(initials, kind="mergesort")
+            indices = np.array(indices, dtype=np.int64)[order]
+            finals = np.array([regions[i].final for i in indices], dtype=np.int64)
+            orientations = np.array([regions[i].orientation for i in indices], dtype=object)
+            yield chrom, indices, initials[order], finals, orientations
+
+    def _merge_windows(self, lo, hi):
+        """Yield the blocks of overlapping windows [lo, hi), sorted by lo, as tuples (first window, last window + 1,
+        start, end). Blocks of empty windows only are skipped."""
+        if len(lo) == 0:
+            return
+        reach = np.maximum.accumulate(hi)
+        borders = np.concatenate(([0], np.flatnonzero(lo[1:] >= reach[:-1]) + 1, [len(lo)]))
+        for first, last in zip(borders[:-1], borders[1:]):
+            if reach[last - 1] > lo[first]:
+                yield first, last, int(lo[first]), int(reach[last - 1])
+
+    def _read_positions(self, reads):
+        """Return the reads of a pysam iterator as the arrays of their starts, ends (as used by fetch) and reverse
+        flags."""
+        starts, ends, reverse = [], [], []
+        for read in reads:
+            pos = read.pos
+            starts.append(pos)
+            ends.append(pos + 1 if read.is_unmapped else max(read.reference_end or 0, pos + 1))
+            reverse.append(read.is_reverse)
+        return np.array(starts, dtype=np.int64), np.array(ends, dtype=np.int64), np.array(reverse, dtype=bool)
+
+    def _count_overlaps(self, starts, ends, lo, hi):
+        """Return the numbers of reads overlapping the windows [lo, hi), as fetch finds them. Every read which ends
+        before a window (end <= lo) also starts before its end, so the count is the number of reads starting before
+        hi minus the number of reads ending before lo."""
+        counts = np.searchsorted(np.sort(starts), hi, "left") - np.searchsorted(np.sort(ends), lo, "right")
+        return np.where(hi > lo, counts, 0)
 
     def _get_bedinfo(self, l):
         if len(l) > 1:
@@ -250,7 +421,7 @@ class CoverageSet:
     
     def coverage_from_bam(self, bam_file, extension_size=200, binsize=100, stepsize=50, rmdup=False,
                           maxdup=None, mask_file=None, paired_reads=False,
-                          get_strand_info=False, get_sense_info=False, no_gaps=False):
+                          get_strand_info=False, get_sense_info=False, no_gaps=False, single_pass=None, cores=1):
         """Compute coverage based on GenomicRegionSet. 
         
         Iterate over each GenomicRegion in class variable genomicRegions (GenomicRegionSet). The GenomicRegion is divided into consecutive bins with lenth <binsize>.
@@ -266,12 +437,17 @@ class CoverageSet:
         - maxdup -- define the maximum count for the dupliacted reads (0: remove all;-1:no limit)
         - mask_file -- ignore region described in <mask_file> (tab-separated: chrom, start, end)
         - get_strand_info -- compute strand information for each bin
+        - get_sense_info -- compute the number of antisense and sense reads for each bin
+        - no_gaps -- ignore spliced reads
+        - single_pass -- read every chromosome of the BAM file once instead of fetching the reads of every region
+          (default None: single pass if the regions cover at least half of their chromosomes)
+        - cores -- number of processes; the chromosomes are distributed among them (see compute_coverages)
         
         
         *Output:*
         
         - Class variable <coverage>: a list of lists: the elements correspond a GenomicRegion. This list gives the coverage of each bin.
-        - Class variable <overall_cov>: a list: concatenation of class variable <coverage>.
+        - Class variable <overall_cov>: one int32 array: concatenation of class variable <coverage>. The elements of <coverage> are views of <overall_cov>; the bins of region i are overall_cov[offsets[i]:offsets[i+1]] (class variable <offsets>).
         - If option <get_strand_info> is set, a numpy array class variable  <cov_strand_all> of tuples. The tuples give the number of forward and backward reads for each bin.
         
         *Example:*
@@ -306,12 +482,18 @@ class CoverageSet:
         
         """
 
-        if len(self.genomicRegions) == 0:
-            return
-        log_aver = False
+        compute_coverages([(self, dict(bam_file=bam_file, extension_size=extension_size, binsize=binsize,
+                                       stepsize=stepsize, rmdup=rmdup, mask_file=mask_file, paired_reads=paired_reads,
+                                       get_strand_info=get_strand_info, get_sense_info=get_sense_info,
+                                       no_gaps=no_gaps, single_pass=single_pass))], cores)
+
+    def _prepare_bam(self, bam_file, extension_size=200, binsize=100, stepsize=50, rmdup=False, mask_file=None,
+                     paired_reads=False, get_strand_info=False, get_sense_info=False, no_gaps=False, single_pass=None,
+                     shared=False):
+        """Prepare coverage_from_bam: group the regions by chromosome and allocate the result buffers (in shared
+        memory, if shared is set), which are filled by _fill_chromosome and split up by _finish_bam."""
         self.binsize = binsize
         self.stepsize = stepsize
-        self.coverage = []
         
         bam = pysam.Samfile(bam_file, "rb" )
         
@@ -322,155 +504,247 @@ class CoverageSet:
         self._init_read_number(bam_file)
         
         #check whether one should mask
-        next_it = True
         if mask_file is not None and os.path.exists(mask_file):
-            mask = True
-            f = open(mask_file, 'r')
-            c_help, s_help, e_help = self.genomicRegions.sequences[0].chrom, -1, -1
+            mask = self._read_mask(mask_file)
         else:
-            mask = False
-        
-        chrom_regions = [r.chrom for r in self.genomicRegions.sequences] #chroms by regions
-        
-        if get_strand_info:
-            self.cov_strand_all = []
-        if get_sense_info:
-            self.cov_sense_all = []
-        
-        for region in self.genomicRegions:
-            cov = [0] * (len(region) / stepsize)
-            
-            if get_strand_info:
-                cov_strand = [[0,0]] * (len(region) / stepsize)
-                strand_info = {}
-            if get_sense_info:
-                cov_sense = [[0,0]] * (len(region) / stepsize)
-                sense_info = {}
-            
-            positions = []
-            j = 0
-            read_length = -1
+            mask = None
+
+        regions = list(self.genomicRegions)
+        if single_pass is None:
+            single_pass = self._covers_chromosomes(bam, regions, fragment_size)
+
+        # The regions of every chromosome, in the order of the BAM file
+        by_chrom = OrderedDict()
+        for i, region in enumerate(regions):
+            by_chrom.setdefault(region.chrom, []).append(i)
+        order = dict((c, k) for k, c in enumerate(bam.references))
+        chromosomes = [(c, by_chrom[c]) for c in sorted(by_chrom, key=lambda c: order.get(c, -1))]
+
+        # The bins of region i are offsets[i]:offsets[i+1] of the buffers
+        bins = np.array([len(region) / stepsize for region in regions], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(bins)))
+        buffers = [self._allocate((offsets[-1],), shared)]
+        buffers.append(self._allocate((offsets[-1], 2), shared) if get_strand_info else None)
+        buffers.append(self._allocate((offsets[-1], 2), shared) if get_sense_info else None)
+
+        self._job = (bam_file, regions, chromosomes, offsets, buffers, fragment_size, single_pass,
+                     (extension_size, binsize, stepsize, rmdup, mask, paired_reads, get_strand_info, get_sense_info,
+                      no_gaps))
+        return [c for c, rows in chromosomes]
+
+    def _allocate(self, shape, shared):
+        """Return a zero int32 array of the given shape, in memory shared with forked processes if shared is set."""
+        if not shared:
+            return np.zeros(shape, dtype=np.int32)
+        size = int(np.prod(shape))
+        raw = multiprocessing.RawArray(ctypes.c_int32, max(size, 1))
+        return np.frombuffer(raw, dtype=np.int32)[:size].reshape(shape)
+
+    def _fill_chromosome(self, k):
+        """Compute the coverage of the regions on the k-th chromosome prepared by _prepare_bam and write it into the
+        result buffers."""
+        bam_file, regions, chromosomes, offsets, buffers, fragment_size, single_pass, options = self._job
+        chrom, rows = chromosomes[k]
+        bam = pysam.Samfile(bam_file, "rb")
+        no_gaps = options[-1]
+
+        if single_pass:
+            # Read the chromosome once and cut the reads overlapping the window fetched for every region out of it
             try:
-                for read in bam.fetch(region.chrom, max(0, region.initial-fragment_size), region.final+fragment_size):
-                    if len(read.get_blocks()) > 1 and no_gaps: continue # ignore sliced reads
-                    j += 1
-                    read_length = read.rlen
-                    if not read.is_unmapped:
-                        # pos = read.pos - extension_size if read.is_reverse else read.pos
-                        # pos_help = read.pos - read.qlen if read.is_reverse else read.pos
-                        pos = read.pos - extension_size if read.is_reverse else read.pos
-                        pos_help = read.pos - read.qlen if read.is_reverse else read.pos
-
-                        within_gap = False
-                        if no_gaps:
-                            blocks = read.get_blocks()
-                            if len(blocks) > 1:
-                                # print(read.is_reverse)
-                                # print(read.pos)
-                                # print(blocks)
-                                for b_ind in range(len(blocks) - 1):
-                                    # print([blocks[b_ind][1], read.pos, blocks[b_ind+1][0]])
-                                    if blocks[b_ind][1] <= read.pos < blocks[b_ind+1][0]:
-                                        within_gap = True
-
-                        #if position in mask region, then ignore
-                        if mask:
-                            while next_it and c_help not in chrom_regions: #do not consider this deadzone
-                                c_help, s_help, e_help, next_it = self._get_bedinfo(f.readline())
-                            # deadzones behind, go further
-                            if c_help != -1 and chrom_regions.index(region.chrom) >= chrom_regions.index(c_help):
-                                while next_it and c_help != region.chrom: #get right chromosome
-                                    c_help, s_help, e_help, next_it = self._get_bedinfo(f.readline())
-                            while next_it and e_help <= pos_help and c_help == region.chrom: #check right position
-                                c_help, s_help, e_help, next_it = self._get_bedinfo(f.readline())
-                            if next_it and s_help <= pos_help and c_help == region.chrom:
-                                continue #pos in mask region
-                        if within_gap: continue
-                        else: positions.append(pos)
-
-                        if get_strand_info:
-                            if pos not in strand_info:
-                                strand_info[pos] = (1,0) if not read.is_reverse else (0,1)
-                        if get_sense_info:
-                            if pos not in sense_info:
-                                if paired_reads and not read.is_read1:
-                                    continue
-                                else:
-                                    if region.orientation == "+":
-                                        sense_info[pos] = (1,0) if read.is_reverse else (0,1)
-                                    elif region.orientation == "-":
-                                        sense_info[pos] = (1,0) if not read.is_reverse else (0,1)
+                reads = self._read_arrays(bam.fetch(chrom), no_gaps)
             except ValueError as e:
                 print("warning: {}".format(e))
-                pass
+                reads = None
+            if reads is not None:
+                # Longest alignment of the chromosome: reads starting further before a window do not reach into it
+                starts, ends = reads[0], reads[1]
+                span = (ends - starts).max() if len(starts) > 0 else 0
+            for i in rows:
+                if reads is None:
+                    results = self._region_coverage(regions[i], self._read_arrays([], no_gaps), options)
+                else:
+                    start = max(0, regions[i].initial-fragment_size)
+                    end = regions[i].final+fragment_size
+                    lo = np.searchsorted(starts, start - span, side="left")
+                    hi = np.searchsorted(starts, end, side="left")
+                    selected = lo + np.flatnonzero(ends[lo:hi] > start)
+                    results = self._region_coverage(regions[i], [a[selected] for a in reads], options)
+                self._store(buffers, offsets, i, results)
+        else:
+            for i in rows:
+                region = regions[i]
+                try:
+                    reads = self._read_arrays(bam.fetch(region.chrom, max(0, region.initial-fragment_size),
+                                                        region.final+fragment_size), no_gaps)
+                except ValueError as e:
+                    print("warning: {}".format(e))
+                    reads = self._read_arrays([], no_gaps)
+                self._store(buffers, offsets, i, self._region_coverage(region, reads, options))
+        bam.close()
 
-            # if maxdup == -1: # No limit
-            # elif maxdup == 0: # Remove all duplicates
-            # else: # 
+    def _store(self, buffers, offsets, i, results):
+        """Write the results of _region_coverage for region i into the result buffers."""
+        for buf, values in zip(buffers, results):
+            if buf is not None and len(values) > 0:
+                buf[offsets[i]:offsets[i+1]] = values
 
-            if rmdup:
-                positions = list(set(positions))
-                
-            positions.sort()
-            positions.reverse()
-            i = 0
-            while positions:
-                win_s = max(0, i * stepsize - binsize*0.5) + region.initial
-                win_e = i * stepsize + binsize*0.5 + region.initial 
-                c = 0
-                if get_strand_info:
-                    sum_strand_info = [0,0]
-                if get_sense_info:
-                    sum_sense_info = [0,0]
-                
-                taken = []
-                while True:
-                    s = positions.pop()
-                    
-                    taken.append(s)
-                    if s < win_e: #read within window
-                        c += 1
-                        if get_strand_info:
-                            sum_strand_info[0] += strand_info[s][0]
-                            sum_strand_info[1] += strand_info[s][1]
-                        if get_sense_info:
-                            try:
-                                sum_sense_info[0] += sense_info[s][0]
-                                sum_sense_info[1] += sense_info[s][1]
-                            except:
-                                pass
-                    if s >= win_e or not positions:
-                        taken.reverse()
-                        for s in taken:
-                            if s + extension_size + read_length >= win_s: #consider read in next iteration
-                                positions.append(s)
-                            else:
-                                break #as taken decreases monotonously
-                        taken = []
-                        break
-                if i < len(cov):
-                    cov[i] = c
-                    if get_strand_info:
-                        cov_strand[i] = sum_strand_info
-                    if get_sense_info:
-                        cov_sense[i] = sum_sense_info
-                i += 1
+    def _finish_bam(self):
+        """Expose the filled result buffers as coverage (one view per region), overall_cov, cov_strand_all and
+        cov_sense_all."""
+        bam_file, regions, chromosomes, offsets, buffers, fragment_size, single_pass, options = self._job
+        del self._job
+        self.set_buffers(offsets, *buffers)
 
-            if not log_aver:
-                self.coverage.append(np.array(cov))
-            else:
-                cov = [x + 1 for x in cov]
-                self.coverage.append(np.log(np.array(cov)))
-
-            if get_strand_info:
-                self.cov_strand_all.append(np.array(cov_strand))
-            if get_sense_info:
-                self.cov_sense_all.append(np.array(cov_sense))
-            # print(np.array(cov_sense))
-            
+    def set_buffers(self, offsets, cov, cov_strand=None, cov_sense=None):
+        """Set <overall_cov> (<overall_cov_strand>, <overall_cov_sense>) to the given buffers and the class variables
+        <coverage> (<cov_strand_all>, <cov_sense_all>) to their views, split by <offsets> (see get_offsets)."""
+        n = len(offsets) - 1
+        self.coverage = [cov[offsets[i]:offsets[i+1]] for i in range(n)]
+        if cov_strand is not None:
+            self.cov_strand_all = [cov_strand[offsets[i]:offsets[i+1]] for i in range(n)]
+            self.overall_cov_strand = cov_strand
+        if cov_sense is not None:
+            self.cov_sense_all = [cov_sense[offsets[i]:offsets[i+1]] for i in range(n)]
+            self.overall_cov_sense = cov_sense
         self.coverageorig = self.coverage[:]
-        self.overall_cov = reduce(lambda x,y: np.concatenate((x,y)), [self.coverage[i] for i in range(len(self.genomicRegions))])
-        if mask: f.close()
+        self.overall_cov = cov
+        self.offsets = offsets
+
+    def _covers_chromosomes(self, bam, regions, fragment_size):
+        """Return True, if the fetch windows of the regions cover at least SINGLE_PASS_FRACTION of the length of
+        their chromosomes in the BAM file."""
+        lengths = dict(zip(bam.references, bam.lengths))
+        total = sum(lengths.get(c, 0) for c in set(r.chrom for r in regions))
+        covered = sum(len(r) + 2 * fragment_size for r in regions)
+        return covered >= SINGLE_PASS_FRACTION * total
+
+    def _read_mask(self, mask_file):
+        """Return the merged intervals of the mask file as a dict: chrom -> (sorted initials, finals)."""
+        columns = BedReader(mask_file).read()
+        columns = columns.take(columns.sort_index()).merge()
+        chroms = columns.chrom_list()
+        mask = {}
+        for c in set(chroms):
+            rows = columns.chroms == columns.chrom_code(c)
+            mask[c] = (columns.initials[rows].astype(np.int64), columns.finals[rows].astype(np.int64))
+        return mask
+
+    def _read_arrays(self, reads, no_gaps):
+        """Return the reads of a pysam iterator as a list of arrays in the order of the iterator: start, end of the
+        alignment (as used by fetch), read length, reverse, unmapped, first of pair, aligned length and spliced
+        (only determined if no_gaps is set)."""
+        columns = [[] for _ in range(8)]
+        starts, ends, lengths, reverse, unmapped, read1, aligned, spliced = [c.append for c in columns]
+        for read in reads:
+            pos = read.pos
+            starts(pos)
+            ends(pos + 1 if read.is_unmapped else max(read.reference_end or 0, pos + 1))
+            lengths(read.rlen)
+            reverse(read.is_reverse)
+            unmapped(read.is_unmapped)
+            read1(read.is_read1)
+            aligned(read.qlen)
+            if no_gaps: spliced(len(read.get_blocks()) > 1)
+        if not no_gaps: columns[7] = [False] * len(columns[0])
+        types = [np.int64, np.int64, np.int64, bool, bool, bool, np.int64, bool]
+        return [np.array(c, dtype=t) for c, t in zip(columns, types)]
+
+    def _region_coverage(self, region, reads, options):
+        """Return the tuple (coverage, strand information, sense information) of the region from the arrays of the
+        reads fetched for it (see _read_arrays and coverage_from_bam)."""
+        extension_size, binsize, stepsize, rmdup, mask, paired_reads, get_strand_info, get_sense_info, no_gaps = \
+            options
+        starts, ends, lengths, reverse, unmapped, read1, aligned, spliced = reads
+        # Spliced reads are ignored completely if no_gaps is set
+        kept = ~spliced
+        read_length = lengths[kept][-1] if kept.any() else -1
+        used = kept & ~unmapped
+        if mask is not None and region.chrom in mask:
+            #if position in mask region, then ignore
+            mask_initials, mask_finals = mask[region.chrom]
+            pos_help = np.where(reverse, starts - aligned, starts)
+            inside = np.searchsorted(mask_initials, pos_help, side="right") - 1
+            used &= ~((inside >= 0) & (pos_help < mask_finals[np.maximum(inside, 0)]))
+
+        positions = np.where(reverse, starts - extension_size, starts)[used]
+        reverse = reverse[used]
+        sense_reads = read1[used] if paired_reads else np.ones(len(positions), dtype=bool)
+
+        # if maxdup == -1: # No limit
+        # elif maxdup == 0: # Remove all duplicates
+        # else: #
+
+        bins = len(region) / stepsize
+        # The strand and sense of a position are taken from its first read
+        unique_positions, first, inverse = np.unique(positions, return_index=True, return_inverse=True)
+        if rmdup:
+            positions = unique_positions
+            first_read = first
+        else:
+            order = np.argsort(positions, kind="mergesort")
+            positions = positions[order]
+            first_read = first[inverse[order]]
+        lo, hi = self._window_bounds(positions, region.initial, bins, binsize, stepsize,
+                                     extension_size + read_length)
+
+        if bins == 0:
+            cov = np.array([])
+        else:
+            cov = hi - lo
+
+        cov_strand = cov_sense = None
+        if get_strand_info:
+            forward = ~reverse[first_read]
+            cov_strand = self._window_sums(lo, hi, forward, ~forward)
+        if get_sense_info:
+            # The pair of a position is (1,0) if its first eligible read is antisense to the region and (0,1)
+            # if it is sense; positions without such a read (or in regions without orientation) count neither
+            antisense = np.zeros(len(unique_positions), dtype=bool)
+            sense = np.zeros(len(unique_positions), dtype=bool)
+            if region.orientation in ("+", "-"):
+                eligible = np.flatnonzero(sense_reads)
+                seen, first_eligible = np.unique(inverse[eligible], return_index=True)
+                opposite = reverse[eligible[first_eligible]]
+                if region.orientation == "-": opposite = ~opposite
+                antisense[seen] = opposite
+                sense[seen] = ~opposite
+            cov_sense = self._window_sums(lo, hi, antisense[inverse[first_read]], sense[inverse[first_read]])
+        return cov, cov_strand, cov_sense
+
+    def _window_bounds(self, positions, initial, bins, binsize, stepsize, reach):
+        """Return the arrays (lo, hi) such that positions[lo[i]:hi[i]] are the read positions counted in the i-th
+        window of coverage_from_bam.
+
+        *Keyword arguments:*
+
+        - positions -- sorted array of read positions
+        - initial -- start of the region
+        - bins -- number of windows
+        - binsize -- size of the windows
+        - stepsize -- distance between the starts of neighbouring windows
+        - reach -- a read at position s counts for the windows starting before or at s + reach
+
+        .. note:: Window i counts the reads at positions before its end which reach the start of window i-1 (window 0
+                  counts all reads before its end). The bounds are computed in the same floating point arithmetic
+                  as the window borders, so the counts are exact.
+        """
+        steps = np.arange(bins) * stepsize
+        window_ends = steps + binsize*0.5 + initial
+        previous_starts = np.maximum(0, steps - stepsize - binsize*0.5) + initial
+        hi = np.searchsorted(positions, window_ends, side="left")
+        lo = np.searchsorted(positions + reach, previous_starts, side="left")
+        if bins > 0: lo[0] = 0
+        return lo, hi
+
+    def _window_sums(self, lo, hi, first, second):
+        """Return the array of pairs (sum of first, sum of second) of the positions in every window (see
+        _window_bounds); first and second are boolean arrays over the sorted positions."""
+        if len(lo) == 0:
+            return np.array([])
+        sums = np.zeros((len(first) + 1, 2), dtype=np.int64)
+        sums[1:, 0] = np.cumsum(first)
+        sums[1:, 1] = np.cumsum(second)
+        return sums[hi] - sums[lo]
 
 
     def array_transpose(self, flip=False):
@@ -531,27 +805,21 @@ class CoverageSet:
             >>>        print(chrom, s, e)
         
         """
-        r = regions
-        iter = r.__iter__()
-        r = iter.next()
-        sum = r.final
-        last = 0
-        i = 0
-        while sum <= index * self.stepsize:
-            last += len(self.coverage[i])
-            try:
-                r = iter.next()
-            except StopIteration:
-                sum += r.final
-                i += 1
-                break
-            sum += r.final
-            i += 1
+        offsets = self.get_offsets()
+        i = np.searchsorted(offsets, index, side="right") - 1
+        r = regions.sequences[i]
+        start = r.initial + (index - offsets[i]) * self.stepsize
         
-        return r.chrom, (index-last) * self.stepsize, \
-            min((index-last) * self.stepsize + self.stepsize, r.final)
+        return r.chrom, start, min(start + self.stepsize, r.final)
     
-    def coverage_from_bigwig(self, bigwig_file, stepsize=100):
+    def get_offsets(self):
+        """Return the array of the offsets of the regions in <overall_cov>: the bins of the i-th region are
+        overall_cov[offsets[i]:offsets[i+1]]."""
+        if self.offsets is None or len(self.offsets) != len(self.coverage) + 1:
+            self.offsets = np.concatenate(([0], np.cumsum([len(c) for c in self.coverage]))).astype(np.int64)
+        return self.offsets
+    
+    def coverage_from_bigwig(self, bigwig_file, stepsize=100, cores=1):
 
         """Return list of arrays describing the coverage of each genomicRegions from <bigwig_file>.
         
@@ -559,16 +827,18 @@ class CoverageSet:
         
         - bigwig_file -- path to bigwig file
         - stepsize -- used stepsize
+        - cores -- number of threads reading the chromosomes (pyBigWig only)
         
         *Output:*
         
         Class variable <coverage>: a list where the elements correspond to the GenomicRegion. The list elements give
-        the number of reads falling into the GenomicRegion.
+        the number of reads falling into the GenomicRegion. With pyBigWig, they are views of one array (<overall_cov>).
         
         """
         try:
             from ngslib import BigWigFile
             self.coverage = []
+            self.offsets = None
             bwf = BigWigFile(bigwig_file)
 
             for gr in self.genomicRegions:
@@ -579,16 +849,79 @@ class CoverageSet:
             bwf.close()
 
         except ImportError, e:
-            import pyBigWig
-            self.coverage = []
+            self._bigwig_means(bigwig_file, stepsize, cores)
+
+    def _bigwig_means(self, bigwig_file, stepsize, cores=1):
+        """Set the coverage to the means of the values of <bigwig_file> in int(len(region)/stepsize) bins of equal
+        width per region (0 for bins without values), like pyBigWig's stats(exact=True).
+
+        .. note:: The intervals of every chromosome are read once and the means of all its bins are computed from
+                  cumulative sums over the intervals. With cores > 1, the chromosomes are distributed among a pool of
+                  threads, each with its own handle of the file.
+        """
+        import pyBigWig
+        regions = list(self.genomicRegions)
+        bins = np.array([int(len(r) / stepsize) for r in regions], dtype=np.int64)
+        offsets = np.concatenate(([0], np.cumsum(bins)))
+        means = np.zeros(offsets[-1])
+        by_chrom = OrderedDict()
+        for i, region in enumerate(regions):
+            by_chrom.setdefault(region.chrom, []).append(i)
+
+        def fill(item):
+            chrom, rows = item
+            rows = [i for i in rows if bins[i] > 0]
+            if not rows:
+                return
+            # The borders of all bins of the chromosome, as in pyBigWig: start + i*(end-start)/nBins, rounded down
+            n = bins[rows]
+            initials = np.array([regions[i].initial for i in rows], dtype=np.int64)
+            lengths = np.array([len(regions[i]) for i in rows], dtype=np.int64)
+            region_of_bin = np.repeat(np.arange(len(rows)), n)
+            step = np.arange(n.sum()) - np.repeat(np.cumsum(n) - n, n)
+            length, count = lengths[region_of_bin], n[region_of_bin]
+            starts = initials[region_of_bin] + step * length // count
+            ends = initials[region_of_bin] + (step + 1) * length // count
+
             bwf = pyBigWig.open(bigwig_file)
+            try:
+                size = bwf.chroms(chrom) or 0
+                lo, hi = int(starts.min()), min(int(ends.max()), size)
+                intervals = bwf.intervals(chrom, lo, hi) if lo < hi else None
+            finally:
+                bwf.close()
+            if not intervals:
+                return
+            intervals = np.array(intervals, dtype=np.float64)
+            i_starts, i_ends, values = intervals[:, 0].astype(np.int64), intervals[:, 1].astype(np.int64), intervals[:, 2]
+            # Cumulative weighted values and covered lengths before every interval
+            weights = np.concatenate(([0], np.cumsum(values * (i_ends - i_starts))))
+            covered = np.concatenate(([0], np.cumsum(i_ends - i_starts)))
 
-            for gr in self.genomicRegions:
-                steps = int(len(gr) / stepsize)
-                ds = bwf.stats(gr.chrom, gr.initial, gr.final, type="mean", nBins=steps)
-                ds = [ x if x else 0 for x in ds ]
-                self.coverage.append( np.array(ds) )
-            bwf.close()
+            def cumulative(x):
+                """Return the sums of the values and of the covered positions before every position in x."""
+                k = np.searchsorted(i_ends, x, side="right")
+                inside = np.minimum(k, len(i_starts) - 1)
+                partial = np.where(k < len(i_starts), np.maximum(0, x - i_starts[inside]), 0)
+                return weights[k] + values[inside] * partial, covered[k] + partial
+
+            w_end, c_end = cumulative(ends)
+            w_start, c_start = cumulative(starts)
+            total, positions = w_end - w_start, c_end - c_start
+            means[offsets[rows][region_of_bin] + step] = np.where(positions > 0, total / np.maximum(positions, 1), 0)
+
+        if cores > 1 and len(by_chrom) > 1:
+            from multiprocessing.pool import ThreadPool
+            pool = ThreadPool(min(cores, len(by_chrom)))
+            try:
+                pool.map(fill, by_chrom.items())
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            for item in by_chrom.items():
+                fill(item)
+        self.set_buffers(offsets, means)
 
     def phastCons46way_score(self, stepsize=100):
         """Load the phastCons46way bigwig files to fetch the scores as coverage.
@@ -598,6 +931,7 @@ class CoverageSet:
         - stepsize -- used stepsize
         """
         self.coverage = []
+        self.offsets = None
         phastCons46way_dir = "/data/phastCons46way/"
         grs = self.genomicRegions.split_by_chromosome()
         for gr in grs:
@@ -617,19 +951,21 @@ class CoverageSet:
         
         number of unique reads
         
+        .. note:: The reads are identified by the hash values of their names. The overlapping regions of a
+                  chromosome are merged and every alignment of the merged regions is read once; only the unique hash
+                  values of each chromosome are kept.
         """
-        
-        bam = pysam.Samfile(bamFile, "rb" )
-
-        reads = []
-        for i,region in enumerate(self.genomicRegions):
-            for r in bam.fetch(region.chrom,region.initial,region.final):
-                reads.append(r.qname)
-
-        reads = list(set(reads))
-        return len(reads)
-
-
+        bam = pysam.Samfile(bamFile, "rb")
+        names = []
+        try:
+            for chrom, indices, initials, finals, orientations in self._regions_by_chromosome(bam):
+                hashes = [np.fromiter((hash(read.qname) for read in bam.fetch(chrom, start, end)), dtype=np.int64)
+                          for first, last, start, end in self._merge_windows(initials, finals)]
+                if hashes:
+                    names.append(np.unique(np.concatenate(hashes)))
+        finally:
+            bam.close()
+        return len(np.unique(np.concatenate(names))) if names else 0
 
     def norm_gc_content(self, cov, genome_path, chrom_sizes):
         chrom_sizes_dict = {}
@@ -641,7 +977,8 @@ class CoverageSet:
                 c, e = line[0], int(line[1])
                 chrom_sizes_dict[c] = e
 
-        gc_cov, gc_avg, _ = get_gc_context(self.stepsize, self.binsize, genome_path, cov, chrom_sizes_dict)
+        gc_cov, gc_avg, _ = get_gc_context(self.stepsize, self.binsize, genome_path, cov, chrom_sizes_dict,
+                                           regions=self.genomicRegions)
 
         import warnings  # todo: ugly, why do warnings occur?
         warnings.filterwarnings("ignore")
@@ -652,68 +989,44 @@ class CoverageSet:
             gc_cov[i] = np.array(gc_cov[i])
             gc_cov[i][gc_cov[i] < 10 * -300] = gc_avg  # sometimes zeros occur, do not consider
             self.coverage[i] = self.coverage[i] * gc_avg / gc_cov[i]
-            self.coverage[i] = self.coverage[i].clip(0, max(max(self.coverage[i]), 0))  # neg. values to 0
+            self.coverage[i] = self.coverage[i].clip(0, None)  # neg. values to 0
             self.coverage[i] = self.coverage[i].astype(int)
 
-def get_gc_context(stepsize, binsize, genome_path, cov_list, chrom_sizes_dict):
-    """Get GC content"""
-    class help_content():
-        def __init__(self):
-            self.content = [[] for _ in range(101)]
-            self.g_gc = []
-            self.g = -1
-
-        def add(self, d, c):
-            self.content[int(c * 100)].append(round(float(d), 2))
-
-        def _compute(self):
-            for l in self.content:
-                r = sum(l) / float(len(l)) if len(l) > 0 else 0
-                self.g_gc.append(r)
-
-            self.g = sum(self.g_gc) / float(len(self.g_gc))
-
-        def _map(self, x):
-            return self.g_gc[x]
-
-    # chromosomes = []
-    # get first chromosome, typically chr1
-    # for s in FastaReader(genome_path):
-    #    chromosomes.append(s.name)
-    tmp = chrom_sizes_dict.keys()
-    # tmp = map(lambda x: x.replace('chr',''), chromosomes)
-    tmp.sort()
-    genome_fasta = pysam.Fastafile(genome_path)
-    genome = genome_fasta.fetch(reference=tmp[0])
-
-    content = help_content()
-    gc_content_cov = []
-
-    for cov in cov_list:
-        cur_gc_value = []
-
-        for i in range(len(cov)):
-            s = i * stepsize
-            e = i * stepsize + binsize
-            seq = genome[s: e + 1]
-            seq = seq.upper()
-            count = seq.count("C") + seq.count("G")
-            if len(seq) > 0:
-                gc_content = float(count) / len(seq)
-                # print(float(count), len(seq), float(count) / len(seq), cov[i], file=sys.stderr)
-                content.add(cov[i], gc_content)
-                cur_gc_value.append(int(gc_content * 100))
-            else:
-                #                print("Bins exceed genome (%s - %s), add pseudo counts" %(s, e), file=sys.stderr)
-                #                     content.add(cov[i], 0.5)
-                cur_gc_value.append(0)
+def get_gc_context(stepsize, binsize, genome_path, cov_list, chrom_sizes_dict, regions=None):
+    """Get GC content
+
+    *Keyword arguments:*
+
+    - stepsize -- stepsize of the coverage
+    - binsize -- binsize of the coverage
+    - genome_path -- indexed FASTA file of the genome
+    - cov_list -- list of the coverage arrays of the regions
+    - chrom_sizes_dict -- dict of the chromosome sizes
+    - regions -- GenomicRegionSet of the coverage arrays (default None: all of them lie at the start of the first chromosome)
+
+    *Output:*
+
+    Triple of the list of arrays of the mean coverage of the bins with the GC content of every bin, the average of these
+    means over all GC contents and the list of the means per GC content (in percent).
+
+    .. note:: The GC content of the bins is looked up in the GCTrack of the genome, which is computed once and stored on disk.
+    """
+    track = get_gc_track(genome_path, binsize, stepsize)
+    if regions is None:
+        first = sorted(chrom_sizes_dict.keys())[0]
+        places = [(first, 0)] * len(cov_list)
+    else:
+        places = [(r.chrom, r.initial) for r in regions]
 
-        gc_content_cov.append(cur_gc_value)
+    percentages = [track.lookup(chrom, initial, len(cov)) for (chrom, initial), cov in zip(places, cov_list)]
+    all_percentages = np.concatenate([np.zeros(0, dtype=np.int8)] + percentages)
+    all_cov = np.concatenate([np.zeros(0)] + [np.round(np.asarray(cov, dtype=float), 2) for cov in cov_list])
 
-    content._compute()
-    r = []
-    for l in gc_content_cov:
-        tmp = map(content._map, l)
-        r.append(tmp)
+    # Mean coverage of the bins of every GC content; bins behind the chromosome end are not counted
+    inside = all_percentages >= 0
+    sums = np.bincount(all_percentages[inside], weights=all_cov[inside], minlength=101)
+    counts = np.bincount(all_percentages[inside], minlength=101)
+    g_gc = np.where(counts > 0, sums / np.maximum(counts, 1), 0)
 
-    return r, content.g, content.g_gc
\ No newline at end of file
+    r = [g_gc[np.maximum(p, 0)] for p in percentages]
+    return r, sum(g_gc) / float(len(g_gc)), list(g_gc)
@@ -0,0 +1,134 @@
+"""
+GCTrack
+===================
+GCTrack holds the GC content of the bins of a genome (see CoverageSet.get_gc_context) for one bin size and step size.
+The GC content of a chromosome is computed once from the FASTA file with NumPy and stored as a binary file next to
+the genome, so that later processes do not read the sequence again.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os
+import numpy as np
+import pysam
+
+# Version of the binary file format; files of other versions are rebuilt
+FILE_VERSION = 1
+
+# GCTracks of the process by (genome path, bin size, step size)
+_gc_tracks = {}
+
+# Lookup table of the bases counted as GC
+_GC_BASES = np.zeros(256, dtype=bool)
+_GC_BASES[[ord(b) for b in "CGcg"]] = True
+
+
+def get_gc_track(genome_path, binsize, stepsize):
+    """Return the GCTrack of the process for the given genome, bin size and step size."""
+    key = (genome_path, binsize, stepsize)
+    if key not in _gc_tracks:
+        _gc_tracks[key] = GCTrack(genome_path, binsize, stepsize)
+    return _gc_tracks[key]
+
+
+def gc_percentages(sequence, binsize, stepsize):
+    """Return the int8 array of the GC content in percent (rounded down) of the bins of a sequence. Bin i covers the
+    sequence from i*stepsize to i*stepsize+binsize (inclusive), cut at the end of the sequence."""
+    size = len(sequence)
+    if size == 0:
+        return np.zeros(0, dtype=np.int8)
+    gc = _GC_BASES[np.frombuffer(sequence, dtype=np.uint8)]
+    starts = np.arange(0, size, stepsize, dtype=np.int64)
+    ends = np.minimum(starts + binsize + 1, size)
+    # Number of GC bases before every bin border, from the sums between consecutive borders
+    borders = np.unique(np.concatenate((starts, ends)))
+    inner = borders[borders < size]
+    before = np.concatenate(([0], np.cumsum(np.add.reduceat(gc, inner, dtype=np.int64))))
+    positions = np.concatenate((inner, [size]))
+    counts = before[np.searchsorted(positions, ends)] - before[np.searchsorted(positions, starts)]
+    return (counts / (ends - starts) * 100).astype(np.int8)
+
+
+class GCTrack(object):
+    """*Keyword arguments:*
+
+        - genome_path -- FASTA file of the genome (indexed, as for pysam.Fastafile).
+        - binsize -- Size of the bins.
+        - stepsize -- Distance of consecutive bins.
+        - store -- Read and write the binary files of the track (default True).
+
+    .. note:: The binary files are written into the directory <genome_path>.gc, one per chromosome. They record the
+              size and modification time of the FASTA file and are rebuilt when they change. Files which can not be
+              written are silently skipped.
+    """
+
+    def __init__(self, genome_path, binsize, stepsize, store=True):
+        self.genome_path = genome_path
+        self.binsize = binsize
+        self.stepsize = stepsize
+        self.store = store
+        self.directory = genome_path + ".gc"
+        self._percentages = {}
+
+    def percentages(self, chrom):
+        """Return the int8 array of the GC content in percent of the bins of chromosome <chrom> (see
+        gc_percentages)."""
+        if chrom not in self._percentages:
+            values = self.load(chrom) if self.store else None
+            if values is None:
+                values = self.build(chrom)
+                if self.store: self.save(chrom, values)
+            self._percentages[chrom] = values
+        return self._percentages[chrom]
+
+    def lookup(self, chrom, initial, bins):
+        """Return the GC content in percent of <bins> consecutive bins from position <initial> of chromosome
+        <chrom>, or -1 for bins behind its end. A region start which is no multiple of the step size is rounded
+        down to one."""
+        values = self.percentages(chrom)
+        indices = initial // self.stepsize + np.arange(bins)
+        result = np.full(bins, -1, dtype=np.int8)
+        inside = indices < len(values)
+        result[inside] = values[indices[inside]]
+        return result
+
+    def build(self, chrom):
+        """Compute the GC content of the bins of chromosome <chrom> from the FASTA file."""
+        genome = pysam.Fastafile(self.genome_path)
+        try:
+            sequence = genome.fetch(reference=chrom)
+        finally:
+            genome.close()
+        return gc_percentages(sequence, self.binsize, self.stepsize)
+
+    def stamp(self):
+        """Return the version, size and modification time of the FASTA file."""
+        status = os.stat(self.genome_path)
+        return np.array([FILE_VERSION, status.st_size, int(status.st_mtime)], dtype=np.int64)
+
+    def filename(self, chrom):
+        return os.path.join(self.directory, "%s_%d_%d.npz" % (chrom, self.binsize, self.stepsize))
+
+    def load(self, chrom):
+        """Return the GC content of chromosome <chrom> stored in its binary file, or None if it is missing or out of
+        date."""
+        try:
+            with np.load(self.filename(chrom)) as stored:
+                if not np.array_equal(stored["stamp"], self.stamp()):
+                    return None
+                return stored["percentages"]
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def save(self, chrom, values):
+        """Store the GC content of chromosome <chrom> in its binary file."""
+        filename = self.filename(chrom)
+        temporary = filename + "." + str(os.getpid()) + ".npz"
+        try:
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            np.savez(temporary, stamp=self.stamp(), percentages=values)
+            os.rename(temporary, filename)
+        except (IOError, OSError):
+            if os.path.exists(temporary): os.remove(temporary)
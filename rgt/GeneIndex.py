@@ -0,0 +1,127 @@
+"""
+GeneIndex
+===================
+GeneIndex keeps the gene regions of an organism extended by their promoters, sorted and indexed for
+GenomicRegionSet.gene_association. One GeneIndex per organism and promoter length is kept by the process (see
+get_gene_index) and stored as a binary file next to the genomic data, so that later processes do not parse the gene
+regions again.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import os
+import numpy as np
+# Internal
+from rgt.GenomicRegionColumns import GenomicRegionColumns
+from rgt.IntervalIndex import IntervalIndex
+from rgt.BedReader import BedReader
+from rgt.Util import GenomeData
+
+# Version of the binary file format; files of other versions are rebuilt
+FILE_VERSION = 1
+# Number of gene subsets (see GeneIndex.select) kept per GeneIndex
+MAX_SUBSETS = 16
+
+# GeneIndexes of the process by (organism, promoter length)
+_gene_indexes = {}
+
+
+def get_gene_index(organism, promoter_length=1000):
+    """Return the GeneIndex of the process for the given organism and promoter length, building it on first use."""
+    key = (organism, promoter_length)
+    if key not in _gene_indexes:
+        _gene_indexes[key] = GeneIndex(organism, promoter_length)
+    return _gene_indexes[key]
+
+
+class GeneIndex(object):
+    """*Keyword arguments:*
+
+        - organism -- Organism whose gene regions (GenomeData.get_gene_regions) are indexed.
+        - promoter_length -- Length of the promoter added upstream of every gene.
+        - store -- Read and write the binary file of the index (default True).
+
+    .. note:: The binary file is written into the directory of the organism under the data directory (e.g.
+              ~/rgtdata/hg19/). It records the size and modification time of the gene regions file and is rebuilt
+              when they change. A file which can not be written is silently skipped.
+    """
+
+    def __init__(self, organism, promoter_length=1000, store=True):
+        genome = GenomeData(organism)
+        self.organism = organism
+        self.promoter_length = promoter_length
+        self.source = genome.get_gene_regions()
+        self.filename = os.path.join(genome.data_dir, organism, "gene_index_" + str(promoter_length) + ".npz")
+
+        columns = self.load() if store else None
+        if columns is None:
+            columns = self.build()
+            if store: self.save(columns)
+        self.index = IntervalIndex(columns, columns)
+        names = columns.names if columns.names is not None else np.array([None] * len(columns), dtype=object)
+        self.keys = np.array([n.upper() if n else n for n in names], dtype=object)
+        self._subsets = {}
+
+    def build(self):
+        """Return the sorted and promoter-extended gene regions as GenomicRegionColumns read from the BED file."""
+        columns = BedReader(self.source).read()
+        forward = columns.strands == columns.strand_code("+")
+        columns.extend(np.where(forward, self.promoter_length, 0), np.where(forward, 0, self.promoter_length))
+        if not columns.is_sorted():
+            columns = columns.take(columns.sort_index())
+        return columns
+
+    def stamp(self):
+        """Return the version, size and modification time of the gene regions file."""
+        status = os.stat(self.source)
+        return np.array([FILE_VERSION, status.st_size, int(status.st_mtime)], dtype=np.int64)
+
+    def load(self):
+        """Return the GenomicRegionColumns stored in the binary file, or None if it is missing or out of date."""
+        try:
+            with np.load(self.filename) as stored:
+                if not np.array_equal(stored["stamp"], self.stamp()):
+                    return None
+                # None is stored as the empty string
+                labels = [o or None for o in stored["orientation_labels"].tolist()]
+                names = stored["names"].astype(object)
+                names[names == ""] = None
+                return GenomicRegionColumns(chrom_names=stored["chrom_names"].tolist(), chroms=stored["chroms"],
+                                            initials=stored["initials"], finals=stored["finals"],
+                                            strands=stored["strands"], orientation_labels=labels, names=names)
+        except (IOError, OSError, KeyError, ValueError):
+            return None
+
+    def save(self, columns):
+        """Store the given GenomicRegionColumns in the binary file."""
+        names = columns.names if columns.names is not None else [""] * len(columns)
+        temporary = self.filename + "." + str(os.getpid()) + ".npz"
+        try:
+            if not os.path.isdir(os.path.dirname(self.filename)):
+                os.makedirs(os.path.dirname(self.filename))
+            np.savez(temporary, stamp=self.stamp(), chrom_names=np.array(columns.chrom_names, dtype=str),
+                     chroms=columns.chroms, initials=columns.initials, finals=columns.finals,
+                     strands=columns.strands,
+                     orientation_labels=np.array([o or "" for o in columns.orientation_labels], dtype=str),
+                     names=np.array([n or "" for n in names], dtype=str))
+            os.rename(temporary, self.filename)
+        except (IOError, OSError):
+            if os.path.exists(temporary): os.remove(temporary)
+
+    def select(self, gene_set=None):
+        """Return the IntervalIndex of the genes in the given GeneSet (compared case-insensitively), or of all genes.
+
+        *Keyword arguments:*
+
+            - gene_set -- A GeneSet, or None for all genes.
+        """
+        if not gene_set:
+            return self.index
+        names = frozenset(g.upper() for g in gene_set.genes)
+        if names not in self._subsets:
+            if len(self._subsets) >= MAX_SUBSETS: self._subsets.clear()
+            mask = np.fromiter((k in names for k in self.keys), dtype=bool, count=len(self.keys))
+            columns = self.index.regions.take(mask)
+            self._subsets[names] = IntervalIndex(columns, columns)
+        return self._subsets[names]
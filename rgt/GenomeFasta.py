@@ -0,0 +1,100 @@
+"""
+GenomeFasta
+===================
+GenomeFasta gives random access to the sequence of a genome stored as FASTA, either in one indexed file or in a
+directory with one file per chromosome. Sequences are read from the file through its faidx index (see
+pysam.Fastafile), so that extracting regions does not load whole chromosomes.
+
+"""
+
+from __future__ import print_function
+import os
+from itertools import groupby
+import pysam
+
+
+class GenomeFasta(object):
+    """*Keyword arguments:*
+
+        - path -- FASTA file of the genome, or directory which contains one FASTA file <chrom>.fa per chromosome.
+
+    .. note:: A missing index (.fai) is built next to its FASTA file when the file is opened. If it can not be
+              written, the sequence of the chromosome is read once and kept in memory instead.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._files = {}
+        self._sequences = {}
+        if os.path.isdir(path):
+            self.directory = path
+            self._chroms = set(name[:-3] for name in os.listdir(path) if name.endswith(".fa"))
+        else:
+            self.directory = None
+            self._files[None] = pysam.Fastafile(path)
+            self._chroms = set(self._files[None].references)
+
+    def __contains__(self, chrom):
+        return chrom in self._chroms
+
+    def chromosomes(self):
+        """Return the sorted list of the chromosomes of the genome."""
+        return sorted(self._chroms)
+
+    def fetch(self, chrom, start, end):
+        """Return the sequence of chromosome <chrom> from <start> to <end> (0-based, end exclusive) as a string. The
+        region is cut at the ends of the chromosome."""
+        start = max(0, start)
+        if end <= start:
+            return ""
+        f = self._file(chrom)
+        if f is None:
+            return self._sequences[chrom][start:end]
+        # The file of a chromosome is read from its first record, whatever its name
+        return f.fetch(chrom if self.directory is None else f.references[0], start, end)
+
+    def fetch_many(self, regions):
+        """Return the list of the sequences of the given GenomicRegions (in their order), or None for the regions on
+        chromosomes which are not in the genome.
+
+        .. note:: The regions are read sorted by chromosome and position, so that every file is read sequentially.
+        """
+        regions = list(regions)
+        sequences = [None] * len(regions)
+        order = sorted(range(len(regions)), key=lambda i: (regions[i].chrom, regions[i].initial))
+        for chrom, indices in groupby(order, key=lambda i: regions[i].chrom):
+            if chrom not in self:
+                continue
+            for i in indices:
+                sequences[i] = self.fetch(chrom, regions[i].initial, regions[i].final)
+        return sequences
+
+    def close(self):
+        """Close the FASTA files."""
+        for f in self._files.values():
+            f.close()
+        self._files = {}
+
+    def _file(self, chrom):
+        """Return the opened FASTA file of chromosome <chrom>, or None if its sequence is kept in memory."""
+        if self.directory is None:
+            return self._files[None]
+        if chrom not in self._files and chrom not in self._sequences:
+            filename = os.path.join(self.directory, chrom + ".fa")
+            try:
+                self._files[chrom] = pysam.Fastafile(filename)
+            except (IOError, OSError, ValueError):
+                self._sequences[chrom] = self._read_sequence(filename)
+        return self._files.get(chrom)
+
+    def _read_sequence(self, filename):
+        """Return the sequence of the first record of a FASTA file."""
+        lines = []
+        with open(filename) as f:
+            for line in f:
+                if line.startswith(">"):
+                    if lines: break
+                    continue
+                lines.append(line.strip())
+        return "".join(lines)
+
@@ -0,0 +1,374 @@
+"""
+GenomicRegionColumns
+===================
+GenomicRegionColumns stores genomic regions column by column in NumPy arrays. It is the storage behind the
+columnar mode of GenomicRegionSet; the set operations on it are implemented by IntervalIndex.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+from itertools import izip, repeat
+import numpy as np
+# Internal
+from rgt.GenomicRegion import GenomicRegion
+
+CHROM_TYPE = np.int32
+COORD_TYPE = np.int32
+STRAND_TYPE = np.int8
+# Position of the chromosome code inside a genome key (see genome_keys)
+KEY_SHIFT = 32
+DEFAULT_ORIENTATIONS = [None, "+", "-"]
+
+
+def genome_keys(chroms, coords):
+    """Return int64 keys which order (chromosome code, position) pairs in the same way as GenomicRegion.__cmp__.
+
+    *Keyword arguments:*
+
+        - chroms -- Array of chromosome codes.
+        - coords -- Array of non-negative positions.
+    """
+    return (chroms.astype(np.int64) << KEY_SHIFT) + coords
+
+
+def expand_ranges(lo, counts):
+    """Return the pair (owner, index) enumerating the ranges [lo[i], lo[i] + counts[i]) one after the other.
+
+    *Keyword arguments:*
+
+        - lo -- Array of first indices.
+        - counts -- Array of range lengths.
+    """
+    owner = np.repeat(np.arange(len(counts)), counts)
+    offsets = np.arange(len(owner)) - np.repeat(np.cumsum(counts) - counts, counts)
+    return owner, lo[owner] + offsets
+
+
+def object_column(values, size):
+    """Return the given values as a 1-dimensional object array, or None if all values are None."""
+    if values is None:
+        return None
+    if isinstance(values, np.ndarray) and values.dtype == object and values.ndim == 1:
+        return values
+    values = list(values)
+    if all(v is None for v in values):
+        return None
+    column = np.empty(size, dtype=object)
+    try:
+        column[:] = values
+    except ValueError:
+        # values which are sequences themselves (e.g. lists as data) cannot be broadcasted
+        for i, v in enumerate(values):
+            column[i] = v
+    return column
+
+
+class GenomicRegionColumns(object):
+    """*Keyword arguments:*
+
+        - chrom_names -- List of chromosome names; the chromosome codes are indices into this list.
+        - chroms -- Chromosome codes.
+        - initials -- Start positions.
+        - finals -- End positions.
+        - strands -- Orientation codes, indices into orientation_labels (default: no orientation).
+        - orientation_labels -- Orientations referred to by the strand codes (default [None, "+", "-"]).
+        - names -- Names of the regions (default None, i.e. no names).
+        - data -- Extra information of the regions (default None).
+        - proximity -- Close genes of the regions (default None).
+
+    .. note:: The chromosome names are kept in lexicographic order, so sorting by (code, initial, final) is the same
+              as sorting with GenomicRegion.__cmp__. Columns without any value are stored as None and only
+              allocated when a region with such a value is added.
+    """
+
+    def __init__(self, chrom_names, chroms, initials, finals, strands=None, orientation_labels=None,
+                 names=None, data=None, proximity=None):
+        self.chroms = np.asarray(chroms, dtype=CHROM_TYPE)
+        self.initials = np.asarray(initials, dtype=COORD_TYPE)
+        self.finals = np.asarray(finals, dtype=COORD_TYPE)
+        size = len(self.chroms)
+        if strands is None:
+            self.strands = np.zeros(size, dtype=STRAND_TYPE)
+        else:
+            self.strands = np.asarray(strands, dtype=STRAND_TYPE)
+        if orientation_labels is None:
+            orientation_labels = DEFAULT_ORIENTATIONS
+        self.orientation_labels = list(orientation_labels)
+        self.names = object_column(names, size)
+        self.data = object_column(data, size)
+        self.proximity = object_column(proximity, size)
+
+        self.chrom_names = list(chrom_names)
+        if self.chrom_names != sorted(self.chrom_names):
+            order = sorted(range(len(self.chrom_names)), key=lambda i: self.chrom_names[i])
+            recode = np.empty(len(order), dtype=CHROM_TYPE)
+            recode[order] = np.arange(len(order))
+            self.chroms = recode[self.chroms]
+            self.chrom_names = [self.chrom_names[i] for i in order]
+
+    @staticmethod
+    def from_regions(regions):
+        """Return GenomicRegionColumns holding the given GenomicRegions in the given order.
+
+        *Keyword arguments:*
+
+            - regions -- A list of GenomicRegions.
+        """
+        regions = list(regions)
+        size = len(regions)
+        chrom_names = sorted(set(r.chrom for r in regions))
+        chrom_codes = dict((c, i) for i, c in enumerate(chrom_names))
+        labels = list(DEFAULT_ORIENTATIONS)
+        label_codes = dict((o, i) for i, o in enumerate(labels))
+        strands = np.zeros(size, dtype=STRAND_TYPE)
+        for i, r in enumerate(regions):
+            if r.orientation is not None:
+                try:
+                    strands[i] = label_codes[r.orientation]
+                except KeyError:
+                    label_codes[r.orientation] = len(labels)
+                    labels.append(r.orientation)
+                    strands[i] = label_codes[r.orientation]
+
+        return GenomicRegionColumns(chrom_names=chrom_names,
+                                    chroms=np.fromiter((chrom_codes[r.chrom] for r in regions), CHROM_TYPE, size),
+                                    initials=np.fromiter((r.initial for r in regions), COORD_TYPE, size),
+                                    finals=np.fromiter((r.final for r in regions), COORD_TYPE, size),
+                                    strands=strands, orientation_labels=labels,
+                                    names=[r.name for r in regions],
+                                    data=[r.data for r in regions],
+                                    proximity=[r.proximity for r in regions])
+
+    def __len__(self):
+        return len(self.chroms)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return [self.region(i) for i in xrange(*key.indices(len(self)))]
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("region index out of range")
+        return self.region(key)
+
+    def region(self, i):
+        """Return the i-th region as a new GenomicRegion."""
+        return GenomicRegion(chrom=self.chrom_names[self.chroms[i]], initial=int(self.initials[i]),
+                             final=int(self.finals[i]),
+                             name=None if self.names is None else self.names[i],
+                             orientation=self.orientation_labels[self.strands[i]],
+                             data=None if self.data is None else self.data[i],
+                             proximity=None if self.proximity is None else self.proximity[i])
+
+    def iter_regions(self):
+        """Iterate over the regions, creating a new GenomicRegion for each of them."""
+        def column(values):
+            if values is None:
+                return repeat(None, len(self))
+            return iter(values)
+
+        chroms = self.chrom_list()
+        orientations = np.array(self.orientation_labels, dtype=object)[self.strands]
+        for c, i, f, n, o, d, p in izip(chroms, self.initials.tolist(), self.finals.tolist(), column(self.names),
+                                        orientations, column(self.data), column(self.proximity)):
+            yield GenomicRegion(chrom=c, initial=i, final=f, name=n, orientation=o, data=d, proximity=p)
+
+    def to_regions(self):
+        """Return a list of GenomicRegions."""
+        return list(self.iter_regions())
+
+    def chrom_list(self):
+        """Return the chromosome name of every region."""
+        return np.array(self.chrom_names, dtype=object)[self.chroms].tolist()
+
+    def chrom_code(self, chrom):
+        """Return the code of the given chromosome name, or None if no region lies on it."""
+        try:
+            return self.chrom_names.index(chrom)
+        except ValueError:
+            return None
+
+    def strand_code(self, orientation):
+        """Return the code of the given orientation, or None if it is unknown."""
+        try:
+            return self.orientation_labels.index(orientation)
+        except ValueError:
+            return None
+
+    def orientations(self):
+        """Return the orientation of every region as an object array."""
+        return np.array(self.orientation_labels, dtype=object)[self.strands]
+
+    def lengths(self):
+        """Return the length of every region."""
+        return self.finals - self.initials
+
+    def take(self, index):
+        """Return new GenomicRegionColumns with the rows selected by an index array or a boolean mask."""
+        def pick(values):
+            if values is None:
+                return None
+            return values[index]
+
+        return GenomicRegionColumns(chrom_names=self.chrom_names, chroms=self.chroms[index],
+                                    initials=self.initials[index], finals=self.finals[index],
+                                    strands=self.strands[index], orientation_labels=self.orientation_labels,
+                                    names=pick(self.names), data=pick(self.data), proximity=pick(self.proximity))
+
+    def recoded_chroms(self, chrom_names):
+        """Return the chromosome codes translated into the given list of chromosome names (a superset)."""
+        codes = dict((c, i) for i, c in enumerate(chrom_names))
+        mapping = np.array([codes[c] for c in self.chrom_names] or [0], dtype=CHROM_TYPE)
+        return mapping[self.chroms]
+
+    def shared_chroms(self, other):
+        """Return the chromosome codes of self and other with respect to the union of their chromosome names."""
+        if self.chrom_names == other.chrom_names:
+            return self.chroms, other.chroms
+        union = sorted(set(self.chrom_names) | set(other.chrom_names))
+        return self.recoded_chroms(union), other.recoded_chroms(union)
+
+    def concatenate(self, other):
+        """Return new GenomicRegionColumns with the rows of other appended to the rows of self."""
+        return GenomicRegionColumns.join([self, other])
+
+    @staticmethod
+    def join(parts):
+        """Return new GenomicRegionColumns with the rows of all given GenomicRegionColumns one after the other."""
+        if not parts:
+            return GenomicRegionColumns(chrom_names=[], chroms=[], initials=[], finals=[])
+        union = sorted(set(c for part in parts for c in part.chrom_names))
+        labels = []
+        for part in parts:
+            for o in part.orientation_labels:
+                if o not in labels:
+                    labels.append(o)
+
+        def join_column(columns):
+            if all(c is None for c in columns):
+                return None
+            return np.concatenate([np.empty(len(part), dtype=object) if c is None else c
+                                   for part, c in izip(parts, columns)])
+
+        strands = [np.array([labels.index(o) for o in part.orientation_labels], dtype=STRAND_TYPE)[part.strands]
+                   for part in parts]
+        return GenomicRegionColumns(chrom_names=union,
+                                    chroms=np.concatenate([part.recoded_chroms(union) for part in parts]),
+                                    initials=np.concatenate([part.initials for part in parts]),
+                                    finals=np.concatenate([part.finals for part in parts]),
+                                    strands=np.concatenate(strands), orientation_labels=labels,
+                                    names=join_column([part.names for part in parts]),
+                                    data=join_column([part.data for part in parts]),
+                                    proximity=join_column([part.proximity for part in parts]))
+
+    def sort_index(self):
+        """Return the (stable) permutation which sorts the regions by chromosome, initial and final position."""
+        return np.lexsort((self.finals, self.initials, self.chroms))
+
+    def is_sorted(self):
+        """Return True, if the regions are sorted by chromosome, initial and final position."""
+        if len(self) < 2:
+            return True
+        starts = genome_keys(self.chroms, self.initials)
+        increasing = starts[1:] > starts[:-1]
+        tie = (starts[1:] == starts[:-1]) & (self.finals[1:] >= self.finals[:-1])
+        return bool(np.all(increasing | tie))
+
+    def extend(self, left, right):
+        """Extend every region by left and right (scalars or arrays) in place, as GenomicRegion.extend does."""
+        initials = self.initials.astype(np.int64) - left
+        finals = self.finals.astype(np.int64) + right
+        swap = initials > finals
+        initials[swap], finals[swap] = finals[swap], initials[swap]
+        self.initials = np.maximum(initials, 0).astype(COORD_TYPE)
+        self.finals = finals.astype(COORD_TYPE)
+
+    def reaches(self):
+        """Return the end positions used for overlap tests, where empty regions occupy their initial position.
+
+        .. note:: GenomicRegion.overlap considers an empty region of another set to overlap a region starting at the
+                  same position. Extending it by one base reproduces this for the half-open comparison.
+        """
+        return np.maximum(self.finals, self.initials + 1)
+
+    def segments(self, namedistinct=False, strand_specific=False):
+        """Return the segment of every region. A segment is a run of neighbours which may be merged: same chromosome
+        (and name or orientation).
+
+        *Keyword arguments:*
+
+            - namedistinct -- Start a new segment at every change of the name.
+            - strand_specific -- Start a new segment at every change of the orientation.
+        """
+        segments = np.zeros(len(self), dtype=np.int64)
+        if len(self) > 1:
+            boundary = self.chroms[1:] != self.chroms[:-1]
+            if namedistinct and self.names is not None:
+                boundary |= self.names[1:] != self.names[:-1]
+            if strand_specific:
+                boundary |= self.strands[1:] != self.strands[:-1]
+            segments[1:] = np.cumsum(boundary)
+        return segments
+
+    def cluster_rows(self, namedistinct=False, strand_specific=False, distance=0):
+        """Return the arrays (rows, finals) of the clusters of the sorted regions, where rows are the positions of the
+        first region of every cluster (see merge)."""
+        size = len(self)
+        segments = self.segments(namedistinct, strand_specific)
+
+        # A region starts a new cluster if it begins (minus distance) at or after the furthest end seen so far in its
+        # segment. The gap is measured to the plain ends, an empty region does not extend a cluster.
+        reach = np.maximum.accumulate((segments << KEY_SHIFT) + self.finals)
+        heads = np.ones(size, dtype=bool)
+        heads[1:] = (segments[1:] != segments[:-1]) | \
+            ((segments[1:] << KEY_SHIFT) + self.initials[1:].astype(np.int64) - distance >= reach[:-1])
+        heads = np.flatnonzero(heads)
+        if size == 0:
+            return heads, self.finals[:0]
+        return heads, np.maximum.reduceat(self.finals, heads).astype(COORD_TYPE)
+
+    def merge(self, namedistinct=False, strand_specific=False, distance=0):
+        """Return merged GenomicRegionColumns as GenomicRegionSet.merge does. The regions have to be sorted.
+
+        *Keyword arguments:*
+
+            - namedistinct -- Merge the regions which have the same names only.
+            - strand_specific -- Merge the regions which have the same orientation only.
+            - distance -- Merge the regions starting less than distance after the end of the previous ones as well
+                          (see GenomicRegionSet.cluster).
+        """
+        heads, finals = self.cluster_rows(namedistinct, strand_specific, distance)
+        merged = self.take(heads)
+        merged.finals = finals
+        return merged
+
+    def with_coordinates(self, rows, initials, finals):
+        """Return new GenomicRegionColumns with the given rows and their positions replaced.
+
+        *Keyword arguments:*
+
+            - rows -- Index array of the rows to take.
+            - initials -- New start positions of the taken rows.
+            - finals -- New end positions of the taken rows.
+        """
+        z = self.take(rows)
+        z.initials = np.asarray(initials, dtype=COORD_TYPE)
+        z.finals = np.asarray(finals, dtype=COORD_TYPE)
+        return z
+
+    def duplicate_mask(self):
+        """Return a mask of the regions equal in position to their predecessor. The regions have to be sorted."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[1:] = ((self.chroms[1:] == self.chroms[:-1]) & (self.initials[1:] == self.initials[:-1]) &
+                    (self.finals[1:] == self.finals[:-1]))
+        return mask
+
+    def overlap_mask(self):
+        """Return a mask of the regions overlapping their predecessor (as in GenomicRegion.overlap). The regions have
+        to be sorted."""
+        mask = np.zeros(len(self), dtype=bool)
+        mask[1:] = (self.chroms[1:] == self.chroms[:-1]) & (
+            (self.initials[1:] < self.finals[:-1]) |
+            ((self.initials[1:] == self.initials[:-1]) & (self.finals[1:] > self.initials[1:])))
+        return mask
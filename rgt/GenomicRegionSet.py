@@ -12,7 +12,9 @@ from __future__ import print_function
 from __future__ import division
 import os
 import sys
+import copy
 import random
+import numpy as np
 from ctypes import *
 from scipy import stats
 from copy import deepcopy
@@ -20,18 +22,36 @@ from collections import OrderedDict
 # Internal
 from rgt.SequenceSet import *
 from rgt.GeneSet import GeneSet
+from rgt.GenomeFasta import GenomeFasta
 from rgt.GenomicRegion import GenomicRegion
+from rgt.GenomicRegionColumns import GenomicRegionColumns
+from rgt.IntervalIndex import IntervalIndex
+from rgt.LibRGT import get_librgt
+from rgt.BedReader import BedReader
+from rgt.RegionSampler import RegionSampler, random_state
+from rgt.GeneIndex import get_gene_index
 from rgt.Util import GenomeData, OverlapType, AuxiliaryFunctions, Library_path
 
 
+def _fingerprint(regions):
+    """Return a hash of the coordinates, orientations, names and attached objects of a list of GenomicRegions, which
+    changes with every in-place modification of the list or of its regions."""
+    return hash(tuple([(r.chrom, r.initial, r.final, r.orientation, r.name, id(r.data), id(r.proximity))
+                       for r in regions]))
+
+
 ###############################################################################
 # Class
 ###############################################################################
 
-class GenomicRegionSet:
+class GenomicRegionSet(object):
     """*Keyword arguments:*
 
         - name -- Name of the GenomicRegionSet
+
+    .. note:: The regions are kept either as a list of GenomicRegions (default) or in a columnar storage
+              (see to_columnar), where coordinates are NumPy arrays and GenomicRegions are only created on iteration.
+              Overlap queries against a set use its IntervalIndex (see get_index), which is kept until the set changes.
     """
 
     def __init__(self, name):
@@ -41,8 +61,88 @@ class GenomicRegionSet:
         self.fileName = ""
         self.genome_path = ""
 
+    @property
+    def sequences(self):
+        """List of GenomicRegions. Accessing it switches a columnar set back to the list storage."""
+        if self._columns is not None:
+            self._sequences = self._columns.to_regions()
+            self._columns = None
+        return self._sequences
+
+    @sequences.setter
+    def sequences(self, regions):
+        self._sequences = regions
+        self._columns = None
+        self._index = None
+
+    def is_columnar(self):
+        """Return True, if the regions are kept in the columnar storage."""
+        return self._columns is not None
+
+    def to_columnar(self):
+        """Switch to the columnar storage (in place).
+
+        .. note:: The GenomicRegions yielded by iterating over a columnar set are created on the fly, so changing
+                  them does not change the set. Use the methods of the set instead, or access self.sequences,
+                  which switches back to the list storage.
+        """
+        if self._columns is None:
+            self.set_columns(GenomicRegionColumns.from_regions(self._sequences), sorted=self.sorted)
+
+    def get_columns(self):
+        """Return the regions as GenomicRegionColumns without changing the storage of the set."""
+        if self._columns is not None:
+            return self._columns
+        return GenomicRegionColumns.from_regions(self._sequences)
+
+    def set_columns(self, columns, sorted=False):
+        """Replace the regions by the given GenomicRegionColumns and switch to the columnar storage.
+
+        *Keyword arguments:*
+
+            - columns -- GenomicRegionColumns holding the new regions.
+            - sorted -- Whether the columns are already sorted.
+        """
+        self._sequences = None
+        self._columns = columns
+        self._index = None
+        self.sorted = sorted
+
+    def get_index(self):
+        """Return the IntervalIndex of the regions. It is built on first use and reused by the overlap queries
+        (intersect, subtract, merge, cluster, counts_per_region, coverage_per_region, covered_by_aregion, include,
+        closest) until the set changes.
+
+        .. note:: The index is dropped by every method changing the set. For the list storage, the index is also
+                  checked against a fingerprint of the regions, so that GenomicRegions or list items which are
+                  modified directly (not through the set) are noticed as well.
+        """
+        if self._columns is not None:
+            source, fingerprint = self._columns, None
+        else:
+            source, fingerprint = self._sequences, _fingerprint(self._sequences)
+        if self._index is None or not self._index.describes(source, fingerprint):
+            self._index = IntervalIndex(self.get_columns(), source, fingerprint)
+        return self._index
+
+    def _changed(self):
+        """Drop the cached IntervalIndex after the regions were modified in place."""
+        self._index = None
+
+    def _new_set(self, name, columns, sorted=False):
+        """Return a new GenomicRegionSet holding the given GenomicRegionColumns in the storage of self."""
+        z = GenomicRegionSet(name)
+        if self._columns is not None:
+            z.set_columns(columns, sorted=sorted)
+        else:
+            z.sequences = columns.to_regions()
+            z.sorted = sorted
+        return z
+
     def get_chrom(self):
         """Return all chromosomes."""
+        if self._columns is not None:
+            return self._columns.chrom_list()
         return [r.chrom for r in self.sequences]
 
     def get_names(self):
@@ -63,14 +163,21 @@ class GenomicRegionSet:
         """
         self.sequences.append(region)
         self.sorted = False
+        self._changed()
 
     def __len__(self):
+        if self._columns is not None:
+            return len(self._columns)
         return len(self.sequences)
 
     def __iter__(self):
+        if self._columns is not None:
+            return self._columns.iter_regions()
         return iter(self.sequences)
 
     def __getitem__(self, key):
+        if self._columns is not None:
+            return self._columns[key]
         return self.sequences[key]
 
     def extend(self, left, right, percentage=False, w_return=False):
@@ -80,6 +187,17 @@ class GenomicRegionSet:
 
             - percentage -- input value of left and right can be any positive value or negative value larger than -50 %
         """
+        if self._columns is not None:
+            if percentage:
+                if percentage > -50:
+                    lengths = self._columns.lengths()
+                    left = (lengths * left / 100).astype(int)
+                    right = (lengths * right / 100).astype(int)
+                else:
+                    print("Percentage for extension must be larger than 50%%.")
+                    sys.exit(0)
+            return self._extend_columns(left, right, w_return)
+
         z = GenomicRegionSet(name=self.name)
 
         if percentage:
@@ -102,6 +220,7 @@ class GenomicRegionSet:
         if w_return:
             return z
         else:
+            self._changed()
             return
 
     def extend_upstream(self, length=1000, w_return=False):
@@ -111,6 +230,10 @@ class GenomicRegionSet:
 
             - length -- Extending length
         """
+        if self._columns is not None:
+            forward = self._columns.strands == self._columns.strand_code("+")
+            return self._extend_columns(np.where(forward, length, 0), np.where(forward, 0, length), w_return)
+
         z = GenomicRegionSet(name=self.name)
         for s in self.sequences:
             if w_return:
@@ -126,6 +249,7 @@ class GenomicRegionSet:
         if w_return:
             return z
         else:
+            self._changed()
             return
 
     def extend_downstream(self, length=1000, w_return=False):
@@ -135,6 +259,10 @@ class GenomicRegionSet:
 
             - length -- Extending length
         """
+        if self._columns is not None:
+            forward = self._columns.strands == self._columns.strand_code("+")
+            return self._extend_columns(np.where(forward, 0, length), np.where(forward, length, 0), w_return)
+
         z = GenomicRegionSet(name=self.name)
         for s in self.sequences:
             if w_return:
@@ -150,8 +278,21 @@ class GenomicRegionSet:
         if w_return:
             return z
         else:
+            self._changed()
             return
 
+    def _extend_columns(self, left, right, w_return):
+        """Extend the regions of a columnar set by left and right (scalars or arrays)."""
+        if w_return:
+            z = GenomicRegionSet(name=self.name)
+            z.set_columns(self._columns.take(slice(None)))
+            z._columns.extend(left, right)
+            return z
+        else:
+            self._columns.extend(left, right)
+            self.sorted = False
+            self._changed()
+
     def sort(self, key=None, reverse=False):
         """Sort Elements by criteria defined by a GenomicRegion.
 
@@ -160,90 +301,94 @@ class GenomicRegionSet:
             - key -- given the key for comparison.
             - reverse -- reverse the sorting result.
         """
-        if key:
+        if self._columns is not None and not key:
+            if not self._columns.is_sorted():
+                self._columns = self._columns.take(self._columns.sort_index())
+            self.sorted = True
+        elif key:
             self.sequences.sort(key=key, reverse=reverse)
+            self._changed()
         else:
             self.sequences.sort(cmp=GenomicRegion.__cmp__)
             self.sorted = True
+            self._changed()
 
-    def read_bed(self, filename):
+    def read_bed(self, filename, columnar=False):
         """Read BED file and add every row as a GenomicRegion.
 
         *Keyword arguments:*
 
             - filename -- define the path to the BED file.
+            - columnar -- keep the regions in the columnar storage (see to_columnar); an empty columnar set stays
+              columnar as well.
 
             .. note:: Chrom (1), start (2), end (2), name (4) and orientation (6) is used for GenomicRegion. All other columns (5, 7, 8, ...) are put to the data attribute of the GenomicRegion. The numbers in parentheses are the columns of the BED format.
         """
         self.fileName = filename
-        with open(filename) as f:
-            error_line = 0  # Count error line
-            for line in f:
-                line = line.strip("\n")
-                line = line.split()
-                try:
-                    name, orientation, data = None, None, None
-                    size = len(line)
-                    chrom = line[0]
-                    start, end = int(line[1]), int(line[2])
-
-                    if start > end:
-                        start, end = end, start
-                    if size > 3:
-                        name = line[3]
-
-                    if size > 5:
-                        orientation = line[5]
-                        data = "\t".join([line[4]] + line[6:])
-                    if size == 5:
-                        data = line[4]
-
-                    if start == end:
-                        raise Exception("zero-length region: " + self.chrom + "," + str(self.initial) + "," + str(self.final))
-
-                    self.add(GenomicRegion(chrom, start, end, name, orientation, data))
-                except:
-                    if line == []:
-                        continue
-                    else:
-                        error_line += 1
-                        if error_line > 2:
-                            # Skip the first error line which contains the track information
-                            print("Error at line", line, self.fileName)
-            self.sort()
+        reader = BedReader(filename)
+        self._add_columns(reader.read(), columnar)
+        # Skip the first error lines which contain the track information
+        for line in reader.errors[2:]:
+            print("Error at line", line.split(), self.fileName)
+
+    @staticmethod
+    def iter_bed(filename, chunk_size=100000):
+        """Iterate over a BED file in GenomicRegionSets of chunk_size regions, in the order of the file. Only one
+        chunk is held in memory at a time.
+
+        *Keyword arguments:*
+
+            - filename -- define the path to the BED file.
+            - chunk_size -- number of regions per GenomicRegionSet (the last one may be smaller).
+
+        *Return:*
+
+            - Columnar GenomicRegionSets (see to_columnar), which are sorted if the file is sorted.
+        """
+        for columns in BedReader(filename).iter_columns(chunk_size):
+            z = GenomicRegionSet(filename)
+            z.fileName = filename
+            z.set_columns(columns, sorted=columns.is_sorted())
+            yield z
+
+    def _add_columns(self, columns, columnar=False):
+        """Add the regions of the given GenomicRegionColumns and sort the set; already sorted regions are not
+        sorted again."""
+        if len(self) > 0:
+            if self._columns is None and not columnar:
+                self.sequences.extend(columns.to_regions())
+                self.sort()
+                return
+            columns = self.get_columns().concatenate(columns)
+        if not columns.is_sorted():
+            columns = columns.take(columns.sort_index())
+        if columnar or self._columns is not None:
+            self.set_columns(columns, sorted=True)
+        else:
+            self.sequences = columns.to_regions()
+            self.sorted = True
 
     def read_sequence(self, genome_file_dir):
         """Read the sequences defined by a given genomic set.s
         *Keyword arguments:*
 
             - genomic_set - genomic set with regions to obtain the fasta file
-            - genome_file_dir -- A directory which contains the FASTA files for each chromosome.
+            - genome_file_dir -- A directory which contains the FASTA files for each chromosome, or an indexed FASTA file.
         """
 
-        bed=self
-        # Parse each chromosome and fetch the defined region in this chromosome
-        chroms = list(set(bed.get_chrom()))
-
-        chro_files = [x.split(".")[0] for x in os.listdir(genome_file_dir)]
+        genome = GenomeFasta(genome_file_dir)
+        for ch in set(self.get_chrom()):
+            if ch not in genome: print(" *** There is no genome FASTA file for: "+ch)
 
-        for ch in chroms:
-            if ch not in chro_files: print(" *** There is no genome FASTA file for: "+ch)
-
-            # Read genome in FASTA according to the given chromosome
-            ch_seq = SequenceSet(name=ch, seq_type=SequenceType.DNA)
-            try: 
-                ch_seq.read_fasta(os.path.join(genome_file_dir, ch+".fa"))
-            except:
-                continue
-            
-            # Regions in given chromosome
-            beds = bed.any_chrom(chrom=ch)
-
-            for s in beds:
-                seq = ch_seq[0].seq[s.initial:s.final]
-                try: strand = s.strand
-                except: strand = "+"
-                s.sequence=(Sequence(seq=seq, name=s.__repr__(), strand=strand))
+        # Fetch the regions sorted by chromosome and position, without reading whole chromosomes. The sequences are
+        # set on the list of the set, as the regions of a columnar set are created on the fly.
+        regions = self.sequences
+        for s, seq in zip(regions, genome.fetch_many(regions)):
+            if seq is None: continue
+            try: strand = s.strand
+            except: strand = "+"
+            s.sequence=(Sequence(seq=seq, name=s.__repr__(), strand=strand))
+        genome.close()
 
     def write_sequence(self, out_file):
         """Write the sequences defined by a given genomic set. 
@@ -258,28 +403,19 @@ class GenomicRegionSet:
             pass
                  
 
-    def read_bedgraph(self, filename):
+    def read_bedgraph(self, filename, columnar=False):
         """Read BEDGRAPH file and add every row as a GenomicRegion.
 
         *Keyword arguments:*
 
             - filename -- define the path to the BEDGRAPH file.
+            - columnar -- keep the regions in the columnar storage (see to_columnar).
         """
         self.fileName = filename
-        with open(filename) as f:
-            for line in f:
-                try:
-                    line = line.strip("\n")
-                    line = line.split("\t")
-                    assert len(line) == 4
-
-                    chrom, start, end, data = line[0], int(line[1]), int(line[2]), str(line[3])
-
-                    self.add(GenomicRegion(chrom=chrom, initial=start, final=end, data=data))
-                except:
-                    print("Error at line", line, self.fileName)
-
-            self.sort()
+        reader = BedReader(filename, bedgraph=True)
+        self._add_columns(reader.read(), columnar)
+        for line in reader.errors:
+            print("Error at line", line.split("\t"), self.fileName)
 
     def random_subregions(self, size, name=None):
         """Return a subsampling of the genomic region set with a specific number of regions.
@@ -295,20 +431,23 @@ class GenomicRegionSet:
             z.add(self.sequences[i])
         return z
 
-    def random_split(self, size):
+    def random_split(self, size, seed=None):
         """Return two exclusive GenomicRegionSets from self randomly.
 
         *Keyword arguments:*
 
             - size -- define number of the spliting regions.
+            - seed -- Seed of the random numbers (default None: drawn from the random module, see RegionSampler)
         """
+        chosen = np.zeros(len(self), dtype=bool)
+        chosen[random_state(seed).permutation(len(self))[:size]] = True
         a, b = GenomicRegionSet('random_split1'), GenomicRegionSet('random_split2')
-        samp = random.sample(range(len(self)), size)
-        for i in range(len(self)):
-            if i in samp:
-                a.add(self.sequences[i])
-            else:
-                b.add(self.sequences[i])
+        if self._columns is not None:
+            a.set_columns(self._columns.take(chosen), sorted=self.sorted)
+            b.set_columns(self._columns.take(~chosen), sorted=self.sorted)
+        else:
+            a.sequences = [s for s, c in zip(self.sequences, chosen.tolist()) if c]
+            b.sequences = [s for s, c in zip(self.sequences, chosen.tolist()) if not c]
         return a, b
 
     def write_bed(self, filename):
@@ -664,110 +803,19 @@ class GenomicRegionSet:
             # If there is overlap within self or y, they should be merged first.
             if not self.sorted: self.sort()
 
-            genome = GenomeData(organism)
-
+            # The promoter-extended and sorted genes are cached by the process (see GeneIndex)
+            index = get_gene_index(organism, promoterLength).select(gene_set)
             genes = GenomicRegionSet("genes")
-            genes.read_bed(genome.get_gene_regions())
-
-            if gene_set:
-                new_genes = GenomicRegionSet("genes")
-                name_list = [g.upper() for g in gene_set.genes]
-                for g in genes:
-                    if g.name.upper() in name_list: new_genes.add(g)
-                genes = new_genes
-            genes.extend_upstream(length=promoterLength)
-
-            if not genes.sorted: genes.sort()
-
-            last_j = len(genes) - 1
-            j = 0
-            if strand_specific:
-                pre_inter = [0, 0]
-            else:
-                pre_inter = 0
-
-            for s in self:
-                cont_loop = True
-                cont_overlap = False
-                asso_names = {"overlap": [], "close_l": [], "close_r": []}
-
-                while cont_loop:
-                    if strand_specific and s.orientation != genes[j].orientation:
-                        if j == last_j:
-                            cont_loop = False
-                        else:
-                            j += 1
-                    else:
-                        d = s.distance(genes[j])
-                        if d == 0:
-                            asso_names["overlap"].append(genes[j].name)
-                            if not cont_overlap:
-                                if strand_specific and s.orientation == "+":
-                                    pre_inter[0] = j
-                                elif strand_specific and s.orientation == "-":
-                                    pre_inter[1] = j
-                                elif not strand_specific:
-                                    pre_inter = j
-                            if j == last_j:
-                                cont_loop = False
-                            else:
-                                j += 1
-                                cont_overlap = True
-                        elif asso_names["overlap"] and d != 0:
-                            if strand_specific:
-                                if pre_inter[0] > 0 and pre_inter[1] > 0:
-                                    j = min(pre_inter)
-                                elif pre_inter[0] == 0 and pre_inter[1] > 0:
-                                    j = pre_inter[1]
-                                elif pre_inter[0] > 0 and pre_inter[1] == 0:
-                                    j = pre_inter[0]
-                            elif s.chrom == genes[j].chrom and pre_inter > 0:
-                                j = pre_inter
-                            cont_loop = False
-
-                        elif 0 < d < threshDist:
-                            if show_dis:
-                                if s > genes[j]:
-                                    if asso_names["close_l"] and d < asso_names["close_l"][0]:
-                                        asso_names["close_l"] = [d, genes[j].name + "(-" + str(d) + ")"]
-                                    else:
-                                        asso_names["close_l"] = [ d, genes[j].name+"(-"+str(d)+")"]
-
-                                elif s < genes[j]:
-                                    asso_names["close_r"] = [ d, genes[j].name+"(+"+str(d)+")"]
-                                    cont_loop = False
-                            else:
-                                if s > genes[j]:
-
-                                    if asso_names["close_l"] and d < asso_names["close_l"][0]:
-                                        asso_names["close_l"] = [d, genes[j].name + "(-)"]
-                                    else:
-                                        asso_names["close_l"] = [d, genes[j].name + "(-)"]
-                                elif s < genes[j]:
-                                    asso_names["close_r"] = [ d, genes[j].name+"(+)"]
-                                    cont_loop = False
-                            if j == last_j:
-                                cont_loop = False
-                            else:
-                                j += 1
-
-                        elif s < genes[j]:
-                            if strand_specific and s.orientation == "+":
-                                if s.chrom == genes[j].chrom and pre_inter[0] > 0:
-                                    j = pre_inter[0]
-                            elif strand_specific and s.orientation == "-":
-                                if s.chrom == genes[j].chrom and pre_inter[1] > 0:
-                                    j = pre_inter[1]
-                            elif s.chrom == genes[j].chrom and pre_inter > 0:
-                                j = pre_inter
-                            cont_loop = False
-
-                        elif s > genes[j]:
-                            if j == last_j:
-                                cont_loop = False
-                            else:
-                                j += 1
+            genes.set_columns(index.regions, sorted=True)
+            genes._index = index
 
+            touching, left, right = self._associate(genes, threshDist, strand_specific)
+            for s, t, l, r in zip(self, touching, left, right):
+                asso_names = {"overlap": [name for name, d in t], "close_l": [], "close_r": []}
+                if l:
+                    asso_names["close_l"] = [l[1], l[0] + ("(-" + str(l[1]) + ")" if show_dis else "(-)")]
+                if r:
+                    asso_names["close_r"] = [r[1], r[0] + ("(+" + str(r[1]) + ")" if show_dis else "(+)")]
 
                 if asso_names["overlap"]:
                     z.add(GenomicRegion(chrom=s.chrom, initial=s.initial, final=s.final,
@@ -961,11 +1009,44 @@ class GenomicRegionSet:
                 y              ----------      ---------------              ----
                 Result                                ------
         """
+        if self._columns is not None:
+            return self.intersect_columnar(y, mode, rm_duplicates)
         # if sys.platform == "darwin":
         #     return self.intersect_python(y, mode, rm_duplicates)
         # else:
         return self.intersect_c(y, mode, rm_duplicates)
 
+    def intersect_columnar(self, y, mode=OverlapType.OVERLAP, rm_duplicates=False):
+        """Intersect for columnar sets, using the cached IntervalIndex of both sets.
+        The result is columnar and sorted."""
+        z = GenomicRegionSet(self.name)
+        if len(self) == 0 or len(y) == 0: return z
+
+        z.set_columns(self._intersect_columns(y, mode), sorted=True)
+        if rm_duplicates: z.remove_duplicates()
+        return z
+
+    def _intersect_columns(self, y, mode):
+        """Return the intersection with y as GenomicRegionColumns (see _intersect_rows)."""
+        a, rows, initials, finals = self._intersect_rows(y, mode)
+        return a.with_coordinates(rows, initials, finals)
+
+    def _intersect_rows(self, y, mode):
+        """Return the tuple (a, rows, initials, finals) of the intersection with y, where a are the sorted (for
+        OverlapType.OVERLAP merged) regions of self as GenomicRegionColumns and rows are the positions in a of the
+        regions each result region belongs to. It is computed by librgt if it is available and by the IntervalIndex
+        of y otherwise."""
+        if not self.sorted: self.sort()
+        # If there is overlap within self or y, they should be merged first.
+        merged = mode == OverlapType.OVERLAP
+        a = self.get_index().merged() if merged else self.get_index().regions
+        index = y.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            rows, initials, finals = librgt.intersect(mode, index.coded_query(a), index.coded(merged))
+        else:
+            rows, initials, finals = index.intersect_rows(a, mode)
+        return a, rows, initials, finals
 
     def intersect_python(self, y, mode=OverlapType.OVERLAP, rm_duplicates=False):
         z = GenomicRegionSet(self.name)
@@ -1081,107 +1162,16 @@ class GenomicRegionSet:
             return z
 
     def intersect_c(self, y, mode=OverlapType.OVERLAP, rm_duplicates=False):
-        # Determine path of shared library
-        Lib = Library_path()
-        lib = cdll.LoadLibrary(Lib.get_c_rgt())
-        # C-Binding of intersect overlap function
-        intersect_overlap_c = lib.intersectGenomicRegionSetsOverlap
-        intersect_overlap_c.argtypes = [POINTER(c_char_p), POINTER(c_int), POINTER(c_int), c_int, POINTER(c_char_p),
-                                        POINTER(c_int), POINTER(c_int), c_int, POINTER(POINTER(c_int)),
-                                        POINTER(POINTER(c_int)), POINTER(POINTER(c_int)), POINTER(c_int)]
-        intersect_overlap_c.restype = None
-
-        # C-Binding of intersect original function
-        intersect_original_c = lib.intersectGenomicRegionSetsOriginal
-        intersect_original_c.argtypes = [POINTER(c_char_p), POINTER(c_int), POINTER(c_int), c_int, POINTER(c_char_p),
-                                         POINTER(c_int), POINTER(c_int), c_int, POINTER(POINTER(c_int)),
-                                         POINTER(POINTER(c_int)), POINTER(POINTER(c_int)), POINTER(c_int)]
-        intersect_original_c.restype = None
-
-        # C-Binding of intersect completely function
-        intersect_completely_included_c = lib.intersectGenomicRegionSetsCompletelyIncluded
-        intersect_completely_included_c.argtypes = [POINTER(c_char_p), POINTER(c_int), POINTER(c_int), c_int,
-                                                    POINTER(c_char_p), POINTER(c_int), POINTER(c_int), c_int,
-                                                    POINTER(POINTER(c_int)), POINTER(POINTER(c_int)),
-                                                    POINTER(POINTER(c_int)), POINTER(c_int)]
-        intersect_completely_included_c.restype = None
-
-        # If one of the sets is empty, the intersection is trivially empty as well
+        """Intersect for sets in the list storage, computed by librgt (see intersect_columnar)."""
         result = GenomicRegionSet(self.name)
         if len(self) == 0 or len(y) == 0:
             return result
 
-        # Otherwise
-        else:
-            a = self
-            b = y
-            # Sort sets if necessary
-            if not a.sorted:
-                a.sort()
-            if not b.sorted:
-                b.sort()
-            assert a.sorted
-            assert b.sorted
-
-            # If there is overlap within a or b, they should be merged first.
-            if mode == OverlapType.OVERLAP:
-                a = a.merge(w_return=True)
-                b = b.merge(w_return=True)
-
-            # Convert to ctypes
-            len_self = len(a)
-            len_y = len(b)
-            max_len_result = len_self + len_y
-
-            chromosomes_self_python = [gr.chrom for gr in a.sequences]
-            chromosomes_self_c = (c_char_p * len_self)(*chromosomes_self_python)
-
-            chromosomes_y_python = [gr.chrom for gr in b.sequences]
-            chromosomes_y_c = (c_char_p * len_y)(*chromosomes_y_python)
-
-            initials_self_python = [gr.initial for gr in a.sequences]
-            initials_self_c = (c_int * len_self)(*initials_self_python)
-
-            initials_y_python = [gr.initial for gr in b.sequences]
-            initials_y_c = (c_int * len_y)(*initials_y_python)
-
-            finals_self_python = [gr.final for gr in a.sequences]
-            finals_self_c = (c_int * len_self)(*finals_self_python)
-
-            finals_y_python = [gr.final for gr in b.sequences]
-            finals_y_c = (c_int * len_y)(*finals_y_python)
-
-            indices_c = POINTER(c_int)((c_int * max_len_result)())
-            initials_result_c = POINTER(c_int)((c_int * max_len_result)())
-            finals_result_c = POINTER(c_int)((c_int * max_len_result)())
-            size_result_c = c_int()
-
-            # Call C-function
-            if mode == OverlapType.OVERLAP:
-                intersect_overlap_c(chromosomes_self_c, initials_self_c, finals_self_c, len_self, chromosomes_y_c,
-                                    initials_y_c, finals_y_c, len_y, pointer(indices_c), pointer(initials_result_c),
-                                    pointer(finals_result_c), byref(size_result_c))
-            elif mode == OverlapType.ORIGINAL:
-                intersect_original_c(chromosomes_self_c, initials_self_c, finals_self_c, len_self, chromosomes_y_c,
-                                     initials_y_c, finals_y_c, len_y, pointer(indices_c), pointer(initials_result_c),
-                                     pointer(finals_result_c), byref(size_result_c))
-            elif mode == OverlapType.COMP_INCL:
-                intersect_completely_included_c(chromosomes_self_c, initials_self_c, finals_self_c, len_self,
-                                                chromosomes_y_c, initials_y_c, finals_y_c, len_y, pointer(indices_c),
-                                                pointer(initials_result_c), pointer(finals_result_c),
-                                                byref(size_result_c))
-
-            # Construct result set
-            for i in range(size_result_c.value):
-                ci = indices_c[i]
-                result.add(GenomicRegion(chromosomes_self_c[ci], initials_result_c[i],
-                                         finals_result_c[i], name=a.sequences[ci].name,
-                                         orientation=a.sequences[ci].orientation, data=a.sequences[ci].data,
-                                         proximity=a.sequences[ci].proximity))
-            if rm_duplicates:
-                result.remove_duplicates()
-            return result
-
+        result.sequences = self._intersect_columns(y, mode).to_regions()
+        result.sorted = True
+        if rm_duplicates:
+            result.remove_duplicates()
+        return result
 
     def intersect_count(self, regionset, mode_count="count", threshold=False):
         """Return the number of regions in regionset A&B in following order: (A-B, B-A, intersection)
@@ -1225,9 +1215,8 @@ class GenomicRegionSet:
                 len_21 = allbed2 - len_inter
                 return len_12, len_21, len_inter
              
-    def closest(self, y, max_dis=10000, return_list=False, top_N=None):
+    def closest(self, y, max_dis=10000, return_list=False, top_N=None, ties=False, direction=None):
         """Return a new GenomicRegionSet including the region(s) of y which is closest to any self region. 
-        If there are intersection, return False.
         
         *Keyword arguments:*
 
@@ -1235,46 +1224,25 @@ class GenomicRegionSet:
             - max_dis -- maximum distance (default=10000 bp)
             - return_list -- return a list of the distances
             - top_N -- return a dictionary with region names as keys and the GenomicRegionSet containing N clostest regions as values. 
+            - ties -- return all regions as close as the closest (or N-th closest) one.
+            - direction -- only search "upstream" or "downstream" of the self regions with respect to their orientation, or "left" or "right" of them (default None, both sides).
 
         *Return:*
 
             - A GenomicRegionSet which contains the nearest regions to the self
+
+        .. note:: Self regions without any region of y closer than max_dis are skipped.
         """
         if self.sorted == False: self.sort()
-        if y.sorted == False: y.sort()
-
-        targets = self.window(y=y, adding_length = max_dis)
-
-        chroms = self.get_chrom()
-        uni_chrom = list(set(chroms))
-        target_dict = {}
-        for ch in uni_chrom:
-            target_dict[ch] = targets.any_chrom(chrom=ch)
+        query = self.get_index().regions
+        index = y.get_index()
+        rows, partners, distances = index.nearest(query, n=top_N or 1, max_distance=max_dis, ties=ties,
+                                                  direction=direction)
 
         if not top_N:
-            if return_list: z_list = []
-
-            z = GenomicRegionSet(self.name)
-
-            for region in self:
-                distances = []
-                if len(target_dict[region.chrom]) == 0:
-                    continue
-                elif len(target_dict[region.chrom]) == 1:
-                    d = region.distance(target_dict[region.chrom][0])
-                    z.add(target_dict[region.chrom][0])
-                    if return_list: z_list.append(d)
-                else:
-
-                    for r in target_dict[region.chrom]:
-                        d = region.distance(r)
-                        distances.append(d)
-                    min_ind = distances.index(min(distances)) 
-                    z.add(target_dict[region.chrom][min_ind])
-                    if return_list: z_list.append(distances[min_ind])
-
+            z = self._new_set(self.name, index.regions.take(partners))
             if return_list:
-                return z, z_list
+                return z, distances.tolist()
             else:
                 return z
 
@@ -1282,55 +1250,67 @@ class GenomicRegionSet:
             res_dict = OrderedDict()
             if return_list: res_dist = OrderedDict()
 
-            for region in self:
+            # Each self region has a consecutive block of results
+            firsts = np.flatnonzero(np.diff(np.concatenate(([-1], rows))))
+            for lo, hi in zip(firsts, np.append(firsts[1:], len(rows))):
+                region = query.region(rows[lo])
                 if region.name:
                     tag = region.name
                 else:
                     tag = region.toString()
-                
-                distances = []
-                if len(target_dict[region.chrom]) == 0:
-                    continue
-                elif len(target_dict[region.chrom]) <= top_N:
-                    res_dict[tag] = GenomicRegionSet("closest regions to: "+region.name)
-                    for t in target_dict[region.chrom]:
-                        res_dict[tag].add(t)
-                    if return_list: res_dist[tag] = [region.distance(r) for r in target_dict[region.chrom]]
-                else:
-                    res_dict[tag] = GenomicRegionSet("closest regions to: "+region.name)
-
-                    for r in target_dict[region.chrom]:
-                        d = region.distance(r)
-                        distances.append(d)
+                res_dict[tag] = GenomicRegionSet("closest regions to: " + tag)
+                for p, d in zip(partners[lo:hi], distances[lo:hi]):
+                    g = index.regions.region(p)
+                    g.data = str(d)
+                    res_dict[tag].add(g)
+                if return_list: res_dist[tag] = distances[lo:hi].tolist()
 
-                    sel_ind = sorted(range(len(distances)), key=lambda i: distances[i], reverse=False)[:top_N]
-                    for s in sel_ind:
-                        g = GenomicRegion(chrom=region.chrom, initial=target_dict[region.chrom][s].initial, 
-                            final=target_dict[region.chrom][s].final, name=target_dict[region.chrom][s].name, 
-                            orientation=target_dict[region.chrom][s].orientation, data=str(distances[s]))
-                        res_dict[tag].add(g)
-                    if return_list: res_dist[tag] = distances[sel_ind]
-
-                    
             if return_list:
                 return res_dict, res_dist
             else:
                 return res_dict
-        
+
+    def _associate(self, y, max_distance, strand_specific=False):
+        """Return three lists with an entry for every region of self (in sorted order): the regions of y at distance 0
+        (overlapping or adjacent), and the closest region of y before and after it (None if there is none closer
+        than max_distance). The regions of y are given as pairs (name, distance).
+        """
+        if not self.sorted: self.sort()
+        query = self.get_index().regions
+        index = y.get_index()
+        names = index.regions.names
+        if names is None: names = [None] * len(index)
+
+        touching = [[] for _ in range(len(query))]
+        rows, partners, distances = index.nearest(query, max_distance=1, ties=True, same_strand=strand_specific)
+        for r, p in zip(rows.tolist(), partners.tolist()):
+            touching[r].append((names[p], 0))
+
+        flanks = []
+        for side in ["left", "right"]:
+            flank = [None] * len(query)
+            rows, partners, distances = index.nearest(query, max_distance=max_distance, direction=side,
+                                                      overlaps=False, same_strand=strand_specific)
+            for r, p, d in zip(rows.tolist(), partners.tolist(), distances.tolist()):
+                if d > 0: flank[r] = (names[p], d)
+            flanks.append(flank)
+        return touching, flanks[0], flanks[1]
+
     def remove_duplicates(self):
         """Remove the duplicate regions and remain the unique regions. (No return)"""
         if self.sorted == False: self.sort()
-        #for i in range(len(self.sequences) - 1):
-        i = 0
-        loop = True
-        while loop:
-            try:
-                if self.sequences[i].toString() == self.sequences[i+1].toString():
-                    del self.sequences[i+1]
-                else:
-                    i += 1
-            except:
-                loop = False
+        index = self.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            rows = librgt.unique(index.coded())
+        else:
+            rows = np.flatnonzero(~index.regions.duplicate_mask())
+        if len(rows) == len(self): return
+        if self._columns is not None:
+            self.set_columns(index.regions.take(rows), sorted=True)
+        else:
+            self.sequences = [self.sequences[i] for i in rows.tolist()]
+            self.sorted = True
             
     def window(self,y,adding_length = 1000):
         """Return the overlapping regions of self and y with adding a specified number (1000, by default) of base pairs upstream and downstream of each region in self. In effect, this allows regions in y that are near regions in self to be detected.
@@ -1374,109 +1354,34 @@ class GenomicRegionSet:
         z = GenomicRegionSet(self.name + ' - ' + y.name)
         if len(self) == 0 or len(y) == 0: return self
         
-        # If there is overlap within self or y, they should be merged first. 
+        # The overlaps within y are merged by its index
         if self.sorted == False: 
             self.sort()
-        b = y.merge(w_return=True)
-        
-        iter_a = iter(self)
-        s = iter_a.next()
-        last_j = len(b) - 1
-        j = 0
-        cont_loop = True
-        pre_inter = 0
-        cont_overlap = False
-    
-        while cont_loop:
-            #print("Compare: "+s.__repr__()+"\t"+b[j].__repr__())
-            
-            #----------------------
-            #-----  --    ----    -----  ----
-            
-            # When the regions overlap
-            if s.overlap(b[j]):
-                if not cont_overlap: pre_inter = j
-                if whole_region: # Simply jump to next region
-                    try: 
-                        s = iter_a.next()
-                        j = pre_inter
-                        cont_overlap = False
-                        continue
-                    except:  cont_loop = False
-                
+        a = self.get_index().regions
+        rows, initials, finals = self._subtract_rows(y, whole_region)
+        if self._columns is not None:
+            z.set_columns(a.with_coordinates(rows, initials, finals), sorted=True)
+            return z
 
-                #------        -----      -------       ---        ------    -----  --
-                #   ------        --        ---       --------  ------       -----  -----
-                if s.initial < b[j].initial:
-                    
-                    #------        -----      -------
-                    #   ------        --        ---
-                    if s.final > b[j].final:
-                        s1 = GenomicRegion(chrom=s.chrom, initial=s.initial, final=b[j].initial,
-                                           name=s.name, orientation=s.orientation, data=s.data, proximity=s.proximity)
-                        s2 = GenomicRegion(chrom=s.chrom, initial=b[j].final, final=s.final,
-                                           name=s.name, orientation=s.orientation, data=s.data, proximity=s.proximity)
-                        z.add(s1)
-                        s = s2
-                        if j < last_j: j = j + 1
-                        cont_overlap = True
-                        continue
-                    else:
-                        s1 = GenomicRegion(chrom=s.chrom, initial=s.initial, final=b[j].initial,
-                                           name=s.name, orientation=s.orientation, data=s.data, proximity=s.proximity)
-                        z.add(s1)
-                        try: 
-                            s = iter_a.next()
-                            j = pre_inter
-                            cont_overlap = False
-                            continue
-                        except: cont_loop = False
-                    
-                elif s.final > b[j].final:
-                    
-                    #     ------  
-                    # ------
-                    s2 = GenomicRegion(chrom=s.chrom, initial=b[j].final, final=s.final,
-                                       name=s.name, orientation=s.orientation, data=s.data, proximity=s.proximity)
-                    s = s2
-                    if j < last_j: j = j + 1
-                    cont_overlap = True
-                    continue
-                else:
-                    
-                    #     ---       -----  --
-                    #   --------    -----  -----
-                    try: 
-                        s = iter_a.next()
-                        j = pre_inter
-                    except: cont_loop = False 
-                
-                if j == last_j: 
-                    try: 
-                        s = iter_a.next()
-                        j = pre_inter
-                    except: cont_loop = False 
-                else: j = j + 1
-                cont_overlap = True
-            
-            elif s < b[j]:
+        # Keep the regions which are not cut, create new ones for the remaining parts
+        for i, initial, final in zip(rows.tolist(), initials.tolist(), finals.tolist()):
+            s = self.sequences[i]
+            if s.initial == initial and s.final == final:
                 z.add(s)
-                try: 
-                    s = iter_a.next()
-                    j = pre_inter
-                    cont_overlap = False
-                except: cont_loop = False 
-            
-            elif s > b[j]:
-                if j == last_j:
-                    z.add(s)
-                    try: s = iter_a.next()
-                    except: cont_loop = False
-                else:
-                    j = j + 1
-                    cont_overlap = False
-                    
+            else:
+                z.add(GenomicRegion(chrom=s.chrom, initial=initial, final=final,
+                                    name=s.name, orientation=s.orientation, data=s.data, proximity=s.proximity))
         return z
+
+    def _subtract_rows(self, y, whole_region=False):
+        """Return the parts of the sorted regions of self not covered by y as arrays (rows, initials, finals),
+        computed by librgt if it is available and by the IntervalIndex of y otherwise."""
+        a = self.get_index().regions
+        index = y.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            return librgt.subtract(index.coded_query(a), index.coded(merged=True), whole_region)
+        return index.subtract_rows(a, whole_region)
         
     def subtract_aregion(self,y):
         """Return a GenomicRegionSet excluded the overlapping regions with y.
@@ -1538,57 +1443,43 @@ class GenomicRegionSet:
         """
         if self.sorted == False: self.sort()
         
-        if len(self.sequences) in [0, 1]:
+        if len(self) in [0, 1]:
             if w_return:
                 return self
             else:
                 pass
         else:
-            z = GenomicRegionSet(name=self.name)
-            prev_region = self.sequences[0]
-
-            if not namedistinct and not strand_specific:
-                for cur_region in self.sequences[1:]:
-                    if prev_region.overlap(cur_region):
-                        prev_region.initial = min(prev_region.initial, cur_region.initial)
-                        prev_region.final = max(prev_region.final, cur_region.final)
-                    else:
-                        z.add(prev_region)
-                        prev_region = cur_region
-                z.add(prev_region)
-                
-            elif namedistinct and not strand_specific:
-                for cur_region in self.sequences[1:]:
-                    if prev_region.overlap(cur_region) and prev_region.name == cur_region.name:
-                        prev_region.initial = min(prev_region.initial, cur_region.initial)
-                        prev_region.final = max(prev_region.final, cur_region.final)
-                    else:
-                        z.add(prev_region)
-                        prev_region = cur_region
-                z.add(prev_region)
-
-            elif not namedistinct and strand_specific:
-                for cur_region in self.sequences[1:]:
-                    if prev_region.overlap(cur_region) and prev_region.orientation == cur_region.orientation:
-                        prev_region.initial = min(prev_region.initial, cur_region.initial)
-                        prev_region.final = max(prev_region.final, cur_region.final)
-                    else:
-                        z.add(prev_region)
-                        prev_region = cur_region
-                z.add(prev_region)
-
-            elif namedistinct and strand_specific:
-                for cur_region in self.sequences[1:]:
-                    if prev_region.overlap(cur_region) and prev_region.name == cur_region.name and prev_region.orientation == cur_region.orientation:
-                        prev_region.initial = min(prev_region.initial, cur_region.initial)
-                        prev_region.final = max(prev_region.final, cur_region.final)
-                    else:
-                        z.add(prev_region)
-                        prev_region = cur_region
-                z.add(prev_region)
-
+            z = self._clustered(self.name, namedistinct=namedistinct, strand_specific=strand_specific)
             if w_return: return z
+            elif z.is_columnar(): self.set_columns(z.get_columns(), sorted=True)
             else: self.sequences = z.sequences
+
+    def _clustered(self, name, distance=0, namedistinct=False, strand_specific=False):
+        """Return a new GenomicRegionSet of the merged regions of the sorted set (see merge and cluster), computed by
+        librgt if it is available and by GenomicRegionColumns otherwise."""
+        index = self.get_index()
+        regions = index.regions
+        librgt = get_librgt()
+        if librgt is not None:
+            rows, finals = librgt.cluster(index.coded(), regions.segments(namedistinct, strand_specific), distance)
+        else:
+            rows, finals = regions.cluster_rows(namedistinct, strand_specific, distance)
+        z = GenomicRegionSet(name)
+        if self._columns is not None:
+            z.set_columns(regions.with_coordinates(rows, regions.initials[rows], finals), sorted=True)
+            return z
+
+        # Keep the first region of every cluster, a copy of it if the cluster is longer
+        clusters = []
+        for i, final in zip(rows.tolist(), finals.tolist()):
+            s = self.sequences[i]
+            if s.final != final:
+                s = copy.copy(s)
+                s.final = final
+            clusters.append(s)
+        z.sequences = clusters
+        z.sorted = True
+        return z
                 
     def combine(self, region_set, change_name=True, output=False):
         """Adding another GenomicRegionSet without merging the overlapping regions.
@@ -1599,7 +1490,21 @@ class GenomicRegionSet:
             - change_name -- Combine the names as a new name for the combined regions
             - output -- If TRUE, it returns a GenomicRegionSet; if FASLSE, it merge the regions in place.
         """
-        if output:
+        if self._columns is not None:
+            columns = self._columns.concatenate(region_set.get_columns())
+            if output:
+                a = GenomicRegionSet(name="")
+                a.set_columns(columns)
+            else:
+                a = self
+                a.set_columns(columns)
+            if change_name:
+                if a.name == "":
+                    a.name = region_set.name
+                else:
+                    a.name = a.name + " + " + region_set.name
+            if output: return a
+        elif output:
             a = GenomicRegionSet(name="")
             for s in self.sequences:
                 a.add(s)
@@ -1614,6 +1519,7 @@ class GenomicRegionSet:
             return a
         else:
             self.sequences.extend(region_set.sequences)
+            self._changed()
             if change_name:
                 if self.name == "":
                     self.name = region_set.name
@@ -1647,19 +1553,7 @@ class GenomicRegionSet:
         elif len(self) == 1:
             return self
         else:
-            z = GenomicRegionSet('Clustered region set')
-            previous = self.sequences[0]
-            for s in self.sequences[1:]:
-                s_ext = deepcopy(s)
-                s_ext.extend(max_distance,max_distance)
-                if s_ext.overlap(previous):
-                    previous.initial = min(previous.initial, s.initial)
-                    previous.final = max(previous.final, s.final)
-                else:
-                    z.add(previous)
-                    previous = s
-            z.add(previous)
-            return z
+            return self._clustered('Clustered region set', distance=max_distance)
         
     def flank(self,size):
         """Return two flanking intervals with given size from both ends of each region.
@@ -1737,70 +1631,32 @@ class GenomicRegionSet:
         return similarity
 
     def jaccard_c(self, query):
-        # Determine path of shared library
-        Lib = Library_path()
-        lib = cdll.LoadLibrary(Lib.get_c_rgt())
-
-        # Bind library
-        ctypes_jaccardC = lib.jaccard
-
-        # Specify data types
-        ctypes_jaccardC.argtypes = [POINTER(c_char_p), POINTER(c_int), POINTER(c_int), c_int, POINTER(c_char_p),
-                                    POINTER(c_int), POINTER(c_int), c_int]
-        ctypes_jaccardC.restype = c_double
-
         if not self.sorted:
             self.sort()
-        if not query.sorted:
-            query.sort()
-
-        assert self.sorted
-        assert query.sorted
-
-        # Convert to ctypes
-        chroms_self_python = [gr.chrom for gr in self.sequences]
-        chroms_self_c = (c_char_p * len(chroms_self_python))(*chroms_self_python)
-        #print('Converted self.chroms to c', str(chroms_self_python[:4]), '...')
-
-        chroms_query_python = [gr.chrom for gr in query.sequences]
-        chroms_query_c = (c_char_p * len(chroms_query_python))(*chroms_query_python)
-        #print('Converted query.chroms to c', str(chroms_query_python[:4]), '...')
+        a = self.get_index().merged()
+        index = query.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            return librgt.jaccard(index.coded_query(a), index.coded(merged=True))
 
-        initials_self_python = [gr.initial for gr in self.sequences]
-        initials_self_c = (c_int * len(initials_self_python))(*initials_self_python)
-        #print('Converted self.initials to c', str(initials_self_python[:4]), '...')
-
-        initials_query_python = [gr.initial for gr in query.sequences]
-        initials_query_c = (c_int * len(initials_query_python))(*initials_query_python)
-        #print('Converted query.initials to c', str(initials_query_python[:4]), '...')
-
-        finals_self_python = [gr.final for gr in self.sequences]
-        finals_self_c = (c_int * len(finals_self_python))(*finals_self_python)
-        #print('Converted self.finals to c', str(finals_self_python[:4]), '...')
-
-        finals_query_python = [gr.final for gr in query.sequences]
-        finals_query_c = (c_int * len(finals_query_python))(*finals_query_python)
-        #print('Converted query.finals to c', str(finals_query_python[:4]), '...')
-
-        #print('Converted to ctypes')
-
-        # Call C-function
-        return ctypes_jaccardC(chroms_self_c, initials_self_c, finals_self_c, len(self), chroms_query_c,
-                               initials_query_c, finals_query_c, len(query))
+        rows, initials, finals = index.intersect_rows(a, OverlapType.OVERLAP)
+        inter = int((finals - initials).sum(dtype=np.int64))
+        uni = int(a.lengths().sum(dtype=np.int64)) + int(index.merged().lengths().sum(dtype=np.int64)) - inter
+        return inter / uni if uni else float("nan")
 
     def within_overlap(self):
         """Check whether there is overlapping within or not."""
-        refer_posi = GenomicRegion(name="reference",chrom="chr1",initial=0,final=0)
         if self.sorted == False: self.sort()
-        
-        for s in self:
-            if s.overlap(refer_posi):
-                return True
-            refer_posi = s
-        return False
+        index = self.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            return librgt.within_overlap(index.coded())
+        return bool(index.regions.overlap_mask().any())
 
     def total_coverage(self):
         """Return the sum of all lengths of regions."""
+        if self._columns is not None:
+            return int(self._columns.lengths().sum(dtype=np.int64))
         length = 0
         for s in self:
             try: length = length + len(s)
@@ -1836,7 +1692,7 @@ class GenomicRegionSet:
         
     def random_regions(self, organism, total_size=None, multiply_factor=1, 
                        overlap_result=True, overlap_input=True, 
-                       chrom_X=False, chrom_M=False, filter_path=None):
+                       chrom_X=False, chrom_M=False, filter_path=None, seed=None):
         """Return a GenomicRegionSet which contains the random regions generated by given entries and given number on the given organism.
         
         *Keyword arguments:*
@@ -1849,110 +1705,40 @@ class GenomicRegionSet:
             - chrom_X -- The result covers chromosome X or not. (True/False)
             - chrom_M -- The result covers mitochondria chromosome or not. (True/False)
             - filter_path -- Given the path of filter BED file
+            - seed -- Seed of the random numbers (default None: drawn from the random module, see RegionSampler)
         
         *Return:*
 
-            - z -- A GenomicRegionSet which contains the random regions
-        """
-
-        def list_max(chrom_list, result_map):
-            """Generate a list containing maximum length for each chromosome."""
-            map_max = []  # Store the minimum length corresponding to chrom_list
-            for ch in chrom_list:
-                map_max.append(max([len(s) for s in result_map.any_chrom(ch)]))
-            return map_max
+            - z -- A columnar GenomicRegionSet which contains the random regions, with the lengths of the entries in
+                   their order
 
-        def randoming(length, result_map, chrom_list, map_max, choices):
-            """Return a new GenomicRegion as the result of randomization."""
-            cont_loop = True
-            candidate_chrom = [chrom_list[i] for i, l in enumerate(map_max) if l > length]
-
-            while True:
-                ch = weighted_choice(choices)
-                if ch in candidate_chrom: break
-
-            while cont_loop:
-                # try:
-                regions = result_map.any_chrom(ch, len_min=length)
-                sample = random.choice(regions)
-                if len(sample) < length:
-                    print("1", end="")
-                    continue
-                else:
-                    # print("2", end="")
-                    random_posi = random.randint(sample.initial, sample.final - length)
-                    # print(sample.toString())
-                    # print(random_posi)
-                    cont_loop = False
-
-                #except:
-                    #print("3", end="")
-                #    continue
-
-            return GenomicRegion(chrom=sample.chrom,initial=random_posi,final=random_posi + length)
-
-            #raise Exception("There is no further space for randomization on the genome.")
-
-        def weighted_choice(choices):
-            total = sum(w for c, w in choices)
-            r = random.uniform(0, total)
-            upto = 0
-            for c, w in choices:
-                if upto + w > r:
-                    return c
-                upto += w
-            assert False, "Shouldn't get here"
-
-        ############################################
-        #input_map = copy.deepcopy(self)
-
-        input_map = self
-        input_num = len(self)
-        input_list = [len(x) for x in self.sequences]
-        result_list = []
+        .. note:: Every placement of a random region inside the allowed part of the genome is equally likely.
+        """
+        input_list = self.get_columns().lengths()
         # Total number and lengths of random regions
-        if total_size:
-            for i in range(int(total_size)):
-                result_list.append(input_list[i % input_num])
+        if len(input_list) == 0:
+            result_list = input_list
+        elif total_size:
+            result_list = np.resize(input_list, int(total_size))
         elif multiply_factor > 0:
-            for i in range(int(multiply_factor * input_num)):
-                result_list.append(input_list[i % input_num])
+            result_list = np.resize(input_list, int(multiply_factor * len(input_list)))
+        else:
+            result_list = input_list[:0]
 
         # Maps
         # Fetching the chromosome length from data
         chrom_map = GenomicRegionSet("chrom_map")
         chrom_map.get_genome_data(organism, chrom_X=chrom_X, chrom_M=chrom_M)
-        chrom_list = chrom_map.get_chrom()
         if filter_path:
             filter_map = GenomicRegionSet('filter')
-            filter_map.read_bed(filter_path)
+            filter_map.read_bed(filter_path, columnar=True)
             chrom_map = chrom_map.subtract(filter_map)
+        if not overlap_input:
+            chrom_map = chrom_map.subtract(self)
 
-        if overlap_input:
-            result_map = chrom_map
-        else:
-            result_map = chrom_map.subtract(input_map)
-
+        sampler = RegionSampler(chrom_map.get_index().merged(), seed=seed)
         z = GenomicRegionSet(name="random regions")
-        map_max = list_max(chrom_list, result_map)
-
-        # Generate pk which stores the total length of all regions in each chromosome
-        choices = []
-        for ch in chrom_list:
-            cov = result_map.any_chrom(ch)
-            pk = sum([len(s) for s in cov])
-
-            choices.append([ch,pk])
-
-
-        for length in result_list:
-            new_region = randoming(length, result_map, chrom_list, map_max, choices)
-            z.add(new_region)
-            if overlap_result == False:
-                result_map = result_map.subtract_aregion(new_region)
-                map_max[chrom_list.index(new_region.chrom)] = max(
-                    [len(s) for s in result_map.any_chrom(new_region.chrom)])
-                choices[chrom_list.index(new_region.chrom)][1] -= len(new_region)
+        z.set_columns(sampler.sample(result_list, overlap=overlap_result))
         return z
 
     def trim_by(self, background):
@@ -2023,6 +1809,22 @@ class GenomicRegionSet:
 
             - A list of regions which belongs to given chromosome.
         """
+        if self._columns is not None:
+            lengths = self._columns.lengths()
+            selected = self._columns.chroms == self._columns.chrom_code(chrom)
+            if len_min != False: selected &= lengths >= len_min
+            if len_max != False: selected &= lengths <= len_max
+            res = self._columns.take(selected)
+            if return_list:
+                return res.to_regions()
+            elif return_regionset:
+                z = GenomicRegionSet(chrom)
+                z.set_columns(res, sorted=self.sorted)
+                return z
+            else:
+                self._columns = res
+            return
+
         if len_min == False and len_max == False:
             res = [s for s in self if s.chrom == chrom]      
         elif len_min > 0 and len_max == False:
@@ -2120,10 +1922,7 @@ class GenomicRegionSet:
 
             - region -- A GenomicRegion to be checked.
         """
-        for s in self:
-            if s.overlap(region): return True
-            else: continue
-        return False
+        return len(self.get_index().find(region.chrom, region.initial, region.final)) > 0
 
     def complement(self, organism, chrom_X=True, chrom_Y=False, chrom_M=False):
         """Return the complement GenomicRegionSet for the given organism.
@@ -2141,8 +1940,7 @@ class GenomicRegionSet:
         """
         g = GenomicRegionSet("complement_"+self.name)
         g.get_genome_data(organism, chrom_X, chrom_Y, chrom_M)
-        g.subtract(self)
-        return g
+        return g.subtract(self)
 
     def count_by_region(self, region):
         """Return the number of intersection regions with the given GenomicRegion.
@@ -2176,64 +1974,19 @@ class GenomicRegionSet:
         if len(self) == 0: return None
         if len(regionset) == 0: return [0]*len(self)
 
-        #a = copy.deepcopy(con_self)
-        #b = copy.deepcopy(regionset)
         if not self.sorted: self.sort()
-        if not regionset.sorted: regionset.sort()
-        counts = []
-        
-        iter_a = iter(self)
-        s = iter_a.next()
-        last_j = len(regionset)-1
-        j = 0
-        cont_loop = True
-        pre_inter = 0
-        cont_overlap = False
-        c = 0
-        while cont_loop:
-            # When the regions overlap
-            #print(str(s)+"\t\t"+str(b[j]))
-            if s.overlap(regionset[j]):
-                c += 1
-                if not cont_overlap: pre_inter = j
-                if j == last_j: 
-                    try: 
-                        s = iter_a.next()
-                        counts.append(c)
-                        c = 0
-                        j = pre_inter
-                    except: 
-                        cont_loop = False
-                        counts.append(c)
-                else: 
-                    j += 1
-                cont_overlap = True
-            
-            elif s < regionset[j]:
-                try: 
-                    s = iter_a.next()
-                    counts.append(c)
-                    c = 0
-                    j = pre_inter
-                    cont_overlap = False
-                except: 
-                    cont_loop = False
-                    counts.append(c)
-            
-            elif s > regionset[j]:
-                if j == last_j:
-                    try:
-                        s = iter_a.next()
-                        counts.append(c)
-                        c = 0
-
-                    except:
-                        cont_loop = False
-                        counts.append(c)
-                else:
-                    j = j + 1
-                    cont_overlap = False
-        return counts
+        counts, lengths = self._sum_overlaps(regionset)
+        return counts.tolist()
+
+    def _sum_overlaps(self, y):
+        """Return the number and the total length of the regions of y overlapping each region of the sorted set as
+        arrays, computed by librgt if it is available and by the IntervalIndex of y otherwise."""
+        a = self.get_index().regions
+        index = y.get_index()
+        librgt = get_librgt()
+        if librgt is not None:
+            return librgt.sum_overlaps(index.coded_query(a), index.coded())
+        return index.count_overlaps(a), index.overlap_lengths(a)
         
     def covered_by_aregion(self, region):
         """Return a GenomicRegionSet which includes all the regions covered by a given region.
@@ -2246,9 +1999,9 @@ class GenomicRegionSet:
 
             - A GenomicRegionSet containing the regions within the defined interval.
         """
-        region_set = GenomicRegionSet("Query")
-        region_set.add(region)
-        return self.intersect(region_set, mode=OverlapType.ORIGINAL)
+        index = self.get_index()
+        rows = index.find(region.chrom, region.initial, region.final)
+        return self._new_set("Query", index.regions.take(rows), sorted=True)
 
     def replace_region_name(self, regions, combine=False):
         """Replace the region names by the given GenomicRegionSet.
@@ -2268,8 +2021,9 @@ class GenomicRegionSet:
 
             if not self.sorted: self.sort()
             if not regions.sorted: regions.sort()
+            self._changed()
 
-            iter_a = iter(self)
+            iter_a = iter(self.sequences)
             s = iter_a.next()
             last_j = len(regions) - 1
             j = 0
@@ -2312,15 +2066,16 @@ class GenomicRegionSet:
 
             - regions -- A GenomicRegionSet as the source for the strand.
         """
+        self._changed()
         if not regions and reverse:
-            for r in self:
+            for r in self.sequences:
                 if r.orientation == "+":
                     r.orientation = "-"
                 elif r.orientation == "-":
                     r.orientation = "+"
             return
         elif all=="+" or all=="-":
-            for r in self:
+            for r in self.sequences:
                 r.orientation = all
             return
 
@@ -2330,7 +2085,7 @@ class GenomicRegionSet:
             if not self.sorted: self.sort()
             if not regions.sorted: regions.sort()
 
-            iter_a = iter(self)
+            iter_a = iter(self.sequences)
             s = iter_a.next()
             last_j = len(regions) - 1
             j = 0
@@ -2399,7 +2154,8 @@ class GenomicRegionSet:
         if isinstance(names, list): targets = names
         elif isinstance(names.genes, list): targets = names.genes
         targets = [ x.upper() for x in targets ]
-        for gr in self:
+        if load_score: self._changed()
+        for gr in (self.sequences if load_score else self):
 
             if gr.name.upper() in targets and not background:
                 if load_score:
@@ -2460,69 +2216,15 @@ class GenomicRegionSet:
 
             - regionset -- A GenomicRegionSet as the signal for calculate the coverage.
 
-        .. note:: The length of the result list is the same as self GenomicRegionSet.
+        .. note:: The length of the result list is the same as self GenomicRegionSet. The coverage of a region is the
+                  total length of the overlapping regions of regionset divided by its length.
         """
         if len(self) == 0: return None
         if len(regionset) == 0: return [0]*len(self)
 
         if not self.sorted: self.sort()
-        if not regionset.sorted: regionset.sort()
-        coverages = []
-        
-        iter_a = iter(self)
-        s = iter_a.next()
-        last_j = len(regionset)-1
-        j = 0
-        cont_loop = True
-        pre_inter = 0
-        cont_overlap = False
-        c = GenomicRegionSet("coverage")
-
-        while cont_loop:
-            # When the regions overlap
-            #print(str(s)+"\t\t"+str(b[j]))
-            if s.overlap(regionset[j]):
-
-                c.add(regionset[j])
-                if not cont_overlap: pre_inter = j
-                if j == last_j: 
-                    coverages.append(c.total_coverage()/len(s))
-                    try: 
-                        s = iter_a.next()
-                        c = GenomicRegionSet("coverage")
-                        j = pre_inter
-                    except: 
-                        cont_loop = False
-                else: 
-                    j += 1
-                cont_overlap = True
-
-            
-            elif s < regionset[j]:
-                overlapping = False
-                coverages.append(c.total_coverage()/len(s))
-                try: 
-                    s = iter_a.next()
-                    c = GenomicRegionSet("coverage")
-                    j = pre_inter
-                    cont_overlap = False
-                except: 
-                    cont_loop = False
-
-            elif s > regionset[j]:
-                overlapping = False
-                if j == last_j:
-                    coverages.append(c.total_coverage()/len(s))
-                    try:
-                        s = iter_a.next()
-                        c = GenomicRegionSet("coverage")
-
-                    except:
-                        cont_loop = False
-                else:
-                    j = j + 1
-                    cont_overlap = False
-        return coverages
+        counts, lengths = self._sum_overlaps(regionset)
+        return [l / n for l, n in zip(lengths.tolist(), self.get_index().regions.lengths().tolist())]
 
     def extract_blocks(self, keep_name=False):
         """Extract the exon information from self.data and add them into the self GenomicRegionSet."""
@@ -2552,7 +2254,8 @@ class GenomicRegionSet:
     def add_associated_gene_data(self, organism):
         """Add the associated gene symbol to data"""
         a = self.gene_association(organism=organism, show_dis=True)
-        for i,r in enumerate(self):
+        self._changed()
+        for i,r in enumerate(self.sequences):
             r.data = r.data + "\t"+a[i].name
 
     def longest_region(self, return_set=False):
@@ -2664,80 +2367,33 @@ class GenomicRegionSet:
         return(z)
 
     def get_distance(self, y, ignore_overlap=False, strand_specific=False, threshDist=50000):
-        """Return a list of distances between the closest regions from two region sets."""
-        if not self.sorted: self.sort()
-        if not y.sorted: y.sort()
+        """Return a list of distances between the closest regions from two region sets.
 
+        *Keyword arguments:*
 
+            - y -- the GenomicRegionSet which to compare with
+            - ignore_overlap -- report the closest regions on both sides instead of the overlapping ones
+            - strand_specific -- only consider the regions of y with the same orientation
+            - threshDist -- maximum distance
 
+        *Return:*
 
-        last_j = len(y) - 1
-        j = 0
-        if strand_specific: pre_inter = [0, 0]
-        else: pre_inter = 0
+            - A list of [name of the region of self, distance, name of the region of y] for every overlapping (or
+              adjacent) region of y with distance "0", or if there is none, for the closest regions of y before
+              ("-distance") and after ("+distance") the region of self.
+        """
+        touching, left, right = self._associate(y, threshDist, strand_specific)
         res = []
-        for s in self:
-            cont_loop = True
-            cont_overlap = False
-            asso_names = {"overlap": [], "close_l": [], "close_r": []}
-            while cont_loop:
-                if strand_specific and s.orientation != y[j].orientation:
-                    if j == last_j: cont_loop = False
-                    else: j += 1
-                else:
-                    d = s.distance(y[j])
-                    if d == 0:
-                        asso_names["overlap"].append([s.name, str(0), y[j].name])
-                        if not cont_overlap:
-                            if strand_specific and s.orientation == "+": pre_inter[0] = j
-                            elif strand_specific and s.orientation == "-": pre_inter[1] = j
-                            elif not strand_specific: pre_inter = j
-                        if j == last_j: cont_loop = False
-                        else:
-                            j += 1
-                            cont_overlap = True
-                    elif asso_names["overlap"] and d != 0:
-                        if strand_specific:
-                            if pre_inter[0] > 0 and pre_inter[1] > 0: j = min(pre_inter)
-                            elif pre_inter[0] == 0 and pre_inter[1] > 0: j = pre_inter[1]
-                            elif pre_inter[0] > 0 and pre_inter[1] == 0: j = pre_inter[0]
-                        elif s.chrom == y[j].chrom and pre_inter > 0:
-                            j = pre_inter
-                        cont_loop = False
-                    elif 0 < d < threshDist:
-                        if s > y[j]:
-                            asso_names["close_l"] = [[s.name, "-"+str(d), y[j].name]]
-                        elif s < y[j]:
-                            asso_names["close_r"] = [[s.name, "+"+str(d), y[j].name]]
-                            cont_loop = False
-                        if j == last_j: cont_loop = False
-                        else: j += 1
-                    elif s < y[j]:
-                        if strand_specific and s.orientation == "+":
-                            if s.chrom == y[j].chrom and pre_inter[0] > 0:
-                                j = pre_inter[0]
-                        elif strand_specific and s.orientation == "-":
-                            if s.chrom == y[j].chrom and pre_inter[1] > 0:
-                                j = pre_inter[1]
-                        elif s.chrom == y[j].chrom and pre_inter > 0:
-                            j = pre_inter
-                        cont_loop = False
-                    elif s > y[j]:
-                        if j == last_j: cont_loop = False
-                        else: j += 1
-
-            if asso_names["overlap"] and not ignore_overlap:
-                last_one = ["x", 0, "x"]
-                for line in asso_names["overlap"]:
-                    if line[2] == last_one[2]: continue
-                    else:
-                        res += [line]
-                        last_one = line
-            if asso_names["close_l"]:
-                res += asso_names["close_l"]
-            if asso_names["close_r"]:
-                res += asso_names["close_r"]
-
+        for s, t, l, r in zip(self, touching, left, right):
+            if t and not ignore_overlap:
+                last_one = None
+                for name, d in t:
+                    if name == last_one: continue
+                    res.append([s.name, str(0), name])
+                    last_one = name
+            else:
+                if l: res.append([s.name, "-" + str(l[1]), l[0]])
+                if r: res.append([s.name, "+" + str(r[1]), r[0]])
         return res
 
     def cut_regions(self, y, keep="upstream"):
@@ -2784,7 +2440,8 @@ class GenomicRegionSet:
 
     def get_promoters(self, length=1000):
         promoters = GenomicRegionSet("promoters")
-        for s in self:
+        self._changed()
+        for s in self.sequences:
             if s.orientation == "+":
                 s.initial, s.final = max(s.initial - length, 0), s.initial
             else:
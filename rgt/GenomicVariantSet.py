@@ -8,6 +8,7 @@ GenomicVariantSet represents list of GenomicVariant.
 from __future__ import print_function
 from rgt.GenomicVariant import GenomicVariant
 from rgt.GenomicRegionSet import GenomicRegionSet
+from rgt.Util import OverlapType
 import vcf
 
 class GenomicVariantSet(GenomicRegionSet):
@@ -31,6 +32,7 @@ class GenomicVariantSet(GenomicRegionSet):
         """
         self.sequences.sort(cmp = GenomicVariant.__cmp__)
         self.sorted = True
+        self._changed()
          
     def read_vcf(self, vcf_path):
         """
@@ -116,18 +118,6 @@ class GenomicVariantSet(GenomicRegionSet):
         """
         self.sequences = filter(lambda x: eval(str(x.info[at]) + op + str(t)), self.sequences)
     
-    def _reconstruct_info(self, GenomicRegionSet):
-        """Reconstruct all information for GenomicVariantSet that get lost when using a GenomicRegionSet method"""
-        tmp_sequences = []
-        for genomic_region in GenomicRegionSet:
-            c, p = genomic_region.chrom, genomic_region.initial
-            for var in self.sequences:
-                if var.chrom == c and var.pos == p: #1:1 mapping
-                    tmp_sequences.append(var)
-                    break
-        
-        return tmp_sequences
-    
     def subtract(self, x):
         """
         Subtract GenomicVariantSet.
@@ -136,9 +126,15 @@ class GenomicVariantSet(GenomicRegionSet):
 
         - x -- instance of GenomicVariantSet which is subtracted
         
+        .. note:: The remaining variants are selected by their positions in the sorted set, so every variant keeps
+                  all its information.
+        
         """
-        tmp = GenomicRegionSet.subtract(self, x, whole_region=False)
-        self.sequences = self._reconstruct_info(tmp)
+        if len(self) == 0 or len(x) == 0: return
+        if not self.sorted: self.sort()
+        # A variant covers a single position, so it is either kept or removed as a whole
+        rows = self._subtract_rows(x, whole_region=True)[0]
+        self.sequences = [self.sequences[i] for i in rows.tolist()]
     
     def intersect(self, x):
         """
@@ -146,74 +142,18 @@ class GenomicVariantSet(GenomicRegionSet):
         
         *Keyword arguments:*
 
-        - x -- instance of GenomicVariantSet
+        - x -- instance of GenomicVariantSet (or any GenomicRegionSet)
         
-        """
+        .. note:: Keeps the variants overlapping x (as OverlapType.ORIGINAL), selected by their positions in the sorted
+                  set, so every variant keeps all its information.
         
-        tmp = self._intersect(x)
-        self.sequences = self._reconstruct_info(tmp)
-    
-    def _intersect(self, y, rm_duplicates=False):
-        """Return the overlapping regions with three different modes.
-                   
-        (mode = OverlapType.ORIGINAL)
-        Return the regions of original GenomicRegionSet which have any intersections with y.
-        
-            Keyword arguments:
-            y -- the GenomicRegionSet which to compare with
-            
-            Return:
-            z -- the regions of original GenomicRegionSet which have any intersections with y
-            
-            Graphical explanation:
-            self       ----------              ------
-            y              ----------                    ----
-            Result     ----------
-            
         """
-        a = self
-        b = y
-        
-        z = GenomicRegionSet(a.name + ' + ' + b.name)
-        # XXX - someone putted an special symbol and spaces in the name! this is used as file name, never use strange characters.
-        if len(a) == 0 or len(b) == 0: return z
-        
-        else:
-            # If there is overlap within self or y, they should be merged first. 
-            if a.sorted == False: a.sort()
-            if b.sorted == False: b.sort()
-            
-            iter_a = iter(a)
-            s = iter_a.next()
-            last_j = len(b)-1
-            j = 0
-            cont_loop = True
-                 
-            ########################### OverlapType.ORIGINAL ###################################
-            while cont_loop:
-                #print(str(s),"\t",str(b[j]))
-                # When the regions overlap
-                if s.overlap(b[j]):
-                    z.add(s)
-                    
-                    
-                    try: s = iter_a.next()
-                    except: cont_loop = False
-                    
-                elif s < b[j]:
-                    try: s = iter_a.next()
-                    except: cont_loop = False
-                elif s > b[j]:
-                    if j == last_j: cont_loop = False
-                    else: j = j + 1
-                else:
-                    try: s = iter_a.next()
-                    except: cont_loop = False
-                        
-            if rm_duplicates: 
-                z.remove_duplicates()
-            
-            return z
+        if len(self) == 0 or len(x) == 0:
+            self.sequences = []
+            return
+        if not self.sorted: self.sort()
+        rows = self._intersect_rows(x, OverlapType.ORIGINAL)[1]
+        self.sequences = [self.sequences[i] for i in rows.tolist()]
     
     
 if __name__ == '__main__':
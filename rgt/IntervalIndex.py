@@ -0,0 +1,412 @@
+"""
+IntervalIndex
+===================
+IntervalIndex indexes the regions of a GenomicRegionSet for repeated overlap and nearest-region queries. It keeps a
+sorted copy of the regions (GenomicRegionColumns), the merged regions and an implicit augmented interval tree over the
+sorted arrays.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+from bisect import bisect_left
+import numpy as np
+# Internal
+from rgt.GenomicRegionColumns import genome_keys, expand_ranges
+from rgt.Util import OverlapType
+
+# Subtrees up to this level are scanned linearly instead of being descended
+TREE_SCAN_LEVEL = 3
+
+
+class IntervalIndex(object):
+    """*Keyword arguments:*
+
+        - columns -- GenomicRegionColumns holding the regions to index.
+        - source -- The storage of the GenomicRegionSet the columns were taken from, used to detect changes.
+        - fingerprint -- Fingerprint of the regions of a list storage (see GenomicRegionSet.get_index).
+
+    .. note:: Chromosomes are coded by twice their position in the sorted chromosome names of the index. Chromosomes
+              of a query which are not in the index get the odd code in between, so that no region matches them.
+    """
+
+    def __init__(self, columns, source=None, fingerprint=None):
+        self.source = source
+        self.fingerprint = fingerprint
+        self.size = len(columns)
+        if columns.is_sorted():
+            self.regions = columns
+        else:
+            self.regions = columns.take(columns.sort_index())
+        self.chroms = self.regions.chroms.astype(np.int64) * 2
+        self.starts = genome_keys(self.chroms, self.regions.initials)
+        self.finals = genome_keys(self.chroms, self.regions.finals)
+        self.reaches = genome_keys(self.chroms, self.regions.reaches())
+        self._merged = None
+        self._merged_starts = None
+        self._merged_reaches = None
+        self._reach_max = None
+        self._final_max = None
+        self._sorted_reaches = None
+        self._reach_order = None
+        self._length_sums = None
+        self._tree = None
+        self._coded = {}
+        self._classes = None
+        self._by_reach = None
+        self._strand_indexes = {}
+
+    def __len__(self):
+        return self.size
+
+    def describes(self, source, fingerprint=None):
+        """Return True, if the index was built from the given storage, its size did not change and the regions still
+        have the given fingerprint."""
+        return source is self.source and len(source) == self.size and fingerprint == self.fingerprint
+
+    def query_chroms(self, columns):
+        """Return the chromosome codes of the given GenomicRegionColumns in the coding of the index."""
+        names = self.regions.chrom_names
+        codes = []
+        for c in columns.chrom_names:
+            pos = bisect_left(names, c)
+            if pos < len(names) and names[pos] == c:
+                codes.append(2 * pos)
+            else:
+                codes.append(2 * pos - 1)
+        return np.array(codes or [0], dtype=np.int64)[columns.chroms]
+
+    def merged(self):
+        """Return the merged regions as GenomicRegionColumns (built on first use)."""
+        if self._merged is None:
+            self._merged = self.regions.merge()
+            chroms = self._merged.chroms.astype(np.int64) * 2
+            self._merged_starts = genome_keys(chroms, self._merged.initials)
+            self._merged_reaches = genome_keys(chroms, self._merged.reaches())
+        return self._merged
+
+    def coded(self, merged=False):
+        """Return the sorted (or merged) regions as a tuple (chroms, initials, finals) of contiguous int32 arrays in the
+        chromosome coding of the index, as taken by LibRGT."""
+        if merged not in self._coded:
+            regions = self.merged() if merged else self.regions
+            self._coded[merged] = self.coded_query(regions, (regions.chroms * 2).astype(np.int32))
+        return self._coded[merged]
+
+    def coded_query(self, query, chroms=None):
+        """Return the given GenomicRegionColumns as a tuple (chroms, initials, finals) of contiguous int32 arrays in
+        the chromosome coding of the index."""
+        if chroms is None:
+            chroms = self.query_chroms(query).astype(np.int32)
+        return chroms, np.ascontiguousarray(query.initials, dtype=np.int32), \
+            np.ascontiguousarray(query.finals, dtype=np.int32)
+
+    def overlap_ranges(self, query):
+        """Return the arrays (lo, hi) such that the merged regions [lo[i]:hi[i]] overlap the i-th query region.
+
+        *Keyword arguments:*
+
+            - query -- GenomicRegionColumns of the regions to look up.
+        """
+        self.merged()
+        chroms = self.query_chroms(query)
+        hi = np.searchsorted(self._merged_starts, genome_keys(chroms, query.finals), side="left")
+        lo = np.searchsorted(self._merged_reaches, genome_keys(chroms, query.initials), side="right")
+        return lo, np.maximum(hi, lo)
+
+    def intersect_rows(self, query, mode=OverlapType.OVERLAP):
+        """Return the intersection of the query regions with the index as arrays (rows, initials, finals), where
+        rows are the positions of the query regions each result region belongs to.
+
+        *Keyword arguments:*
+
+            - query -- Sorted GenomicRegionColumns; for OverlapType.OVERLAP they have to be merged as well.
+            - mode -- OverlapType.OVERLAP, OverlapType.ORIGINAL or OverlapType.COMP_INCL.
+        """
+        if mode == OverlapType.OVERLAP:
+            lo, hi = self.overlap_ranges(query)
+            rows, partners = expand_ranges(lo, hi - lo)
+            merged = self.merged()
+            return (rows, np.maximum(query.initials[rows], merged.initials[partners]),
+                    np.minimum(query.finals[rows], merged.finals[partners]))
+
+        chroms = self.query_chroms(query)
+        starts = genome_keys(chroms, query.initials)
+        if mode == OverlapType.ORIGINAL:
+            # Any region starting before the end of a query region has to reach beyond its initial position
+            if self._reach_max is None:
+                self._reach_max = np.maximum.accumulate(self.reaches)
+            before = np.searchsorted(self.starts, genome_keys(chroms, query.finals), side="left")
+            hit = (before > 0) & (self._reach_max[before - 1] > starts)
+        else:
+            # A region starting at or before a query region has to end at or after its final position
+            # (empty query regions have to lie strictly inside)
+            if self._final_max is None:
+                self._final_max = np.maximum.accumulate(self.finals)
+            empty = query.initials == query.finals
+            before = np.where(empty, np.searchsorted(self.starts, starts, side="left"),
+                              np.searchsorted(self.starts, starts, side="right"))
+            reach = self._final_max[before - 1]
+            hit = (before > 0) & np.where(empty, reach > starts, reach >= genome_keys(chroms, query.finals))
+        rows = np.flatnonzero(hit)
+        return rows, query.initials[rows], query.finals[rows]
+
+    def subtract_rows(self, query, whole_region=False):
+        """Return the parts of the query regions not covered by the index as arrays (rows, initials, finals).
+
+        *Keyword arguments:*
+
+            - query -- GenomicRegionColumns of the regions to subtract from.
+            - whole_region -- Remove the query regions overlapping the index completely instead of cutting them.
+        """
+        lo, hi = self.overlap_ranges(query)
+        counts = hi - lo
+        if whole_region:
+            rows = np.flatnonzero(counts == 0)
+            return rows, query.initials[rows], query.finals[rows]
+
+        # A region overlapped by k merged regions leaves (at most) k + 1 pieces
+        merged = self.merged()
+        rows, pieces = expand_ranges(lo, counts + 1)
+        last = len(merged) - 1
+        initials = query.initials[rows]
+        finals = query.finals[rows]
+        piece_initials = np.where(pieces == lo[rows], initials, merged.finals[np.clip(pieces - 1, 0, last)])
+        piece_finals = np.where(pieces == hi[rows], finals, merged.initials[np.clip(pieces, 0, last)])
+        piece_initials = np.maximum(piece_initials, initials)
+        piece_finals = np.minimum(piece_finals, finals)
+        keep = (counts[rows] == 0) | (piece_initials < piece_finals)
+        return rows[keep], piece_initials[keep], piece_finals[keep]
+
+    def _overlap_bounds(self, query):
+        """Return the arrays (started, ended) of the number of indexed regions starting before the end of each query
+        region and of those ending before its start, in the order of their starts and of their reaches."""
+        if self._sorted_reaches is None:
+            self._reach_order = np.argsort(self.reaches, kind="mergesort")
+            self._sorted_reaches = self.reaches[self._reach_order]
+        chroms = self.query_chroms(query)
+        started = np.searchsorted(self.starts, genome_keys(chroms, query.finals), side="left")
+        ended = np.searchsorted(self._sorted_reaches, genome_keys(chroms, query.initials), side="right")
+        return started, ended
+
+    def count_overlaps(self, query):
+        """Return the number of indexed regions overlapping each query region."""
+        # Regions starting before the end, minus those ending before the start
+        started, ended = self._overlap_bounds(query)
+        return started - ended
+
+    def overlap_lengths(self, query):
+        """Return the total length of the indexed regions overlapping each query region."""
+        started, ended = self._overlap_bounds(query)
+        if self._length_sums is None:
+            lengths = self.regions.lengths().astype(np.int64)
+            self._length_sums = (np.concatenate(([0], np.cumsum(lengths))),
+                                 np.concatenate(([0], np.cumsum(lengths[self._reach_order]))))
+        by_start, by_reach = self._length_sums
+        return by_start[started] - by_reach[ended]
+
+    def _length_classes(self):
+        """Return the regions grouped by the binary order of magnitude of their length, as a list of tuples
+        (positions, starts, reaches, longest length) with the positions in self.regions."""
+        if self._classes is None:
+            lengths = self.reaches - self.starts
+            orders = np.frexp(lengths)[1]
+            self._classes = []
+            for order in np.unique(orders):
+                positions = np.flatnonzero(orders == order)
+                self._classes.append((positions, self.starts[positions], self.reaches[positions],
+                                      lengths[positions].max()))
+        return self._classes
+
+    def overlap_pairs(self, query):
+        """Return the arrays (rows, partners) of all pairs of a query region and an overlapping region of the index,
+        ordered by row and partner. The partners are positions in self.regions.
+
+        .. note:: The regions are looked up per binary order of magnitude of their length: only the regions of a class
+                  starting less than its longest length before a query region can overlap it, and at least half of
+                  their length lies behind that point.
+        """
+        chroms = self.query_chroms(query)
+        starts = genome_keys(chroms, query.initials)
+        ends = genome_keys(chroms, query.finals)
+        rows = [np.zeros(0, dtype=np.int64)]
+        partners = [np.zeros(0, dtype=np.int64)]
+        for positions, class_starts, class_reaches, longest in self._length_classes():
+            lo = np.searchsorted(class_starts, starts - longest, side="right")
+            hi = np.searchsorted(class_starts, ends, side="left")
+            owners, candidates = expand_ranges(lo, np.maximum(hi - lo, 0))
+            hit = class_reaches[candidates] > starts[owners]
+            rows.append(owners[hit])
+            partners.append(positions[candidates[hit]])
+        rows = np.concatenate(rows)
+        partners = np.concatenate(partners)
+        order = np.lexsort((partners, rows))
+        return rows[order], partners[order]
+
+    def neighbours(self, query, side, n=1):
+        """Return the arrays (rows, partners, distances) of the n closest regions of the index on one side of each
+        query region which do not overlap it, together with the regions as close as the n-th one.
+
+        *Keyword arguments:*
+
+            - query -- GenomicRegionColumns of the regions to look up.
+            - side -- "left" for the regions ending before the query regions, "right" for those starting after them.
+            - n -- Number of regions per query region.
+        """
+        empty = np.zeros(0, dtype=np.int64)
+        if self.size == 0 or len(query) == 0:
+            return empty, empty, empty
+        chroms = self.query_chroms(query)
+        if side == "left":
+            # Ordered by reach (and final), the final positions are increasing as well
+            if self._by_reach is None:
+                order = np.lexsort((self.finals, self.reaches))
+                self._by_reach = (order, self.reaches[order], self.finals[order])
+            order, reaches, finals = self._by_reach
+            last = np.searchsorted(reaches, genome_keys(chroms, query.initials), side="right")
+            nth = finals[np.maximum(last - n, 0)]
+            lo = np.maximum(np.searchsorted(finals, nth, side="left"),
+                            np.searchsorted(finals, genome_keys(chroms, 0), side="left"))
+            rows, positions = expand_ranges(lo, np.maximum(last - lo, 0))
+            partners = order[positions]
+            distances = query.initials[rows].astype(np.int64) - self.regions.finals[partners]
+        else:
+            first = np.searchsorted(self.starts, genome_keys(chroms, query.finals), side="left")
+            nth = self.starts[np.minimum(first + n - 1, self.size - 1)]
+            hi = np.minimum(np.searchsorted(self.starts, nth, side="right"),
+                            np.searchsorted(self.starts, genome_keys(chroms + 1, 0), side="left"))
+            rows, partners = expand_ranges(first, np.maximum(hi - first, 0))
+            distances = self.regions.initials[partners].astype(np.int64) - query.finals[rows]
+        return rows, partners, distances
+
+    def strand_index(self, orientation):
+        """Return the IntervalIndex of the regions with the given orientation and their positions in self.regions."""
+        if orientation not in self._strand_indexes:
+            positions = np.flatnonzero(self.regions.orientations() == orientation)
+            self._strand_indexes[orientation] = (IntervalIndex(self.regions.take(positions)), positions)
+        return self._strand_indexes[orientation]
+
+    def nearest(self, query, n=1, max_distance=None, ties=False, direction=None, overlaps=True, same_strand=False):
+        """Return the arrays (rows, partners, distances) of the n nearest regions of the index to each query region,
+        ordered by row, distance and partner. Distances are measured as in GenomicRegion.distance.
+
+        *Keyword arguments:*
+
+            - query -- GenomicRegionColumns of the regions to look up.
+            - n -- Number of regions per query region.
+            - max_distance -- Only return regions closer than this distance (default None, i.e. no limit).
+            - ties -- Return the regions as close as the n-th one as well.
+            - direction -- Only look on one side of the query regions: "left" or "right" in genomic coordinates, or
+                           "upstream" or "downstream" with respect to their orientation (default None, both sides).
+            - overlaps -- Return the overlapping regions (at distance 0) as well.
+            - same_strand -- Only return regions with the orientation of the query region.
+        """
+        if same_strand:
+            parts = []
+            orientations = query.orientations()
+            for orientation in set(orientations.tolist()):
+                selected = np.flatnonzero(orientations == orientation)
+                index, positions = self.strand_index(orientation)
+                rows, partners, distances = index.nearest(query.take(selected), n, max_distance, ties, direction,
+                                                          overlaps)
+                parts.append((selected[rows], positions[partners], distances))
+        else:
+            parts = []
+            if overlaps:
+                rows, partners = self.overlap_pairs(query)
+                parts.append((rows, partners, np.zeros(len(rows), dtype=np.int64)))
+            reverse = query.orientations() == "-"
+            for side in ["left", "right"]:
+                if direction in [None, side]:
+                    parts.append(self.neighbours(query, side, n))
+                elif direction in ["upstream", "downstream"]:
+                    # Upstream of a region on the reverse strand is on its right side
+                    rows, partners, distances = self.neighbours(query, side, n)
+                    keep = reverse[rows] == ((side == "left") != (direction == "upstream"))
+                    parts.append((rows[keep], partners[keep], distances[keep]))
+
+        rows, partners, distances = [np.concatenate([np.zeros(0, dtype=np.int64)] + [p[i] for p in parts])
+                                     for i in range(3)]
+        if max_distance is not None:
+            keep = distances < max_distance
+            rows, partners, distances = rows[keep], partners[keep], distances[keep]
+        order = np.lexsort((partners, distances, rows))
+        rows, partners, distances = rows[order], partners[order], distances[order]
+
+        # Rank the regions of each query region by their distance
+        first = np.searchsorted(rows, rows, side="left")
+        if ties:
+            last = np.searchsorted(rows, rows, side="right") - 1
+            keep = distances <= distances[np.minimum(first + n - 1, last)]
+        else:
+            keep = np.arange(len(rows)) - first < n
+        return rows[keep], partners[keep], distances[keep]
+
+    def _build_tree(self):
+        """Compute the maximum final position of every subtree of the implicit interval tree.
+
+        .. note:: The sorted regions are the nodes of a binary tree in in-order layout: the leaves are the even
+                  positions and a node at position i on level k has its children at i -/+ 2^(k-1).
+        """
+        size = self.size
+        tree_max = self.finals.copy()
+        last_i = (size - 1) & ~1
+        last = tree_max[last_i]
+        k = 1
+        while 1 << k <= size:
+            x = 1 << (k - 1)
+            nodes = np.arange((x << 1) - 1, size, x << 2)
+            right = nodes + x
+            right_max = np.where(right < size, tree_max[np.minimum(right, size - 1)], last)
+            tree_max[nodes] = np.maximum(np.maximum(tree_max[nodes], tree_max[nodes - x]), right_max)
+            last_i = last_i - x if (last_i >> k) & 1 else last_i + x
+            if last_i < size and tree_max[last_i] > last:
+                last = tree_max[last_i]
+            k += 1
+        self._tree = (tree_max, k - 1)
+
+    def find(self, chrom, initial, final):
+        """Return the positions in self.regions of the regions overlapping the given interval, in O(log n + k).
+
+        *Keyword arguments:*
+
+            - chrom -- Chromosome of the interval.
+            - initial -- Start position of the interval.
+            - final -- End position of the interval (an empty interval occupies its start position).
+
+        .. note:: As in GenomicRegion.overlap with the indexed regions as self, a region overlaps if it starts
+                  before the end of the interval and ends after its start.
+        """
+        names = self.regions.chrom_names
+        pos = bisect_left(names, chrom)
+        if self.size == 0 or pos == len(names) or names[pos] != chrom:
+            return np.zeros(0, dtype=np.int64)
+        if self._tree is None:
+            self._build_tree()
+        tree_max, level = self._tree
+        start = genome_keys(np.int64(2 * pos), initial)
+        end = genome_keys(np.int64(2 * pos), max(final, initial + 1))
+
+        hits = []
+        stack = [(level, (1 << level) - 1, False)]
+        while stack:
+            k, x, left_done = stack.pop()
+            if k <= TREE_SCAN_LEVEL:
+                # Small subtree: scan it linearly
+                i = x >> k << k
+                i1 = min(i + (1 << (k + 1)) - 1, self.size)
+                while i < i1 and self.starts[i] < end:
+                    if start < self.finals[i]:
+                        hits.append(i)
+                    i += 1
+            elif not left_done:
+                # Visit the left child first, then come back for the node itself and the right child
+                y = x - (1 << (k - 1))
+                stack.append((k, x, True))
+                if y >= self.size or tree_max[y] > start:
+                    stack.append((k - 1, y, False))
+            elif x < self.size and self.starts[x] < end:
+                if start < self.finals[x]:
+                    hits.append(x)
+                stack.append((k - 1, x + (1 << (k - 1)), False))
+        return np.array(hits, dtype=np.int64)
@@ -0,0 +1,193 @@
+"""
+LibRGT
+===================
+LibRGT binds the C library librgt (c/librgt.c). The library is loaded and its prototypes are declared once per
+process (see get_librgt); regions are passed as contiguous NumPy int32 arrays with integer chromosome codes.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import sys
+import ConfigParser
+from ctypes import cdll, c_int, c_double, c_bool
+import numpy as np
+from numpy.ctypeslib import ndpointer
+# Internal
+from rgt.Util import Library_path, OverlapType
+
+INT_ARRAY = ndpointer(dtype=np.int32, flags="C_CONTIGUOUS")
+DOUBLE_ARRAY = ndpointer(dtype=np.float64, flags="C_CONTIGUOUS")
+REGIONS = [INT_ARRAY, INT_ARRAY, INT_ARRAY, c_int]
+
+# Codes of the overlap types in librgt
+OVERLAP_TYPE_CODES = {OverlapType.OVERLAP: 0, OverlapType.ORIGINAL: 1, OverlapType.COMP_INCL: 2}
+
+_librgt = None
+
+
+class LibRGT(object):
+    """*Keyword arguments:*
+
+        - path -- Path to the shared library.
+
+    .. note:: The chromosome codes of both sets of a call have to come from the same coding, in which the order of the
+              codes is the order of the chromosome names (see IntervalIndex.query_chroms). The result buffers are
+              reused between calls, so an instance must not be shared between threads.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        lib = cdll.LoadLibrary(path)
+
+        self.intersect_overlap_c = lib.intersectCodedOverlap
+        self.intersect_overlap_c.argtypes = REGIONS + REGIONS + [INT_ARRAY, INT_ARRAY, INT_ARRAY]
+        self.intersect_overlap_c.restype = c_int
+
+        self.select_c = lib.selectCodedRegions
+        self.select_c.argtypes = [c_int] + REGIONS + REGIONS + [INT_ARRAY]
+        self.select_c.restype = c_int
+
+        self.jaccard_c = lib.jaccardCoded
+        self.jaccard_c.argtypes = REGIONS + REGIONS
+        self.jaccard_c.restype = c_double
+
+        self.subtract_c = lib.subtractCoded
+        self.subtract_c.argtypes = REGIONS + REGIONS + [c_bool, c_int, INT_ARRAY, INT_ARRAY, INT_ARRAY]
+        self.subtract_c.restype = c_int
+
+        self.cluster_c = lib.clusterCodedRegions
+        self.cluster_c.argtypes = REGIONS[:3] + [INT_ARRAY, c_int, c_int, INT_ARRAY, INT_ARRAY]
+        self.cluster_c.restype = c_int
+
+        self.sum_overlaps_c = lib.sumCodedOverlaps
+        self.sum_overlaps_c.argtypes = REGIONS + REGIONS + [INT_ARRAY, DOUBLE_ARRAY]
+        self.sum_overlaps_c.restype = c_int
+
+        self.within_overlap_c = lib.withinCodedOverlap
+        self.within_overlap_c.argtypes = REGIONS
+        self.within_overlap_c.restype = c_int
+
+        self.unique_c = lib.selectUniqueRegions
+        self.unique_c.argtypes = REGIONS + [INT_ARRAY]
+        self.unique_c.restype = c_int
+
+        self.buffers = [np.zeros(0, dtype=np.int32)] * 3
+
+    def _buffers(self, size):
+        """Return the three result buffers, grown to hold at least size values."""
+        if len(self.buffers[0]) < size:
+            size = max(size, 2 * len(self.buffers[0]))
+            self.buffers = [np.empty(size, dtype=np.int32) for _ in range(3)]
+        return self.buffers
+
+    def intersect(self, mode, a, b):
+        """Return the intersection of the regions a with the regions b as arrays (rows, initials, finals), where
+        rows are the positions of the regions of a each result region belongs to.
+
+        *Keyword arguments:*
+
+            - mode -- OverlapType.OVERLAP, OverlapType.ORIGINAL or OverlapType.COMP_INCL.
+            - a -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions; merged for OverlapType.OVERLAP.
+            - b -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions; merged for OverlapType.OVERLAP.
+        """
+        size_a = len(a[0])
+        size_b = len(b[0])
+        if mode == OverlapType.OVERLAP:
+            rows, initials, finals = self._buffers(size_a + size_b)
+            size = self.intersect_overlap_c(a[0], a[1], a[2], size_a, b[0], b[1], b[2], size_b,
+                                            rows, initials, finals)
+            return rows[:size].copy(), initials[:size].copy(), finals[:size].copy()
+
+        rows = self._buffers(size_a)[0]
+        size = self.select_c(OVERLAP_TYPE_CODES[mode], a[0], a[1], a[2], size_a, b[0], b[1], b[2], size_b, rows)
+        if size < 0:
+            raise MemoryError("librgt could not allocate memory")
+        rows = rows[:size].copy()
+        return rows, a[1][rows], a[2][rows]
+
+    def jaccard(self, a, b):
+        """Return the jaccard index of the sorted and merged regions a and b, given as tuples (chroms, initials, finals)
+        of int32 arrays."""
+        return self.jaccard_c(a[0], a[1], a[2], len(a[0]), b[0], b[1], b[2], len(b[0]))
+
+    def subtract(self, a, b, whole_region=False):
+        """Return the parts of the regions a not covered by the regions b as arrays (rows, initials, finals), where
+        rows are the positions of the regions of a each result region belongs to.
+
+        *Keyword arguments:*
+
+            - a -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions.
+            - b -- Tuple (chroms, initials, finals) of int32 arrays of sorted and merged regions.
+            - whole_region -- Remove the regions of a overlapping b completely instead of cutting them.
+        """
+        size_a = len(a[0])
+        size_b = len(b[0])
+        capacity = size_a + size_b
+        while True:
+            rows, initials, finals = self._buffers(capacity)
+            size = self.subtract_c(a[0], a[1], a[2], size_a, b[0], b[1], b[2], size_b, whole_region, len(rows),
+                                   rows, initials, finals)
+            if size <= len(rows):
+                return rows[:size].copy(), initials[:size].copy(), finals[:size].copy()
+            capacity = size
+
+    def cluster(self, regions, segments, distance=0):
+        """Return the arrays (rows, finals) of the clusters of the sorted regions, where rows are the positions of the
+        first region of every cluster.
+
+        *Keyword arguments:*
+
+            - regions -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions.
+            - segments -- Array of the segment of every region; only neighbours of the same segment are merged.
+            - distance -- Merge the regions starting less than distance after the end of a cluster (default 0, i.e.
+                          merge the overlapping regions).
+        """
+        size = len(regions[0])
+        rows, finals = self._buffers(size)[:2]
+        size = self.cluster_c(regions[0], regions[1], regions[2], np.ascontiguousarray(segments, dtype=np.int32),
+                              size, distance, rows, finals)
+        return rows[:size].copy(), finals[:size].copy()
+
+    def sum_overlaps(self, a, b):
+        """Return the number and the total length of the regions b overlapping each region of a, as arrays.
+
+        *Keyword arguments:*
+
+            - a -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions.
+            - b -- Tuple (chroms, initials, finals) of int32 arrays of sorted regions.
+        """
+        counts = np.empty(len(a[0]), dtype=np.int32)
+        lengths = np.empty(len(a[0]), dtype=np.float64)
+        if self.sum_overlaps_c(a[0], a[1], a[2], len(a[0]), b[0], b[1], b[2], len(b[0]), counts, lengths) < 0:
+            raise MemoryError("librgt could not allocate memory")
+        return counts, lengths
+
+    def within_overlap(self, regions):
+        """Return True, if two neighbours of the sorted regions, given as tuple (chroms, initials, finals) of int32
+        arrays, overlap."""
+        return bool(self.within_overlap_c(regions[0], regions[1], regions[2], len(regions[0])))
+
+    def unique(self, regions):
+        """Return the positions of the sorted regions, given as tuple (chroms, initials, finals) of int32 arrays,
+        which differ in position from their predecessor."""
+        size = len(regions[0])
+        rows = self._buffers(size)[0]
+        size = self.unique_c(regions[0], regions[1], regions[2], size, rows)
+        return rows[:size].copy()
+
+
+def get_librgt():
+    """Return the LibRGT of the process, loading librgt on first use. Return None, if the library can not be loaded
+    or does not provide the coded interface (e.g. an older build)."""
+    global _librgt
+    if _librgt is None:
+        try:
+            _librgt = LibRGT(Library_path().get_c_rgt())
+        except AttributeError:
+            print("Warning: librgt is an older build without the coded interface, reinstall RGT to rebuild it",
+                  file=sys.stderr)
+            _librgt = False
+        except (OSError, ConfigParser.Error):
+            _librgt = False
+    return _librgt or None
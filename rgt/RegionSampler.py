@@ -0,0 +1,136 @@
+"""
+RegionSampler
+===================
+RegionSampler places random regions of given lengths uniformly into a set of allowed genomic intervals (e.g. a genome
+without filtered regions). All positions of a batch of regions are drawn at once with NumPy.
+
+"""
+
+from __future__ import print_function
+from __future__ import division
+import random
+import numpy as np
+# Internal
+from rgt.GenomicRegionColumns import GenomicRegionColumns, genome_keys
+from rgt.IntervalIndex import IntervalIndex
+
+
+def random_state(seed=None):
+    """Return a numpy.random.RandomState for the given seed.
+
+    *Keyword arguments:*
+
+        - seed -- An integer, a RandomState (returned as it is) or None. For None the seed is drawn from the random
+                  module, so that random.seed() makes the result reproducible as well.
+    """
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    if seed is None:
+        seed = random.randint(0, 2 ** 32 - 1)
+    return np.random.RandomState(seed)
+
+
+class RegionSampler(object):
+    """*Keyword arguments:*
+
+        - space -- GenomicRegionColumns of the sorted and merged intervals the random regions are placed in.
+        - seed -- Seed of the random numbers, see random_state (default None).
+
+    .. note:: A random region lies completely inside one interval and every possible placement of it is equally
+              likely. The intervals are kept ordered by length, so that the intervals which can hold a region of a
+              given length are a suffix of them and a position can be found by a binary search.
+    """
+
+    def __init__(self, space, seed=None):
+        self.random_state = random_state(seed)
+        self.set_space(space)
+
+    def set_space(self, space):
+        """Replace the intervals the random regions are placed in."""
+        self.space = space
+        lengths = space.lengths().astype(np.int64)
+        self.order = np.argsort(lengths, kind="mergesort")
+        self.lengths = lengths[self.order]
+        self.cumulative = np.concatenate(([0], np.cumsum(self.lengths)))
+
+    def positions(self, lengths):
+        """Return the arrays (intervals, initials) of random placements of regions with the given lengths, where
+        intervals are the positions of the intervals in self.space.
+
+        *Keyword arguments:*
+
+            - lengths -- Array of the lengths of the regions.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        size = len(self.lengths)
+        cumulative = self.cumulative
+        # An interval of length l offers l - length + 1 placements
+        first = np.searchsorted(self.lengths, lengths, side="left")
+        totals = cumulative[size] - cumulative[first] - (lengths - 1) * (size - first)
+        if np.any(totals <= 0):
+            raise Exception("There is no further space for randomization on the genome.")
+        draws = np.minimum((self.random_state.random_sample(len(lengths)) * totals).astype(np.int64), totals - 1)
+
+        def placements_before(i):
+            """Return the number of placements in the intervals [first, i)."""
+            return cumulative[i] - cumulative[first] - (lengths - 1) * (i - first)
+
+        # Find the interval of every draw
+        lo = first
+        hi = np.full(len(lengths), size - 1, dtype=np.int64)
+        while np.any(lo < hi):
+            mid = (lo + hi) // 2
+            inside = placements_before(mid + 1) > draws
+            hi = np.where(inside, mid, hi)
+            lo = np.where(inside, lo, mid + 1)
+        intervals = self.order[lo]
+        return intervals, self.space.initials[intervals] + draws - placements_before(lo)
+
+    def sample(self, lengths, overlap=True):
+        """Return GenomicRegionColumns of random regions with the given lengths, in the order of the lengths.
+
+        *Keyword arguments:*
+
+            - lengths -- Array of the lengths of the regions.
+            - overlap -- Whether the random regions may overlap each other.
+
+        .. note:: Without overlap, regions drawn into the same place are resolved by keeping one random region of
+                  every group of overlapping ones; the others are drawn again from the remaining space.
+        """
+        lengths = np.asarray(lengths, dtype=np.int64)
+        chroms = np.zeros(len(lengths), dtype=np.int64)
+        initials = np.zeros(len(lengths), dtype=np.int64)
+        pending = np.arange(len(lengths))
+        while len(pending) > 0:
+            intervals, starts = self.positions(lengths[pending])
+            chroms[pending] = self.space.chroms[intervals]
+            initials[pending] = starts
+            if overlap:
+                break
+            pending = self._resolve(pending, chroms[pending], starts, starts + lengths[pending])
+
+        return GenomicRegionColumns(chrom_names=self.space.chrom_names, chroms=chroms, initials=initials,
+                                    finals=initials + lengths)
+
+    def _resolve(self, rows, chroms, initials, finals):
+        """Keep one random region of every group of overlapping regions, remove the kept ones from the space and
+        return the rows which have to be drawn again."""
+        order = np.lexsort((finals, initials, chroms))
+        starts = genome_keys(chroms[order], initials[order])
+        ends = np.maximum.accumulate(genome_keys(chroms[order], np.maximum(finals[order], initials[order] + 1)))
+        groups = np.zeros(len(order), dtype=np.int64)
+        groups[1:] = np.cumsum(starts[1:] >= ends[:-1])
+
+        # Pick a random member of every group
+        priorities = self.random_state.random_sample(len(order))
+        ranked = np.lexsort((priorities, groups))
+        first = np.ones(len(ranked), dtype=bool)
+        first[1:] = groups[ranked[1:]] != groups[ranked[:-1]]
+        kept = np.zeros(len(order), dtype=bool)
+        kept[order[ranked[first]]] = True
+
+        placed = GenomicRegionColumns(chrom_names=self.space.chrom_names, chroms=chroms[kept],
+                                      initials=initials[kept], finals=finals[kept])
+        pieces, piece_initials, piece_finals = IntervalIndex(placed).subtract_rows(self.space)
+        self.set_space(self.space.with_coordinates(pieces, piece_initials, piece_finals))
+        return rows[~kept]
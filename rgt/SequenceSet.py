@@ -6,6 +6,7 @@ import copy
 
 # Distal Libraries
 from Util import SequenceType
+from GenomeFasta import GenomeFasta
 
 ####################################################################################
 ####################################################################################
@@ -127,59 +128,44 @@ class SequenceSet:
         *Keyword arguments:*
             -fasta_file -- The path to the FASTA file.
         """
-        pre_seq = False
+        info, strand, lines = None, "+", None
         with open(fasta_file) as f:
             for line in f:
                 line = line.strip()
                 if not line: pass
                 elif line[0] == ">":
-                    if pre_seq:
-                        self.sequences.append(Sequence(seq=seq, strand=strand, name=info))
-                        pre_seq = False
+                    if lines:
+                        self.sequences.append(Sequence(seq="".join(lines), strand=strand, name=info))
                     info = line.split()[0][1:]
-                    seq = ""
+                    lines = []
                     try: strand = line[line.index("strand")+7]
                     except: strand = "+"
                 else:
-                    try: seq = seq + line
-                    except: seq = line
-                    pre_seq = True
-            self.sequences.append(Sequence(seq=seq, strand=strand, name=info))
+                    if lines is None: lines = []
+                    lines.append(line)
+            if lines is not None:
+                self.sequences.append(Sequence(seq="".join(lines), strand=strand, name=info))
 
     def read_genomic_set(self, genomic_set, genome_file_dir):
         """Read the sequences defined by a given genomic set.s
         *Keyword arguments:*
 
             - genomic_set - genomic set with regions to obtain the fasta file
-            - genome_file_dir -- A directory which contains the FASTA files for each chromosome.
+            - genome_file_dir -- A directory which contains the FASTA files for each chromosome, or an indexed FASTA file.
         """
 
         bed=genomic_set
-        # Parse each chromosome and fetch the defined region in this chromosome
-        chroms = list(set(bed.get_chrom()))
-
-        chro_files = [x.split(".")[0] for x in os.listdir(genome_file_dir)]
-
-        for ch in chroms:
-            if ch not in chro_files: print(" *** There is no genome FASTA file for: "+ch)
-
-            # Read genome in FASTA according to the given chromosome
-            ch_seq = SequenceSet(name=ch, seq_type=SequenceType.DNA)
-            try: 
-                ch_seq.read_fasta(os.path.join(genome_file_dir, ch+".fa"))
-            except:
-                continue
-            
-            # Regions in given chromosome
-            beds = bed.any_chrom(chrom=ch)
-
-            for s in beds:
-                seq = ch_seq[0].seq[s.initial:s.final]
-                try: strand = s.strand
-                except: strand = "+"
-                self.sequences.append(Sequence(seq=seq, name=s.__repr__(), strand=strand))
-
-
+        genome = GenomeFasta(genome_file_dir)
+        for ch in set(bed.get_chrom()):
+            if ch not in genome: print(" *** There is no genome FASTA file for: "+ch)
+
+        # Fetch the regions sorted by chromosome and position, without reading whole chromosomes
+        for s, seq in zip(bed, genome.fetch_many(bed)):
+            if seq is None: continue
+            try: strand = s.strand
+            except: strand = "+"
+            self.sequences.append(Sequence(seq=seq, name=s.__repr__(), strand=strand))
+        genome.close()
 
     def read_bed(self, bedfile, genome_file_dir):
         """Read the sequences defined by BED file on the given genomce.
@@ -187,7 +173,7 @@ class SequenceSet:
         *Keyword arguments:*
 
             - bedfile -- The path to the BED file which defines the regions.
-            - genome_file_dir -- A directory which contains the FASTA files for each chromosome.
+            - genome_file_dir -- A directory which contains the FASTA files for each chromosome, or an indexed FASTA file.
         """
 
         # Read BED into GenomicRegionSet
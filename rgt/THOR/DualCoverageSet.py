@@ -81,7 +81,8 @@ class DualCoverageSet():
 
             if not no_gc_content and input['input'] is not None:
                 gc_content_cov, avg_gc_content, gc_hist = get_gc_context(stepsize, binsize, genome_path,
-                                                                         input['cov-input'].coverage, chrom_sizes_dict)
+                                                                         input['cov-input'].coverage, chrom_sizes_dict,
+                                                                         regions=input['cov-input'].genomicRegions)
 
                 self._norm_gc_content(input['cov-ip'].coverage, gc_content_cov, avg_gc_content)
                 self._norm_gc_content(input['cov-input'].coverage, gc_content_cov, avg_gc_content)
@@ -106,10 +107,8 @@ class DualCoverageSet():
             input['cov-ip'].write_bigwig(name + '-' + name_bam + '-normalized.bw', chrom_sizes)
 
         # make one array for the coverage
-        self.first_overall_coverage = reduce(lambda x, y: np.concatenate((x, y)),
-                                             [self.cov1.coverage[i] for i in range(len(self.cov1.genomicRegions))])
-        self.second_overall_coverage = reduce(lambda x, y: np.concatenate((x, y)),
-                                              [self.cov2.coverage[i] for i in range(len(self.cov2.genomicRegions))])
+        self.first_overall_coverage = np.concatenate([self.cov1.coverage[i] for i in range(len(self.cov1.genomicRegions))])
+        self.second_overall_coverage = np.concatenate([self.cov2.coverage[i] for i in range(len(self.cov2.genomicRegions))])
         assert (len(self.first_overall_coverage) == len(self.second_overall_coverage))
 
         self.scores = np.zeros(len(self.first_overall_coverage))
@@ -230,29 +229,12 @@ class DualCoverageSet():
             gc_cov[i] = np.array(gc_cov[i])
             gc_cov[i][gc_cov[i] < EPSILON] = gc_avg  # sometimes zeros occur, do not consider
             cov[i] = cov[i] * gc_avg / gc_cov[i]
-            cov[i] = cov[i].clip(0, max(max(cov[i]), 0))  # neg. values to 0
+            cov[i] = cov[i].clip(0, None)  # neg. values to 0
             cov[i] = cov[i].astype(int)
 
     def _index2coordinates(self, index):
         """Translate index within coverage array to genomic coordinates."""
-        iter = self.genomicRegions.__iter__()
-        r = iter.next()
-        sum = r.final
-        last = 0
-        i = 0
-        while sum <= index * self.stepsize:
-            last += len(self.cov1.coverage[i])
-            try:
-                r = iter.next()
-            except StopIteration:
-                sum += r.final
-                i += 1
-                break
-            sum += r.final
-            i += 1
-
-        return r.chrom, (index - last) * self.stepsize, \
-               min((index - last) * self.stepsize + self.stepsize, r.final)
+        return self.cov1.index2coordinates(index, self.genomicRegions)
 
     def __len__(self):
         """Return number of observations."""
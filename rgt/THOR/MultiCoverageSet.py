@@ -28,7 +28,7 @@ import numpy as np
 from normalize import get_normalization_factor
 from DualCoverageSet import DualCoverageSet
 from norm_genelevel import norm_gene_level
-from rgt.CoverageSet import CoverageSet, get_gc_context
+from rgt.CoverageSet import CoverageSet, get_gc_context, compute_coverages
 
 EPSILON = 1**-320
 ROUND_PRECISION = 3
@@ -36,32 +36,46 @@ DEBUG = None
 VERBOSE = None
 
 
+def _to_matrix(rows):
+    """Return the matrix whose i-th row is the concatenation of the arrays in rows[i]. Every array is copied once,
+    directly into the matrix; integer data become int64."""
+    dtype = np.dtype(np.int64)
+    for row in rows:
+        for x in row:
+            dtype = np.promote_types(dtype, x.dtype)
+    m = np.empty((len(rows), sum(len(x) for x in rows[0]) if rows else 0), dtype=dtype)
+    for i, row in enumerate(rows):
+        if row:
+            np.concatenate(row, out=m[i])
+    return np.asmatrix(m)
+
+
 class MultiCoverageSet(DualCoverageSet):
-    def _help_init(self, path_bamfiles, exts, rmdup, binsize, stepsize, path_inputs, exts_inputs, dim, regions, norm_regionset, strand_cov):
+    def _help_init(self, path_bamfiles, exts, rmdup, binsize, stepsize, path_inputs, exts_inputs, dim, regions, norm_regionset, strand_cov, cores=1):
         """Return self.covs and self.inputs as CoverageSet"""
         self.exts = exts
         self.covs = [CoverageSet('file' + str(i), regions) for i in range(dim)]
-        for i, c in enumerate(self.covs):
-            c.coverage_from_bam(bam_file=path_bamfiles[i], extension_size=exts[i], rmdup=rmdup, binsize=binsize,\
-                                stepsize=stepsize, get_strand_info = strand_cov)
+        jobs = [(c, dict(bam_file=path_bamfiles[i], extension_size=exts[i], rmdup=rmdup, binsize=binsize,\
+                         stepsize=stepsize, get_strand_info = strand_cov)) for i, c in enumerate(self.covs)]
         self.covs_avg = [CoverageSet('cov_avg'  + str(i) , regions) for i in range(2)]
         if path_inputs:
             self.inputs = [CoverageSet('input' + str(i), regions) for i in range(len(path_inputs))]
-            for i, c in enumerate(self.inputs):
-                c.coverage_from_bam(bam_file=path_inputs[i], extension_size=exts_inputs[i], rmdup=rmdup, binsize=binsize,\
-                                stepsize=stepsize, get_strand_info = strand_cov)
+            jobs += [(c, dict(bam_file=path_inputs[i], extension_size=exts_inputs[i], rmdup=rmdup, binsize=binsize,\
+                              stepsize=stepsize, get_strand_info = strand_cov)) for i, c in enumerate(self.inputs)]
             self.input_avg = [CoverageSet('input_avg'  + str(i), regions) for i in range(2)]
         else:
             self.inputs = []
             
         if norm_regionset:
             self.norm_regions = [CoverageSet('norm_region' + str(i), norm_regionset) for i in range(dim)]
-            for i, c in enumerate(self.norm_regions):
-                c.coverage_from_bam(bam_file=path_bamfiles[i], extension_size=exts[i], rmdup=rmdup, binsize=binsize,\
-                                    stepsize=stepsize, get_strand_info = strand_cov)
+            jobs += [(c, dict(bam_file=path_bamfiles[i], extension_size=exts[i], rmdup=rmdup, binsize=binsize,\
+                              stepsize=stepsize, get_strand_info = strand_cov)) for i, c in enumerate(self.norm_regions)]
             self.input_avg = [CoverageSet('input_avg'  + str(i), regions) for i in range(2)]
         else:
             self.norm_regions = None
+        
+        #all BAM files and chromosomes at once
+        compute_coverages(jobs, cores)
     
     def _get_covs(self, DCS, i):
         """For a multivariant Coverageset, return coverage cov1 and cov2 at position i"""
@@ -78,7 +92,7 @@ class MultiCoverageSet(DualCoverageSet):
                 inputfile = self.inputs[i] #1 to 1 mapping between input and cov
                 rep = i if i < self.dim_1 else i-self.dim_1
                 sig = 1 if i < self.dim_1 else 2
-                self.gc_content_cov, self.avg_gc_content, self.gc_hist = get_gc_context(stepsize, binsize, genome_path, inputfile.coverage, chrom_sizes_dict)
+                self.gc_content_cov, self.avg_gc_content, self.gc_hist = get_gc_context(stepsize, binsize, genome_path, inputfile.coverage, chrom_sizes_dict, regions=inputfile.genomicRegions)
                 self._norm_gc_content(cov.coverage, self.gc_content_cov, self.avg_gc_content)
                 self._norm_gc_content(inputfile.coverage, self.gc_content_cov, self.avg_gc_content)
             
@@ -94,12 +108,15 @@ class MultiCoverageSet(DualCoverageSet):
             if self.inputs:
                 self.inputs[i].write_bigwig(name + '-' + str(self.counter) + '-input-s%s-rep%s.bw' %(sig, rep), chrom_sizes, save_wig=save_wig, end=self.end)
     
-    def _output_bw(self, name, chrom_sizes, save_wig, save_input):
-        """Output bigwig files"""
+    def _output_bw(self, name, chrom_sizes, save_wig, save_input, bigwig_writers=None):
+        """Output bigwig files, or append the signal to the open BigWigWriters <bigwig_writers> (one per BAM file)"""
         for i in range(len(self.covs)):
             rep = i if i < self.dim_1 else i-self.dim_1
             sig = 1 if i < self.dim_1 else 2
             
+            if bigwig_writers:
+                bigwig_writers[i].add_coverage(self.covs[i])
+                continue
             self.covs[i].write_bigwig(name + '-' + str(self.counter) + '-s%s-rep%s.bw' %(sig, rep), chrom_sizes, save_wig=save_wig, end=self.end)
         
         #ra = [self.covs_avg, self.input_avg] if self.inputs else [self.covs_avg]
@@ -144,25 +161,22 @@ class MultiCoverageSet(DualCoverageSet):
             it = range(self.dim_1) if k == 0 else range(self.dim_1, self.dim_1 + self.dim_2)
             for i in it:
                 if cov_strand:
-                    tmp_el = reduce(lambda x,y: np.concatenate((x,y)), self._help_get_data(i, 'cov'))
-                    tmp[k].append(tmp_el)
-                 
-                    tmp_el = map(lambda x: (x[0], x[1]), reduce(lambda x,y: np.concatenate((x,y)), self._help_get_data(i, 'strand')))
-                    tmp2[k][0].append(map(lambda x: x[0], tmp_el))
-                    tmp2[k][1].append(map(lambda x: x[1], tmp_el))
+                    tmp[k].append(list(self._help_get_data(i, 'cov')))
+                    strand = list(self._help_get_data(i, 'strand'))
+                    tmp2[k][0].append([x[:, 0] for x in strand])
+                    tmp2[k][1].append([x[:, 1] for x in strand])
                 else:
-                    tmp_el = reduce(lambda x,y: np.concatenate((x,y)), self._help_get_data(i, 'normregion'))
-                    tmp[k].append(tmp_el)
+                    tmp[k].append(list(self._help_get_data(i, 'normregion')))
 
         if cov_strand:
             #1. or 2. signal -> pos/neg strand -> matrix with rep x bins
-            overall_coverage_strand = [[np.matrix(tmp2[0][0]), np.matrix(tmp2[0][1])], [np.matrix(tmp2[1][0]), np.matrix(tmp2[0][1])]]
+            overall_coverage_strand = [[_to_matrix(tmp2[0][0]), _to_matrix(tmp2[0][1])], [_to_matrix(tmp2[1][0]), _to_matrix(tmp2[0][1])]]
             #list of matrices: #replicates (row) x #bins (columns)
-            overall_coverage = [np.matrix(tmp[0]), np.matrix(tmp[1])]
+            overall_coverage = [_to_matrix(tmp[0]), _to_matrix(tmp[1])]
          
             return overall_coverage, overall_coverage_strand
         else:
-            return [np.matrix(tmp[0]), np.matrix(tmp[1])]
+            return [_to_matrix(tmp[0]), _to_matrix(tmp[1])]
     
     def count_positive_signal(self):
         return np.sum([self.covs[i].coverage for i in range(self.dim_1 + self.dim_2)])
@@ -171,7 +185,7 @@ class MultiCoverageSet(DualCoverageSet):
                  verbose, debug, no_gc_content, rmdup, path_bamfiles, exts, path_inputs, exts_inputs, \
                  factors_inputs, chrom_sizes_dict, scaling_factors_ip, save_wig, strand_cov, housekeeping_genes,\
                  tracker, end, counter, gc_content_cov=None, avg_gc_content=None, gc_hist=None, output_bw=True,\
-                 folder_report=None, report=None, save_input=False, m_threshold=80, a_threshold=95):
+                 folder_report=None, report=None, save_input=False, m_threshold=80, a_threshold=95, cores=1, bigwig_writers=None):
         """Compute CoverageSets, GC-content and normalize input-DNA and IP-channel"""
         self.genomicRegions = regions
         self.binsize = binsize
@@ -195,7 +209,7 @@ class MultiCoverageSet(DualCoverageSet):
         VERBOSE = verbose
         
         #make data nice
-        self._help_init(path_bamfiles, exts, rmdup, binsize, stepsize, path_inputs, exts_inputs, sum(dims), regions, norm_regionset, strand_cov = strand_cov)
+        self._help_init(path_bamfiles, exts, rmdup, binsize, stepsize, path_inputs, exts_inputs, sum(dims), regions, norm_regionset, strand_cov = strand_cov, cores=cores)
         if self.count_positive_signal() < 1:
             self.no_data = True
             return None
@@ -210,7 +224,7 @@ class MultiCoverageSet(DualCoverageSet):
                                       m_threshold, a_threshold)
         
         if output_bw:
-            self._output_bw(name, chrom_sizes, save_wig, save_input) 
+            self._output_bw(name, chrom_sizes, save_wig, save_input, bigwig_writers)
         
         self.scores = np.zeros(len(self.overall_coverage[0]))
         self.indices_of_interest = []
@@ -354,24 +368,7 @@ class MultiCoverageSet(DualCoverageSet):
                 
     def _index2coordinates(self, index):
         """Translate index within coverage array to genomic coordinates."""
-        iter = self.genomicRegions.__iter__()
-        r = iter.next()
-        sum = r.final
-        last = 0
-        i = 0
-        while sum <= index * self.stepsize:
-            last += len(self.covs[0].coverage[i])
-            try:
-                r = iter.next()
-            except StopIteration:
-                sum += r.final
-                i += 1
-                break
-            sum += r.final
-            i += 1
-        
-        return r.chrom, (index-last) * self.stepsize, \
-            min((index-last) * self.stepsize + self.stepsize, r.final)
+        return self.covs[0].index2coordinates(index, self.genomicRegions)
                               
     def __len__(self):
         """Return number of observations."""
@@ -24,15 +24,22 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 # Python
 from __future__ import print_function
+import os
 import sys
+import shutil
+import tempfile
+import multiprocessing
 
 # Internal
-from dpc_help import get_peaks, _fit_mean_var_distr, initialize, merge_output, handle_input
+from dpc_help import get_peaks, _fit_mean_var_distr, _func_quad_2p, _compute_extension_sizes, initialize, \
+    open_output, handle_input
+from checkpoint import Checkpoint, get_parameters
 from tracker import Tracker
 from postprocessing import _output_BED, _output_narrowPeak
 from rgt.THOR.neg_bin_rep_hmm import NegBinRepHMM, get_init_parameters, _get_pvalue_distr
 from rgt.THOR.RegionGiver import RegionGiver
 from rgt.THOR.postprocessing import filter_by_pvalue_strand_lag
+from rgt.BigWigWriter import save_chunk
 from rgt import __version__
 
 # External
@@ -55,8 +62,42 @@ def _write_info(tracker, report, **data):
         tracker.make_html()
 
 
-def train_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker):
-    """Train HMM"""
+def _get_extension_sizes(options, bamfiles, inputs, checkpoint):
+    """Set the extension sizes of the BAM files in <options>, computing them unless they are given or checkpointed"""
+    stored = checkpoint.load("extension_sizes") if checkpoint else None
+    if stored is not None:
+        options.exts, options.exts_inputs = stored["exts"], stored["exts_inputs"]
+        return
+    
+    options.exts, options.exts_inputs = _compute_extension_sizes(bamfiles, options.exts, inputs, options.exts_inputs,
+                                                                 options.report, options.cores)
+    if checkpoint:
+        checkpoint.save("extension_sizes", {"exts": options.exts, "exts_inputs": options.exts_inputs})
+
+
+def _load_HMM(stored, dims, tracker):
+    """Return the trained HMM and the other results of train_HMM stored in a checkpoint"""
+    factors, func_para = stored["factors"], stored["func_para"]
+    tracker.write(text=" ".join(map(lambda x: str(x), factors["exts"])), header="Extension size (rep1, rep2, input1, input2)")
+    tracker.write(text=map(lambda x: str(x), factors["scaling_factors_ip"]), header="Scaling factors")
+    
+    a, c = func_para[1]
+    func = lambda x: _func_quad_2p(x, a, c)
+    m = NegBinRepHMM(alpha=stored["alpha"], mu=stored["mu"], dim_cond_1=dims[0], dim_cond_2=dims[1], func=func,
+                     startprob=stored["startprob"], transmat=stored["transmat"])
+    distr = _get_pvalue_distr(m.mu, m.alpha, tracker)
+    
+    return m, factors, func_para, stored["init_mu"], stored["init_alpha"], distr
+
+
+def train_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, checkpoint=None):
+    """Train HMM. Return the HMM, the factors found on the training set (extension sizes, scaling factors and
+    GC-content, see run_HMM), the parameters of the mean-variance function, the initial mu and alpha and the
+    distribution for the p-values."""
+    _get_extension_sizes(options, bamfiles, inputs, checkpoint)
+    stored = checkpoint.load("training") if checkpoint else None
+    if stored is not None:
+        return _load_HMM(stored, dims, tracker)
     
     while True:
         train_regions = region_giver.get_training_regionset()
@@ -70,7 +111,8 @@ def train_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs
                               housekeeping_genes=options.housekeeping_genes, test=TEST, report=options.report,
                               chrom_sizes_dict=region_giver.get_chrom_dict(), end=True, counter=0, output_bw=False,
                               save_input=options.save_input, m_threshold=options.m_threshold,
-                              a_threshold=options.a_threshold, rmdup=options.rmdup)
+                              a_threshold=options.a_threshold, rmdup=options.rmdup,
+                              cores=options.cores)
         if exp_data.count_positive_signal() > len(train_regions.sequences[0]) * 0.00001:
             tracker.write(text=" ".join(map(lambda x: str(x), exp_data.exts)), header="Extension size (rep1, rep2, input1, input2)")
             tracker.write(text=map(lambda x: str(x), exp_data.scaling_factors_ip), header="Scaling factors")
@@ -91,49 +133,140 @@ def train_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs
     print('Train HMM', file=sys.stderr)
     m.fit([training_set_obs], options.hmm_free_para)
     distr = _get_pvalue_distr(m.mu, m.alpha, tracker)
-         
-    return m, exp_data, func_para, init_mu, init_alpha, distr
+    
+    factors = {"exts": exp_data.exts, "exts_inputs": exp_data.exts_inputs,
+               "factors_inputs": exp_data.factors_inputs, "scaling_factors_ip": exp_data.scaling_factors_ip,
+               "gc_content_cov": exp_data.gc_content_cov, "avg_gc_content": exp_data.avg_gc_content,
+               "gc_hist": exp_data.gc_hist}
+    if checkpoint:
+        checkpoint.save("training", {"factors": factors, "func_para": func_para, "init_mu": init_mu,
+                                     "init_alpha": init_alpha, "mu": m.mu, "alpha": m.alpha,
+                                     "startprob": m.startprob_, "transmat": m.transmat_})
+    
+    return m, factors, func_para, init_mu, init_alpha, distr
+
 
+# The arguments of run_HMM (trained model, distribution and factors included). They are set before the worker
+# processes are forked, so that the workers inherit them once instead of receiving them with every chromosome.
+_run_args = None
 
-def run_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, exp_data, m, distr):
-    """Run trained HMM chromosome-wise on genomic signal and call differential peaks"""
-    output, pvalues, ratios, no_bw_files = [], [], [], []
+
+def _call_peaks(i, r, args, cores=1, writers=None, chunk=None):
+    """Decode the i-th chromosome (GenomicRegionSet <r>) with the trained HMM and return its (ratios, pvalues, output)
+    of get_peaks, or None if it has no differential signal. The signal is appended to the BigWigWriters <writers>,
+    or stored in the chunk file <chunk> (see save_chunk)."""
+    region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, factors, m, distr = args
+    end = True if i == len(region_giver) - 1 else False
+    print("- taking into account %s" % r.sequences[0].chrom, file=sys.stderr)
+    
+    exp_data = initialize(name=options.name, dims=dims, genome_path=genome, regions=r,
+                          stepsize=options.stepsize, binsize=options.binsize,
+                          bamfiles=bamfiles, exts=factors["exts"], inputs=inputs,
+                          exts_inputs=factors["exts_inputs"], debug=options.debug,
+                          verbose=False, no_gc_content=options.no_gc_content,
+                          factors_inputs=factors["factors_inputs"], chrom_sizes=chrom_sizes,
+                          tracker=tracker, norm_regions=options.norm_regions,
+                          scaling_factors_ip=factors["scaling_factors_ip"], save_wig=options.save_wig,
+                          housekeeping_genes=options.housekeeping_genes, test=TEST, report=False,
+                          chrom_sizes_dict=region_giver.get_chrom_dict(), gc_content_cov=factors["gc_content_cov"],
+                          avg_gc_content=factors["avg_gc_content"], gc_hist=factors["gc_hist"],
+                          end=end, counter=i, m_threshold=options.m_threshold, a_threshold=options.a_threshold,
+                          rmdup=options.rmdup, cores=cores, output_bw=chunk is None, bigwig_writers=writers)
+    if exp_data.no_data:
+        return None
+    if chunk is not None:
+        save_chunk(chunk, exp_data.covs)
+    
+    exp_data.compute_putative_region_index()
+    
+    if exp_data.indices_of_interest is None:
+        return None
+    
+    states = m.predict(exp_data.get_observation(exp_data.indices_of_interest))
+    
+    return get_peaks(name=options.name, states=states, DCS=exp_data, distr=distr, merge=options.merge,
+                     exts=exp_data.exts, pcutoff=options.pcutoff, debug=options.debug, p=options.par,
+                     no_correction=options.no_correction, deadzones=options.deadzones)
+
+
+def _call_peaks_unit(unit):
+    """Decode the i-th chromosome in a worker process of run_HMM, storing its signal in the chunk file <chunk>."""
+    i, r, chunk = unit
+    return _call_peaks(i, r, _run_args, chunk=chunk)
+
+
+def run_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, factors, m, distr,
+            checkpoint=None):
+    """Run trained HMM chromosome-wise on genomic signal and call differential peaks. <factors> is the dict of the
+    extension sizes, scaling factors and GC-content found on the training set (see train_HMM).
+    
+    .. note:: With more than one core (options.cores), the chromosomes are decoded by a pool of forked processes.
+              Every process stores the signal of its chromosome in a chunk file; the chunks and the peaks are
+              merged in the order of the chromosomes, so the output does not depend on the number of cores.
+              With a Checkpoint, the chunk and the peaks of every chromosome are kept in the checkpoint directory,
+              and the chromosomes stored there by an interrupted run are not decoded again.
+    """
+    global _run_args
+    output, pvalues, ratios = [], [], []
     print("Compute HMM's posterior probabilities and Viterbi path to call differential peaks", file=sys.stderr)
     
+    #the signal of every chromosome is appended to one bigWig file per BAM file
+    writers = open_output(bamfiles, dims, options, chrom_sizes, [r.chrom for r in region_giver.regionset])
+    args = (region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, factors, m, distr)
+    parallel = options.cores > 1 and len(region_giver) > 1
+    
+    #the chunk file of every chromosome, or None if its signal is written directly
+    stored, units, chunks = {}, [], []
+    chunk_dir = tempfile.mkdtemp(prefix="THOR-") if parallel and not checkpoint else None
     for i, r in enumerate(region_giver):
-        end = True if i == len(region_giver) - 1 else False
-        print("- taking into account %s" % r.sequences[0].chrom, file=sys.stderr)
-        
-        exp_data = initialize(name=options.name, dims=dims, genome_path=genome, regions=r,
-                              stepsize=options.stepsize, binsize=options.binsize,
-                              bamfiles=bamfiles, exts=exp_data.exts, inputs=inputs,
-                              exts_inputs=exp_data.exts_inputs, debug=options.debug,
-                              verbose=False, no_gc_content=options.no_gc_content,
-                              factors_inputs=exp_data.factors_inputs, chrom_sizes=chrom_sizes,
-                              tracker=tracker, norm_regions=options.norm_regions,
-                              scaling_factors_ip=exp_data.scaling_factors_ip, save_wig=options.save_wig,
-                              housekeeping_genes=options.housekeeping_genes, test=TEST, report=False,
-                              chrom_sizes_dict=region_giver.get_chrom_dict(), gc_content_cov=exp_data.gc_content_cov,
-                              avg_gc_content=exp_data.avg_gc_content, gc_hist=exp_data.gc_hist,
-                              end=end, counter=i, m_threshold=options.m_threshold, a_threshold=options.a_threshold,
-                              rmdup=options.rmdup)
-        if exp_data.no_data:
-            continue
-        
-        no_bw_files.append(i)
-        exp_data.compute_putative_region_index()
+        if checkpoint:
+            chunks.append(checkpoint.filename("chromosome-%d" % i, ".npz"))
+            data = checkpoint.load("chromosome-%d" % i)
+            if data is not None:
+                stored[i] = data["peaks"]
+                continue
+            if os.path.exists(chunks[i]):
+                os.remove(chunks[i])
+        else:
+            chunks.append(os.path.join(chunk_dir, "%d.npz" % i) if chunk_dir else None)
+        units.append((i, r, chunks[i]))
+    
+    pool = None
+    try:
+        if parallel and len(units) > 1:
+            _run_args = args
+            tracker.file.flush()
+            pool = multiprocessing.Pool(processes=min(options.cores, len(units)))
+            computed = pool.imap(_call_peaks_unit, units, chunksize=1)
+        else:
+            computed = (_call_peaks(i, r, args, options.cores, writers, chunk) for i, r, chunk in units)
         
-        if exp_data.indices_of_interest is None:
+        results = []
+        for i in range(len(region_giver)):
+            if i in stored:
+                peaks = stored[i]
+            else:
+                peaks = next(computed)
+                if checkpoint:
+                    checkpoint.save("chromosome-%d" % i, {"peaks": peaks})
+            if chunks[i] and os.path.exists(chunks[i]):
+                for k, writer in enumerate(writers):
+                    writer.add_chunk(chunks[i], k)
+                if not checkpoint:
+                    os.remove(chunks[i])
+            results.append(peaks)
+    finally:
+        if pool is not None:
+            pool.close()
+            pool.join()
+            _run_args = None
+        if chunk_dir:
+            shutil.rmtree(chunk_dir, ignore_errors=True)
+    
+    for peaks in results:
+        if peaks is None:
             continue
-        
-        states = m.predict(exp_data.get_observation(exp_data.indices_of_interest))
-        
-        inst_ratios, inst_pvalues, inst_output = get_peaks(name=options.name, states=states, DCS=exp_data,
-                                                           distr=distr, merge=options.merge, exts=exp_data.exts,
-                                                           pcutoff=options.pcutoff, debug=options.debug, p=options.par,
-                                                           no_correction=options.no_correction,
-                                                           deadzones=options.deadzones)
-
+        inst_ratios, inst_pvalues, inst_output = peaks
         output += inst_output
         pvalues += inst_pvalues
         ratios += inst_ratios
@@ -145,7 +278,8 @@ def run_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs,
     _output_BED(options.name, res_output, res_pvalues, res_filter_pass)
     _output_narrowPeak(options.name, res_output, res_pvalues, res_filter_pass)
     
-    merge_output(bamfiles, dims, options, no_bw_files, chrom_sizes)
+    for writer in writers:
+        writer.close()
 
 
 def main():
@@ -153,9 +287,13 @@ def main():
 
     tracker = Tracker(options.name + '-setup.info', bamfiles, genome, chrom_sizes, dims, inputs, options, __version__)
     region_giver = RegionGiver(chrom_sizes, options.regions)
-    m, exp_data, func_para, init_mu, init_alpha, distr = train_HMM(region_giver, options, bamfiles, genome,
-                                                                   chrom_sizes, dims, inputs, tracker)
+    #the parameters are taken before training, which sets the extension sizes of options
+    checkpoint = Checkpoint(options.checkpoint_dir, get_parameters(options, bamfiles, genome, chrom_sizes, dims,
+                                                                   inputs)) if options.checkpoint_dir else None
+    m, factors, func_para, init_mu, init_alpha, distr = train_HMM(region_giver, options, bamfiles, genome,
+                                                                  chrom_sizes, dims, inputs, tracker, checkpoint)
     
-    run_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, exp_data, m, distr)
+    run_HMM(region_giver, options, bamfiles, genome, chrom_sizes, dims, inputs, tracker, factors, m, distr,
+            checkpoint)
     
     _write_info(tracker, options.report, func_para=func_para, init_mu=init_mu, init_alpha=init_alpha, m=m)
@@ -67,27 +67,22 @@ class BinomialHMM(_BaseHMM):
         self.n_features = 2 #emission dimension
         self.init_state_seq = init_state_seq
         self.count_s1, self.count_s2 = 0, 0
-        self.lookup_logpmf = {}
 
     def _compute_log_likelihood(self, X):
-        res = []
+        """Return the log-likelihood of the observations <X> (rows) in every state (columns), the sum over the
+        replicates of both conditions. The log-pmf is computed once per distinct count and looked up for every
+        observation."""
+        values, inverse = np.unique(np.asarray(X, dtype=np.int64), return_inverse=True)
+        inverse = inverse.reshape(np.shape(X))
+        res = np.zeros((len(inverse), self.n_components))
+        for i in range(self.n_components): #over number of HMM's state
+            for j in range(self.n_features): #over dim
+                lookup = binom.logpmf(values, self.n[j], self.p[j][i])
+                it = range(self.dim[0]) if j == 0 else range(self.dim[0], self.dim[0] + self.dim[1]) #grab proper observation
+                for k in it:
+                    res[:, i] += lookup[inverse[:, k]]
         
-        for x in X: #over all observations
-            row = []
-            for i in range(self.n_components): #over number of HMM's state
-                r_sum = 0
-                for j in range(self.n_features): #over dim
-                    it = range(self.dim[0]) if j == 0 else range(self.dim[0], self.dim[0] + self.dim[1]) #grab proper observation
-                    for k in it:
-                        index = (int(x[k]), self.p[j][i], self.n[j])
-                        if not self.lookup_logpmf.has_key( index ):
-                            self.lookup_logpmf[index] = binom.logpmf(x[k], self.n[j], self.p[j][i])
-                        r_sum += self.lookup_logpmf[index]
-                row.append(r_sum)
-        
-            res.append(row)
-        
-        return np.asarray(res)
+        return res
     
 
     def _generate_sample_from_state(self, state, random_state=None):
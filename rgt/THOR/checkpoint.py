@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+THOR detects differential peaks in multiple ChIP-seq profiles associated
+with two distinct biological conditions.
+
+Copyright (C) 2014-2016 Manuel Allhoff (allhoff@aices.rwth-aachen.de)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+@author: Manuel Allhoff
+"""
+
+from __future__ import print_function
+import os
+import sys
+import json
+import pickle
+import hashlib
+
+# Version of the checkpoint files; files of other versions are not used
+CHECKPOINT_VERSION = 1
+
+# Options of THOR which change the results of a run
+OPTIONS = ["binsize", "stepsize", "exts", "exts_inputs", "factors_inputs", "scaling_factors_ip", "no_gc_content",
+           "rmdup", "m_threshold", "a_threshold", "foldchange", "threshold", "size_ts", "hmm_free_para", "poisson",
+           "pcutoff", "par", "merge", "no_correction", "singlestrand"]
+# Options of THOR naming input files, which are recognized by their size and modification time
+FILE_OPTIONS = ["regions", "norm_regions", "housekeeping_genes", "deadzones"]
+# Stages stored before the peaks of the chromosomes; a run holding one of them is resumed
+STAGES = ["extension_sizes", "training"]
+
+
+def _file_stamp(p):
+    """Return [path, size, modification time] of an existing file, or the path."""
+    if not p or not os.path.isfile(p):
+        return p
+    status = os.stat(p)
+    return [os.path.realpath(p), status.st_size, int(status.st_mtime)]
+
+
+def get_parameters(options, bamfiles, genome, chrom_sizes, dims, inputs):
+    """Return the dict of the parameters of a THOR run which a checkpoint has to match."""
+    parameters = {"version": CHECKPOINT_VERSION, "dims": list(dims), "genome": _file_stamp(genome),
+                  "chrom_sizes": _file_stamp(chrom_sizes), "bamfiles": [_file_stamp(f) for f in bamfiles],
+                  "inputs": [_file_stamp(f) for f in inputs or []]}
+    for name in OPTIONS:
+        parameters[name] = getattr(options, name, None)
+    for name in FILE_OPTIONS:
+        parameters[name] = _file_stamp(getattr(options, name, None))
+    return parameters
+
+
+def get_key(parameters):
+    """Return the hash of the parameters of a run, which is stored with every stage."""
+    return hashlib.sha1(json.dumps(parameters, sort_keys=True)).hexdigest()
+
+
+def _read(filename):
+    """Return the dict stored in the checkpoint file <filename>, or None if it is missing or not readable."""
+    try:
+        with open(filename, "rb") as f:
+            stored = pickle.load(f)
+    except Exception:
+        # missing, truncated or foreign files are computed again
+        return None
+    if not isinstance(stored, dict) or "key" not in stored or "data" not in stored:
+        return None
+    return stored
+
+
+def is_resumed(directory, parameters):
+    """Return whether <directory> holds a stage stored by a run with <parameters>."""
+    key = get_key(parameters)
+    for stage in STAGES:
+        stored = _read(os.path.join(directory, stage + ".pkl"))
+        if stored is not None and stored["key"] == key:
+            return True
+    return False
+
+
+class Checkpoint:
+    """*Keyword arguments:*
+
+        - directory -- Directory of the checkpoint files.
+        - parameters -- Parameters of the run (see get_parameters).
+
+    .. note:: The results of every stage of a run are stored in one file <stage>.pkl together with the hash of the
+              parameters of the run. A re-invoked run loads the stages stored with the same hash instead of computing
+              them again; stages stored by runs with other parameters are computed again and overwritten.
+    """
+
+    def __init__(self, directory, parameters):
+        self.directory = directory
+        self.key = get_key(parameters)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+    def filename(self, stage, ext=".pkl"):
+        """Return the path of the file of <stage> with the extension <ext>."""
+        return os.path.join(self.directory, stage + ext)
+
+    def load(self, stage):
+        """Return the data stored for <stage> by a run with the same parameters, or None."""
+        stored = _read(self.filename(stage))
+        if stored is None:
+            return None
+        if stored["key"] != self.key:
+            print("Checkpoint of %s does not match the parameters of this run, compute it again" % stage,
+                  file=sys.stderr)
+            return None
+        print("Load %s from checkpoint" % stage, file=sys.stderr)
+        return stored["data"]
+
+    def save(self, stage, data):
+        """Store the data (a dict) of <stage>."""
+        filename = self.filename(stage)
+        temporary = filename + "." + str(os.getpid())
+        with open(temporary, "wb") as f:
+            pickle.dump({"key": self.key, "data": data}, f, pickle.HIGHEST_PROTOCOL)
+        os.rename(temporary, filename)
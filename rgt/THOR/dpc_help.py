@@ -27,10 +27,13 @@ from datetime import datetime
 from rgt.THOR.postprocessing import merge_delete, filter_deadzones
 from MultiCoverageSet import MultiCoverageSet
 from rgt.GenomicRegionSet import GenomicRegionSet
-from rgt.THOR.get_extension_size import get_extension_size
-from rgt.THOR.get_fast_gen_pvalue import get_log_pvalue_new
+from rgt.THOR.get_extension_size import get_extension_sizes
+from rgt.THOR.get_fast_gen_pvalue import get_log_pvalues
+from rgt.THOR.checkpoint import get_parameters, is_resumed
 from input_parser import input_parser
-from rgt.Util import which, npath
+from rgt.Util import npath
+from rgt.BigWigWriter import BigWigWriter
+from rgt.CoverageCache import default_cache_dir, set_coverage_cache
 from rgt import __version__
 
 # External
@@ -45,36 +48,14 @@ import matplotlib.pyplot as plt
 FOLDER_REPORT = None
 
 
-def merge_output(bamfiles, dims, options, no_bw_files, chrom_sizes):
+def open_output(bamfiles, dims, options, chrom_sizes, chroms):
+    """Return one BigWigWriter per BAM file, to which the signal of every chromosome is appended."""
+    writers = []
     for i in range(len(bamfiles)):
         rep = i if i < dims[0] else i - dims[0]
         sig = 1 if i < dims[0] else 2
-
-        temp_bed = npath(options.name + '-s%s-rep%s_temp.bed' % (sig, rep))
-
-        files = [options.name + '-' + str(j) + '-s%s-rep%s.bw' %(sig, rep) for j in no_bw_files]
-        if len(no_bw_files) > len(bamfiles):
-            files = filter(lambda x: isfile(x), files)
-            t = ['bigWigMerge'] + files + [temp_bed]
-            c = " ".join(t)
-            os.system(c)
-
-            os.system("LC_COLLATE=C sort -k1,1 -k2,2n " + temp_bed + ' > ' + temp_bed +'.sort')
-
-            t = ['bedGraphToBigWig', temp_bed + '.sort', chrom_sizes, options.name + '-s%s-rep%s.bw' % (sig, rep)]
-            c = " ".join(t)
-            os.system(c)
-
-            for f in files:
-                os.remove(f)
-            os.remove(temp_bed)
-            os.remove(temp_bed + ".sort")
-        else:
-            ftarget = [options.name + '-s%s-rep%s.bw' %(sig, rep) for j in no_bw_files]
-            for i in range(len(ftarget)):
-                c = ['mv', files[i], ftarget[i]]
-                c = " ".join(c)
-                os.system(c)
+        writers.append(BigWigWriter(options.name + '-s%s-rep%s.bw' % (sig, rep), chrom_sizes, chroms=chroms))
+    return writers
 
 
 def _func_quad_2p(x, a, c):
@@ -222,9 +203,12 @@ def dump_posteriors_and_viterbi(name, posteriors, DCS, states):
     g.close()
 
 
-def _compute_pvalue((x, y, side, distr)):
-    a, b = int(np.mean(x)), int(np.mean(y))
-    return -get_log_pvalue_new(a, b, side, distr)
+def _compute_pvalues(data, distr):
+    """Return the array of the -log10 p-values of the list <(x, y, side)>, where x and y are the counts of the
+    replicates or their sum"""
+    a = [int(np.mean(x)) for x, y, side in data]
+    b = [int(np.mean(y)) for x, y, side in data]
+    return -get_log_pvalues(a, b, [side for x, y, side in data], distr)
 
 
 def _get_log_ratio(l1, l2):
@@ -272,13 +256,13 @@ def _merge_consecutive_bins(tmp_peaks, distr):
             i += 1
         
         side = 'l' if strand == '+' else 'r'
-        pvalues.append((v1, v2, side, distr))
+        pvalues.append((v1, v2, side))
         
         ratio = _get_log_ratio(tmp_pos, tmp_neg)
         peaks.append((c, s, e, v1, v2, strand, ratio))
         i += 1
     
-    pvalues = map(_compute_pvalue, pvalues)
+    pvalues = _compute_pvalues(pvalues, distr).tolist()
     assert len(pvalues) == len(peaks)
     
     return pvalues, peaks
@@ -318,13 +302,13 @@ def get_peaks(name, DCS, states, exts, merge, distr, pcutoff, debug, no_correcti
         
         tmp_peaks.append((chrom, start, end, cov1, cov2, strand, cov1_strand, cov2_strand))
         side = 'l' if strand == '+' else 'r'
-        tmp_data.append((sum(cov1), sum(cov2), side, distr))
+        tmp_data.append((sum(cov1), sum(cov2), side))
     
     if not tmp_data:
         print('no data', file=sys.stderr)
         return [], [], []
     
-    tmp_pvalues = map(_compute_pvalue, tmp_data)
+    tmp_pvalues = _compute_pvalues(tmp_data, distr)
     per = np.percentile(tmp_pvalues, p)
     
     tmp = []
@@ -380,8 +364,8 @@ def _output_ext_data(ext_data_list, bamfiles):
     plt.close()
 
 
-def _compute_extension_sizes(bamfiles, exts, inputs, exts_inputs, report):
-    """Compute Extension sizes for bamfiles and input files"""
+def _compute_extension_sizes(bamfiles, exts, inputs, exts_inputs, report, cores=1):
+    """Compute Extension sizes for bamfiles and input files, the bamfiles in parallel with <cores> processes"""
     start = 0
     end = 600
     ext_stepsize = 5
@@ -390,10 +374,9 @@ def _compute_extension_sizes(bamfiles, exts, inputs, exts_inputs, report):
     #compute extension size
     if not exts:
         print("Computing read extension sizes for ChIP-seq profiles", file=sys.stderr)
-        for bamfile in bamfiles:
-            e, ext_data = get_extension_size(bamfile, start=start, end=end, stepsize=ext_stepsize)
-            exts.append(e)
-            ext_data_list.append(ext_data)
+        sizes, ext_data_list = get_extension_sizes(bamfiles, start=start, end=end, stepsize=ext_stepsize,
+                                                   cores=cores)
+        exts.extend(sizes)
     
     if report and ext_data_list:
         _output_ext_data(ext_data_list, bamfiles)
@@ -419,7 +402,7 @@ def initialize(name, dims, genome_path, regions, stepsize, binsize, bamfiles, ex
                inputs, exts_inputs, factors_inputs, chrom_sizes, verbose, no_gc_content, \
                tracker, debug, norm_regions, scaling_factors_ip, save_wig, housekeeping_genes, \
                test, report, chrom_sizes_dict, counter, end, gc_content_cov=None, avg_gc_content=None, \
-               gc_hist=None, output_bw=True, save_input=False, m_threshold=80, a_threshold=95, rmdup=False):
+               gc_hist=None, output_bw=True, save_input=False, m_threshold=80, a_threshold=95, rmdup=False, cores=1, bigwig_writers=None):
     """Initialize the MultiCoverageSet"""
     regionset = regions
     regionset.sequences.sort()
@@ -430,7 +413,7 @@ def initialize(name, dims, genome_path, regions, stepsize, binsize, bamfiles, ex
     else:
         norm_regionset = None
         
-    exts, exts_inputs = _compute_extension_sizes(bamfiles, exts, inputs, exts_inputs, report)
+    exts, exts_inputs = _compute_extension_sizes(bamfiles, exts, inputs, exts_inputs, report, cores)
     
     multi_cov_set = MultiCoverageSet(name=name, regions=regionset, dims=dims, genome_path=genome_path,
                                      binsize=binsize, stepsize=stepsize, rmdup=rmdup, path_bamfiles=bamfiles,
@@ -442,7 +425,8 @@ def initialize(name, dims, genome_path, regions, stepsize, binsize, bamfiles, ex
                                      tracker=tracker, gc_content_cov=gc_content_cov, avg_gc_content=avg_gc_content,
                                      gc_hist=gc_hist, end=end, counter=counter, output_bw=output_bw,
                                      folder_report=FOLDER_REPORT, report=report, save_input=save_input,
-                                     m_threshold=m_threshold, a_threshold=a_threshold)
+                                     m_threshold=m_threshold, a_threshold=a_threshold, cores=cores,
+                                     bigwig_writers=bigwig_writers)
     return multi_cov_set
 
 
@@ -533,9 +517,20 @@ def handle_input():
                      help="Define the A threshold of percentile for training TMM. [default: %default]")
     group.add_option("--rmdup", default=False, dest="rmdup", action="store_true",
                      help="Remove the duplicate reads [default: %default]")
+    group.add_option("--cores", default=1, dest="cores", type="int",
+                     help="Number of processes computing the coverage of the BAM files and decoding the chromosomes "
+                          "with the trained HMM. [default: %default]")
+    group.add_option("--cache-dir", default=default_cache_dir(), dest="cache_dir", type="string",
+                     help="Directory caching the coverage of the BAM files between runs; an empty string disables "
+                          "the cache. [default: %default]")
+    group.add_option("--checkpoint-dir", default=None, dest="checkpoint_dir", type="string",
+                     help="Directory storing the results of every stage of the run (extension sizes, training, "
+                          "chromosomes). A run re-invoked with the same name, parameters and checkpoint directory "
+                          "skips the stages found there. [default: %default]")
     parser.add_option_group(group)
 
     (options, args) = parser.parse_args()
+    set_coverage_cache(options.cache_dir)
     options.save_wig = False
     options.exts_inputs = None
     options.verbose = False
@@ -595,13 +590,22 @@ def handle_input():
         d = str(datetime.now()).replace("-", "_").replace(":", "_").replace(" ", "_").replace(".", "_").split("_")
         options.name = "THOR-exp" + "-" + "_".join(d[:len(d) - 1])
 
-    if not which("wigToBigWig") or not which("bedGraphToBigWig") or not which("bigWigMerge"):
-        print("Warning: wigToBigWig, bigWigMerge or bedGraphToBigWig not found! Signal will not be stored!",
-              file=sys.stderr)
+    if options.exts is None:
+        options.exts = []
+
+    if options.exts_inputs is None:
+        options.exts_inputs = []
+
+    #only a run resumed from a checkpoint of the same parameters may overwrite the files of the experiment
+    resumed = False
+    if options.checkpoint_dir:
+        options.checkpoint_dir = npath(options.checkpoint_dir)
+        resumed = is_resumed(options.checkpoint_dir, get_parameters(options, bamfiles, genome, chrom_sizes, dims,
+                                                                    inputs))
 
     if options.outputdir:
         options.outputdir = npath(options.outputdir)
-        if isdir(options.outputdir) and sum(
+        if isdir(options.outputdir) and not resumed and sum(
                 map(lambda x: x.startswith(options.name), os.listdir(options.outputdir))) > 0:
             parser.error("Output directory exists and contains files with names starting with your chosen experiment "
                          "name! Do nothing to prevent file overwriting!")
@@ -612,15 +616,13 @@ def handle_input():
 
     options.name = join(options.outputdir, options.name)
 
-    if isdir(join(options.outputdir, 'report_'+basename(options.name))):
+    if isdir(join(options.outputdir, 'report_'+basename(options.name))) and not resumed:
         parser.error("Folder 'report_"+basename(options.name)+"' already exits in output directory!" 
                      "Do nothing to prevent file overwriting! "
                      "Please rename report folder or change working directory of THOR with the option --output-dir")
 
-    if options.report:
-        os.mkdir(join(options.outputdir, 'report_'+basename(options.name)+"/"))
-        os.mkdir(join(options.outputdir, 'report_'+basename(options.name), 'pics/'))
-        os.mkdir(join(options.outputdir, 'report_'+basename(options.name), 'pics/data/'))
+    if options.report and not isdir(join(options.outputdir, 'report_'+basename(options.name), 'pics/data/')):
+        os.makedirs(join(options.outputdir, 'report_'+basename(options.name), 'pics/data/'))
 
     global FOLDER_REPORT
     global FOLDER_REPORT_PICS
@@ -640,10 +642,4 @@ def handle_input():
     if not genome:
         print("Warning: Do not compute GC-content, as there is no genome file", file=sys.stderr)
 
-    if options.exts is None:
-        options.exts = []
-
-    if options.exts_inputs is None:
-        options.exts_inputs = []
-
     return options, bamfiles, genome, chrom_sizes, dims, inputs
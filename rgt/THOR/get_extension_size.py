@@ -21,7 +21,7 @@ Estimate extension size of reads for an ChIP-seq experiment.
 Author: Manuel Allhoff
 
 Calculate the cross correlation between coverage of forward and backward reads
-on first chromosome.
+on the chromosomes with the most reads.
 Methods is based on:
 
 Kharchenko et al., Design and analysis of ChIP-seq experiments for DNA-binding
@@ -32,20 +32,20 @@ Methods:
 get_extension_size(bamfile)
 Return shift/extension size of reads descriebed by BAM file.
 
+get_extension_sizes(bamfiles, cores)
+Return shift/extension sizes and cross-correlation curves of several BAM files.
+
 @author: Manuel Allhoff
 
 """
 
 from __future__ import print_function
+import multiprocessing
+import numpy as np
 import pysam
 
-cov_f = {}
-cov_r = {}
-
-
-def get_value(d, x):
-    """Return d[x] of dictionary d or 0"""
-    return d[x] if d.has_key(x) else 0
+# Number of positions of a chromosome correlated by one FFT (a power of two)
+FFT_SIZE = 2 ** 20
 
 
 def get_read_size(filename):
@@ -65,54 +65,115 @@ def get_read_size(filename):
     return sum(s) / len(s)
 
 
-def init_cov(filename):
-    file = pysam.Samfile(filename, "rb")
+def get_chromosomes(f, n):
+    """Return the names of the <n> chromosomes of the opened BAM file <f> with the most mapped reads."""
+    try:
+        stats = [(-s.mapped, i, s.contig) for i, s in enumerate(f.get_index_statistics())]
+    except (AttributeError, ValueError):
+        return list(f.references[:n])
+    return [c for m, i, c in sorted(stats)[:n] if m < 0] or list(f.references[:1])
 
-    for read in file.fetch(file.references[0]):
+
+def get_positions(f, chrom):
+    """Return the sorted arrays of the distinct positions of the forward and of the reverse reads on chromosome
+    <chrom> of the opened BAM file <f>."""
+    forward, reverse = [], []
+    for read in f.fetch(chrom):
         if not read.is_unmapped:
             if not read.seq:
                 h = 0
             else:
                 h = len(read.seq)
-            pos = read.pos + read.rlen - h if read.is_reverse else read.pos
             if read.is_reverse:
-                if not cov_r.has_key(pos):
-                    cov_r[pos] = 1
+                reverse.append(read.pos + read.rlen - h)
             else:
-                if not cov_f.has_key(pos):
-                    cov_f[pos] = 1
-
-
-def ccf(k):
-    """Return value of cross-correlation function"""
-    s = 0
-    forward_keys = set(cov_f.keys())
-    reverse_keys = set(map(lambda x: x - k, cov_r.keys()))
-    keys = forward_keys & reverse_keys
-
-    for p in keys:
-        s += get_value(cov_f, p) & get_value(cov_r, p + k)
-
-    return s, k
-
-
-def get_extension_size(filename, start=0, end=600, stepsize=5):
-    """Return extension/shift size of reads and all computed values of the convolution. 
-    Search value with a resolution of <stepsize> from start to end."""
+                forward.append(read.pos)
+    return np.unique(np.array(forward, dtype=np.int64)), np.unique(np.array(reverse, dtype=np.int64))
+
+
+def ccf(forward, reverse, first, last):
+    """Return the cross-correlation function of the sorted position arrays <forward> and <reverse>, that is the
+    number of forward positions p with a reverse position p+k, for all shifts k from <first> to <last>.
+    
+    .. note:: The positions are taken as indicator vectors and correlated by FFT in windows of the chromosome, so
+              that the memory does not depend on the size of the chromosome.
+    """
+    shifts = last - first + 1
+    window = FFT_SIZE - shifts + 1
+    while window < shifts:
+        window *= 2
+    size = window + shifts - 1
+    n = 1 << int(size - 1).bit_length()
+    result = np.zeros(shifts, dtype=np.int64)
+    if len(forward) == 0 or len(reverse) == 0:
+        return result
+    
+    f = np.zeros(n)
+    r = np.zeros(n)
+    for a in range(forward[0] - forward[0] % window, forward[-1] + 1, window):
+        fw = forward[np.searchsorted(forward, a):np.searchsorted(forward, a + window)] - a
+        rw = reverse[np.searchsorted(reverse, a + first):np.searchsorted(reverse, a + first + size)] - (a + first)
+        if len(fw) == 0 or len(rw) == 0:
+            continue
+        f[:] = 0
+        r[:] = 0
+        f[fw] = 1
+        r[rw] = 1
+        # c[j] = sum of f[p] * r[p + j], the positions of r start at shift <first>
+        c = np.fft.irfft(np.fft.rfft(r) * np.conj(np.fft.rfft(f)), n)[:shifts]
+        result += np.rint(c).astype(np.int64)
+    return result
+
+
+def get_extension_size(filename, start=0, end=600, stepsize=5, chromosomes=3):
+    """Return extension/shift size of reads and all computed values of the convolution as list of
+    (value, shift) pairs. Search value with a resolution of <stepsize> from start to end on the <chromosomes>
+    chromosomes with the most reads."""
     read_length = get_read_size(filename)
     start -= read_length
-
-    init_cov(filename)
-
-    r = map(ccf, range(start, end, stepsize))
-
-    r = map(lambda x: (x[0], x[1]), r)
-
+    shifts = range(start, end, stepsize)
+    
+    values = np.zeros(shifts[-1] - start + 1, dtype=np.int64)
+    f = pysam.Samfile(filename, "rb")
+    try:
+        for chrom in get_chromosomes(f, chromosomes):
+            forward, reverse = get_positions(f, chrom)
+            values += ccf(forward, reverse, start, shifts[-1])
+    finally:
+        f.close()
+    
+    r = [(int(values[k - start]), k) for k in shifts]
+    
     # print('extension size is %s' %max(r[read_length/stepsize*2:])[1])
 
     return max(r[read_length / stepsize * 2:])[1], r
 
 
+def _extension_size_unit(job):
+    """Estimate the extension size of one BAM file (in a worker process of get_extension_sizes)."""
+    filename, start, end, stepsize, chromosomes = job
+    return get_extension_size(filename, start, end, stepsize, chromosomes)
+
+
+def get_extension_sizes(filenames, start=0, end=600, stepsize=5, chromosomes=3, cores=1):
+    """Return the list of the extension sizes and the list of the cross-correlation curves (see get_extension_size)
+    of the BAM files <filenames>.
+    
+    .. note:: With more than one core, the BAM files are distributed among a pool of forked processes.
+    """
+    jobs = [(filename, start, end, stepsize, chromosomes) for filename in filenames]
+    if cores > 1 and len(jobs) > 1:
+        pool = multiprocessing.Pool(processes=min(cores, len(jobs)))
+        try:
+            results = pool.map(_extension_size_unit, jobs, chunksize=1)
+        finally:
+            pool.close()
+            pool.join()
+    else:
+        results = map(_extension_size_unit, jobs)
+    return [e for e, r in results], [r for e, r in results]
+
+
 if __name__ == '__main__':
     # a, b = get_extension_size('/home/manuel/workspace/cluster_p/blueprint/raw/input/C000S5H1.Input.bwa_filtered.20130415.bam')
     a, b = get_extension_size('/home/manuel/workspace/cluster_p/allhoff/project_THOR/data/payton/FL1_H3K27ac_input.bam')
@@ -32,7 +32,9 @@ import numpy as np
 from rgt.THOR.neg_bin import NegBin
 
 lookup_pmf = {}
-lookup_pvalue = {}
+
+# Maximal number of count sums whose tail sums are kept per distribution (see get_log_pvalues)
+MAX_TAIL_SUMS = 4096
 
 
 def get_value(x, distr):
@@ -92,18 +94,70 @@ def compute_pvalue(distr, N, side, current_p, x):
 
 def get_log_pvalue_new(x, y, side, distr):
     """compute log10 p-value"""
+    return float(get_log_pvalues([x], [y], side, distr)[0])
+
+
+def _log_pmf(distr, size):
+    """Return the array of the log-pmf of the counts 0, ..., size-1 of the distribution. The array is computed once
+    per distribution and kept in <distr> (key 'log_pmf'), extended when larger counts are asked for."""
+    log_pmf = distr.get('log_pmf')
+    if log_pmf is None or len(log_pmf) < size:
+        size = max(size, 2 * len(log_pmf) if log_pmf is not None else 0)
+        counts = np.arange(size)
+        if distr['distr_name'] == 'binomial':
+            log_pmf = binom.logpmf(counts, distr['n'], distr['p'])
+        else:
+            log_pmf = distr['distr'].logpdf_array(counts)
+        distr['log_pmf'] = log_pmf
+        distr['tail_sums'] = {}
+    return log_pmf
+
+
+def _tail_sums(distr, N):
+    """Return the cumulative log-sums of log_pmf(i) + log_pmf(N-i) for i = 0, ..., N//2. At most MAX_TAIL_SUMS
+    arrays are kept in <distr> (key 'tail_sums')."""
+    tail_sums = distr['tail_sums']
+    if N not in tail_sums:
+        if len(tail_sums) >= MAX_TAIL_SUMS: tail_sums.clear()
+        log_pmf = distr['log_pmf']
+        half = N // 2
+        tail_sums[N] = np.logaddexp.accumulate(log_pmf[:half + 1] + log_pmf[N - half:N + 1][::-1])
+    return tail_sums[N]
+
+
+def get_log_pvalues(x, y, side, distr):
+    """Compute the log10 p-values of the pairs of counts <x>, <y> at once (see get_log_pvalue_new).
+
+    *Keyword arguments:*
+
+    - x -- Array of the counts of the first condition.
+    - y -- Array of the counts of the second condition.
+    - side -- Array of the sides of the test ('l' or 'r'), or one side for all pairs.
+    - distr -- Distribution of the counts: {'distr_name': 'binomial', 'n': .., 'p': ..} or {'distr_name': 'nb',
+      'distr': NegBin}.
+
+    .. note:: The log-pmf of the distribution is computed once up to the largest count sum. The p-value of a pair
+              with sum N is the share of the tail of the sums log_pmf(i) + log_pmf(N-i), which are accumulated once
+              per N for all pairs (and kept in a bounded cache, see _tail_sums).
+    """
+    x, y = np.asarray(x, dtype=np.int64), np.asarray(y, dtype=np.int64)
+    left = np.asarray(side) == 'l'
+    x, y = np.where(left, y, x), np.where(left, x, y)
     N = x + y
-    if side == 'l':
-        x, y = y, x
-        side = 'r'
-
-    if lookup_pvalue.has_key((x, y, 'r')):
-        return lookup_pvalue[(x, y, 'r')]
-    else:
-        current_p = get_log_value(x, distr) + get_log_value(y, distr)
-        pvalue = compute_pvalue(distr, N, side, current_p, x) / log(10)
-        lookup_pvalue[(x, y, side)] = pvalue
-        return pvalue
+    pvalues = np.empty(len(N))
+    if len(N) == 0:
+        return pvalues
+
+    with np.errstate(all='ignore'):
+        _log_pmf(distr, N.max() + 1)
+        order = np.argsort(N, kind='mergesort')
+        borders = np.concatenate(([0], np.flatnonzero(np.diff(N[order])) + 1, [len(N)]))
+        for first, last in zip(borders[:-1], borders[1:]):
+            rows = order[first:last]
+            n = int(N[rows[0]])
+            sums = _tail_sums(distr, n)
+            pvalues[rows] = sums[np.minimum(x[rows], n // 2)] - (log(2) + sums[-1])
+    return pvalues / log(10)
 
 
 def change_nb_WP2NB1(n, p):
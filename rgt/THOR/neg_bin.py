@@ -30,6 +30,7 @@ from numpy.random import random_sample
 import sys
 from math import fabs
 from scipy.stats import nbinom
+from scipy.special import gammaln
 
 class NegBin():
     """Negative Binomial distribution (NB1) with continuous parameter r,
@@ -83,6 +84,15 @@ class NegBin():
             self.map_logpdf[x] = v_log
         
         return self.map_logpdf[x]
+    
+    def logpdf_array(self, x):
+        """Return the array of the log-pmf of the counts in array <x>, computed with NumPy (see _get_value_log)."""
+        x = np.asarray(x, dtype=np.float64)
+        mu, v = self.mu, 1./self.alpha
+        if mu <= 0 or v <= 0:
+            return np.ones(len(x)) #as _get_value_log on a ValueError
+        with np.errstate(all='ignore'):
+            return gammaln(x+v) - gammaln(x+1) - gammaln(v) + v*log(v) - v*log(v+mu) + x*log(mu) - x*log(v+mu)
         
     def rvs(self):
         if not self.bins:
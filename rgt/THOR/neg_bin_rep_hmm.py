@@ -173,26 +173,19 @@ class NegBinRepHMM(_BaseHMM):
                 return 1e-300
     
     def _compute_log_likelihood(self, X):
-        matrix = []
-        lookup = {}
-        for x in X: #over all observations
-            row = []
-            for i in range(self.n_components): #over number of HMM's state
-                r_sum = 0
-                for j in range(self.n_features): #over dim
-                    it = range(self.dim[0]) if j == 0 else range(self.dim[0], self.dim[0] + self.dim[1]) #grab proper ob
-                    for k in it:
-                        index = (int(x[k]), i, j)
-                        if lookup.has_key( index ):
-                            r_sum += lookup[index]
-                        else:
-                            y = float(self.neg_distr[j,i].logpdf(x[k]))
-                            lookup[index] = y
-                            r_sum += y
-                row.append(r_sum)
-        
-            matrix.append(row)
-        return np.asarray(matrix)
+        """Return the log-likelihood of the observations <X> (rows) in every state (columns), the sum over the
+        replicates of both conditions. The log-pmf is computed once per distinct count and looked up for every
+        observation."""
+        values, inverse = np.unique(np.asarray(X, dtype=np.int64), return_inverse=True)
+        inverse = inverse.reshape(np.shape(X))
+        matrix = np.zeros((len(inverse), self.n_components))
+        for i in range(self.n_components): #over number of HMM's state
+            for j in range(self.n_features): #over dim
+                lookup = self.neg_distr[j,i].logpdf_array(values)
+                it = range(self.dim[0]) if j == 0 else range(self.dim[0], self.dim[0] + self.dim[1]) #grab proper ob
+                for k in it:
+                    matrix[:, i] += lookup[inverse[:, k]]
+        return matrix
     
     
     def _generate_sample_from_state(self, state, random_state=None):
@@ -20,6 +20,7 @@ from intersection_test import Intersect
 from shared_function import check_dir, print2, output_parameters,\
                             copy_em, list_all_index, output
 from plotTools import Venn
+from rgt.CoverageCache import default_cache_dir, set_coverage_cache
 dir = os.getcwd()
 """
 Statistical analysis methods and plotting tools for ExperimentalMatrix
@@ -49,6 +50,8 @@ def main():
     helpcol = "Group the data in columns by reads(needs 'factor' column), regions(needs 'factor' column), another name of column (for example, 'cell')in the header of experimental matrix, or None. (default: %(default)s)"
     helprow = "Group the data in rows by reads(needs 'factor' column), regions(needs 'factor' column), another name of column (for example, 'cell')in the header of experimental matrix, or None. (default: %(default)s)"
     helpmp = "Define the number of cores for parallel computation. (default: %(default)s)"
+    helpseed = "Define the seed of the randomization, so that the results can be reproduced. (default: %(default)s)"
+    helpcache = "Define the directory caching the coverage of the BAM files between runs; an empty string disables the cache. (default: %(default)s)"
     parser = argparse.ArgumentParser(description='Provides various Statistical analysis methods and plotting tools for ExperimentalMatrix.\
     \nAuthor: Joseph C.C. Kuo, Ivan Gesteira Costa Filho', formatter_class=argparse.ArgumentDefaultsHelpFormatter)
     subparsers = parser.add_subparsers(help='sub-command help',dest='mode')
@@ -72,6 +75,9 @@ def main():
     parser_projection.add_argument('-pw', metavar='  ', type=int, default=5, help='Define the width of single panel. (default: %(default)s)')
     parser_projection.add_argument('-ph', metavar='  ', type=int, default=3, help='Define the height of single panel. (default: %(default)s)')
     parser_projection.add_argument('-cfp', metavar='  ', type=float, default=0.01, help='Define the cutoff of the proportion. (default: %(default)s)')
+    parser_projection.add_argument('-rt', metavar='  ', type=int, default=0, help='Define how many times to randomize the query for an empirical p value instead of the binomial test, or 0. (default: %(default)s)')
+    parser_projection.add_argument('-cores', metavar='  ', type=int, default=1, help=helpmp)
+    parser_projection.add_argument('-seed', metavar='  ', type=int, default=None, help=helpseed)
     
     ################### Intersect Test ##########################################
     parser_intersect = subparsers.add_parser('intersect',help='Intersection test provides various modes of intersection to test the association between references and queries.')
@@ -91,7 +97,8 @@ def main():
     parser_intersect.add_argument('-color', action="store_true", help=helpDefinedColot)
     parser_intersect.add_argument('-show', action="store_true", help='Show the figure in the screen. (default: %(default)s)')
     parser_intersect.add_argument('-stest', metavar='  ', type=int, default= 0, help='Define the repetition time of random subregion test between reference and query. (default: %(default)s)')
-    parser_intersect.add_argument('-mp', metavar='  ', default=4, type=int, help=helpmp)
+    parser_intersect.add_argument('-cores', '-mp', metavar='  ', dest='cores', default=4, type=int, help=helpmp)
+    parser_intersect.add_argument('-seed', metavar='  ', type=int, default=None, help=helpseed)
     parser_intersect.add_argument('-pw', metavar='  ', type=int, default=3, help='Define the width of single panel. (default: %(default)s)')
     parser_intersect.add_argument('-ph', metavar='  ', type=int, default=3, help='Define the height of single panel. (default: %(default)s)')
     
@@ -107,6 +114,8 @@ def main():
     parser_jaccard.add_argument('-g', default=None, help=helpgroupbb)
     parser_jaccard.add_argument('-c', default="regions", help=helpcolorbb)
     parser_jaccard.add_argument('-organism',default='hg19', help='Define the organism. (default: %(default)s)')
+    parser_jaccard.add_argument('-cores', metavar='  ', type=int, default=1, help=helpmp)
+    parser_jaccard.add_argument('-seed', metavar='  ', type=int, default=None, help=helpseed)
     parser_jaccard.add_argument('-nlog', action="store_false", help='Set y axis of the plot not in log scale. (default: %(default)s)')
     parser_jaccard.add_argument('-color', action="store_true", help=helpDefinedColot)
     parser_jaccard.add_argument('-show', action="store_true", help='Show the figure in the screen. (default: %(default)s)')
@@ -156,6 +165,7 @@ def main():
     parser_boxplot.add_argument('-p', metavar='  ', type=float, default=0.05, help='Define the significance level for multiple test.  (default: %(default)s)')
     parser_boxplot.add_argument('-show', action="store_true", help='Show the figure in the screen. (default: %(default)s)')
     parser_boxplot.add_argument('-table', action="store_true", help='Store the tables of the figure in text format. (default: %(default)s)')
+    parser_boxplot.add_argument('-cores', metavar='  ', type=int, default=1, help=helpmp)
     
     ################### Lineplot ##########################################
     parser_lineplot = subparsers.add_parser('lineplot', help='Generate lineplot with various modes.')
@@ -189,6 +199,7 @@ def main():
     parser_lineplot.add_argument('-show', action="store_true", help='Show the figure in the screen. (default: %(default)s)')
     parser_lineplot.add_argument('-table', action="store_true", help='Store the tables of the figure in text format. (default: %(default)s)')
     parser_lineplot.add_argument('-sense', action="store_true", help='Set the plot sense-specific. (default: %(default)s)')
+    parser_lineplot.add_argument('-cache', '--cache-dir', metavar='  ', dest='cache_dir', default=default_cache_dir(), help=helpcache)
     
     ################### Heatmap ##########################################
     parser_heatmap = subparsers.add_parser('heatmap', help='Generate heatmap with various modes.')
@@ -220,6 +231,7 @@ def main():
     parser_heatmap.add_argument('-mp', action="store_true", help="Perform multiprocessing for faster computation. (default: %(default)s)")
     parser_heatmap.add_argument('-show', action="store_true", help='Show the figure in the screen. (default: %(default)s)')
     parser_heatmap.add_argument('-table', action="store_true", help='Store the tables of the figure in text format. (default: %(default)s)')
+    parser_heatmap.add_argument('-cache', '--cache-dir', metavar='  ', dest='cache_dir', default=default_cache_dir(), help=helpcache)
     
     ################### Venn Diagram ########################################
     parser_venn = subparsers.add_parser('venn', help='Generate Venn Diagram with peaks of gene list.')
@@ -297,10 +309,10 @@ def main():
                 projection.set_background(bed_path=args.bg)
             if args.union: 
                 projection.ref_union()
-                projection.projection_test(organism=args.organism)
+                projection.projection_test(organism=args.organism, repeat=args.rt, cores=args.cores, seed=args.seed)
                 print2(parameter, "\tTaking union of references as the background. ")
             else:
-                projection.projection_test(organism=args.organism)
+                projection.projection_test(organism=args.organism, repeat=args.rt, cores=args.cores, seed=args.seed)
             
             # generate pdf
             projection.plot(args.log, args.pw, args.ph)
@@ -367,7 +379,7 @@ def main():
             
             if args.stest > 0:
                 print("\tStatistical testing by randomizing the regions...")
-                inter.stest(repeat=args.stest,threshold=args.tc, mp=args.mp)
+                inter.stest(repeat=args.stest,threshold=args.tc, mp=args.cores, seed=args.seed)
             
             # generate html
             inter.gen_html(directory=args.o, title=args.t, align=50, args=args)
@@ -397,7 +409,7 @@ def main():
             jaccard.colors(args.c, args.color)
             
             # jaccard test
-            jaccard.jaccard_test(args.rt, args.organism)
+            jaccard.jaccard_test(args.rt, args.organism, cores=args.cores, seed=args.seed)
             parameter = parameter + jaccard.parameter
             t1 = time.time()
             # ploting and generate pdf
@@ -485,7 +497,7 @@ def main():
             
             # Coverage of reads on all_bed
             print2(parameter,"Step 2/5: Calculating coverage of each bam file on all regions")
-            boxplot.bedCoverage() 
+            boxplot.bedCoverage(cores=args.cores)
             t2 = time.time()
             print2(parameter,"    --- finished in {0} (H:M:S)\n".format(datetime.timedelta(seconds=round(t2-t1))))
             
@@ -563,6 +575,7 @@ def main():
             else: print2(parameter, "\nStep 2/3: Calculating the coverage to all reads and averaging")
             lineplot.group_tags(groupby=args.col, sortby=args.row, colorby=args.c)
             lineplot.gen_cues()
+            set_coverage_cache(args.cache_dir)
             lineplot.coverage(sortby=args.row, mp=args.mp, log=args.log)
             t2 = time.time()
             print2(parameter, "\t--- finished in {0} (H:M:S)".format(str(datetime.timedelta(seconds=round(t2-t1)))))
@@ -614,6 +627,7 @@ def main():
             else: print2(parameter, "\nStep 2/4: Calculating the coverage to all reads and averaging")
             lineplot.group_tags(groupby=args.col, sortby=args.row, colorby=args.c)
             lineplot.gen_cues()
+            set_coverage_cache(args.cache_dir)
             lineplot.coverage(sortby=args.s, heatmap=True, logt=args.log, mp=args.mp)
             t2 = time.time()
             print2(parameter, "    --- finished in {0} (h:m:s)".format(str(datetime.timedelta(seconds=round(t2-t1)))))
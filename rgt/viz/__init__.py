@@ -1,3 +1,3 @@
 __all__ = ["plotTools", "shared_function",
-           "combinatorial_test","intersection_test","jaccard_test","projection_test",
+           "combinatorial_test","intersection_test","jaccard_test","projection_test","permutation",
            "boxplot", "lineplot"]
\ No newline at end of file
@@ -10,7 +10,7 @@ from matplotlib.backends.backend_agg import FigureCanvasAgg as FigureCanvas
 # Local Libraries
 # Distal Libraries
 from rgt.Util import Html
-from rgt.CoverageSet import CoverageSet
+from rgt.CoverageSet import CoverageSet, compute_read_counts
 from rgt.GenomicRegionSet import GenomicRegionSet
 from rgt.ExperimentalMatrix import ExperimentalMatrix
 from shared_function import output_array, gen_tags, tag_from_r, colormap, multiple_correction,\
@@ -57,16 +57,19 @@ class Boxplot:
             self.all_bed.combine(bed)
         self.all_bed.remove_duplicates()  # all_bed is sorted!!
 
-    def bedCoverage(self):
+    def bedCoverage(self, cores=1):
         """ Return coverage matrix of multiple reads on one bed.
         bed --> GenomicRegionSet
+        cores --> Number of processes counting the reads of the BAM files
         """
-        c = []
+        jobs = []
         for rp in self.reads:
             print("    processing: ..." + rp[-45:])
             r = os.path.abspath(rp)  # Here change the relative path into absolute path
-            cov = CoverageSet(r, self.all_bed)
-            cov.coverage_from_genomicset(r)
+            jobs.append((CoverageSet(r, self.all_bed), {"bamFile": r}))
+        compute_read_counts(jobs, cores=cores)
+        c = []
+        for cov, kwargs in jobs:
             cov.normRPM()
             c.append(cov.coverage)
         self.all_table = numpy.transpose(c)
@@ -9,6 +9,7 @@ from matplotlib_venn import venn3
 # Local Libraries
 # Distal Libraries
 from shared_function import *
+from permutation import PermutationEngine
 
 # Local test
 dir = os.getcwd()
@@ -17,6 +18,22 @@ dir = os.getcwd()
 #                    Inersection test
 ###########################################################################################
 
+# Combined reference and query sets of the worker process, by (ty, i, j)
+combined_sets = {}
+
+
+def random_intersect_count(shared, key, random_state):
+    """Return the intersection counts of a random split of the combined reference and query
+    (see PermutationEngine)."""
+    references, queries = shared
+    ty, i, j, rlen, mode_count, threshold = key
+    if (ty, i, j) not in combined_sets:
+        combined_sets.clear()
+        combined_sets[(ty, i, j)] = queries[ty][j].combine(references[ty][i], change_name=False, output=True)
+    random_r, random_q = combined_sets[(ty, i, j)].random_split(size=rlen, seed=random_state)
+    return random_r.intersect_count(random_q, mode_count=mode_count, threshold=threshold)
+
+
 
 class Intersect:
     def __init__(self, reference_path, query_path, mode_count, organism):
@@ -783,24 +800,25 @@ class Intersect:
         else:
             print("*** For plotting Venn diagram, the number of references must be 2 or 3.")
 
-    def stest(self, repeat, threshold, mp):
+    def stest(self, repeat, threshold, mp=1, seed=None):
 
         print("\n\tIntersection random subsampling test:\n    Repeat " + str(repeat) + " times\n")
         self.test_time = repeat
         self.test_d = {}
         plist = OrderedDict()
+        engine = PermutationEngine(shared=(self.groupedreference, self.groupedquery), cores=mp, seed=seed)
 
         for ty in self.groupedreference.keys():
             self.test_d[ty] = {}
             plist[ty] = OrderedDict()
-            for r in self.groupedreference[ty]:
+            for i, r in enumerate(self.groupedreference[ty]):
                 if r.name in self.nalist: continue
                 print("\t" + r.name)
                 self.test_d[ty][r.name] = {}
                 plist[ty][r.name] = OrderedDict()
                 print("\t.", end="")
                 sys.stdout.flush()
-                for q in self.groupedquery[ty]:
+                for j, q in enumerate(self.groupedquery[ty]):
                     if r.name == q.name:
                         continue
                     else:
@@ -813,23 +831,9 @@ class Intersect:
                         if obs[2] == 0:
                             aveinter, chisq, p = "NA", "NA", "1"
                         else:
-                            com = q.combine(r, change_name=False, output=True)
                             # Randomization
-                            d = []
-
-                            inp = [com, self.rlen[ty][r.name], self.mode_count, threshold]
-                            mp_input = [inp for i in range(repeat)]
-
-                            pool = multiprocessing.Pool(processes=mp)
-                            mp_output = pool.map(mp_count_intersets, mp_input)
-                            pool.close()
-                            pool.join()
-
-                            # for i in range(repeat):
-                            #    random_r,random_q = com.random_split(size=self.rlen[ty][r.name])
-                            #    d.append(random_r.intersect_count(random_q, mode_count=self.mode_count, threshold=threshold))
-                            # d.append(count_intersect(random_r, random_q, mode_count=self.mode_count, threshold=threshold))
-                            da = numpy.array(mp_output)
+                            da = engine.run(random_intersect_count,
+                                            (ty, i, j, self.rlen[ty][r.name], self.mode_count, threshold), repeat)
 
                             exp_m = numpy.mean(da, axis=0)
                             # print(exp_m)
@@ -848,3 +852,4 @@ class Intersect:
                 if r in self.nalist: continue
                 for q in self.test_d[ty][r].keys():
                     self.test_d[ty][r][q][2] = plist[ty][r][q]
+        engine.close()
@@ -5,6 +5,7 @@ from __future__ import division
 # Local Libraries
 # Distal Libraries
 from shared_function import *
+from permutation import PermutationEngine
 
 # Local test
 dir = os.getcwd()
@@ -12,6 +13,16 @@ dir = os.getcwd()
 #                    Jaccard test
 ###########################################################################################
 
+
+def random_jaccard(shared, key, random_state):
+    """Return the jaccard index between a reference and a randomization of a query (see PermutationEngine)."""
+    references, queries, organism = shared
+    ty, i, j = key
+    random = queries[ty][j].random_regions(organism=organism, multiply_factor=1, overlap_result=True,
+                                           overlap_input=True, chrom_M=False, seed=random_state)
+    return references[ty][i].jaccard(random)
+
+
 class Jaccard:
     def __init__(self, reference_path, query_path):
         self.rEM, self.qEM = ExperimentalMatrix(), ExperimentalMatrix()
@@ -30,7 +41,7 @@ class Jaccard:
         self.color_list = color_groupded_region(self.qEM, self.groupedquery, colorby, definedinEM)
         # self.color_list['Background'] = '0.70'
 
-    def jaccard_test(self, runtime, organism):
+    def jaccard_test(self, runtime, organism, cores=1, seed=None):
         self.jlist = OrderedDict()
         self.realj = OrderedDict()
         self.plist = OrderedDict()
@@ -42,6 +53,8 @@ class Jaccard:
         print2(self.parameter,
                "{0:s}\t{1:s}\t{2:s}\t{3:s}\t{4:s}\t{5:s}".format("Reference", "Query", "Repeats", "True_Jaccard_index",
                                                                  "p-value", "Time"))
+        engine = PermutationEngine(shared=(self.groupedreference, self.groupedquery, organism), cores=cores,
+                                   seed=seed)
         for ty in self.groupedreference.keys():
             self.jlist[ty] = OrderedDict()
             self.realj[ty] = OrderedDict()
@@ -65,12 +78,9 @@ class Jaccard:
                             continue
                         else:
                             if q.name not in self.qlen.keys(): self.qlen[q.name] = len(q)
-                            self.jlist[ty][r.name][q.name] = []
                             self.realj[ty][r.name][q.name] = q.jaccard(r)
-                            for k in range(runtime):
-                                random = q.random_regions(organism=organism, multiply_factor=1, overlap_result=True,
-                                                          overlap_input=True, chrom_M=False)
-                                self.jlist[ty][r.name][q.name].append(r.jaccard(random))
+                            null = engine.run(random_jaccard, (ty, i, j), runtime)
+                            self.jlist[ty][r.name][q.name] = null[:, 0].tolist()
                             # How many randomizations have higher jaccard index than the real index?
                             p = len([x for x in self.jlist[ty][r.name][q.name] if
                                      x > self.realj[ty][r.name][q.name]]) / runtime
@@ -79,6 +89,7 @@ class Jaccard:
                             print2(self.parameter, r.name + "\t" + q.name + "\tx" + str(runtime) + "\t" +
                                    value2str(self.realj[ty][r.name][q.name]) + "\t" + value2str(p) + "\t" +
                                    str(datetime.timedelta(seconds=round(te - ts))))
+        engine.close()
 
     def plot(self, logT=False, pw=3, ph=3):
         """ Return boxplot from the given tables.
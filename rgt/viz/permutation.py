@@ -0,0 +1,83 @@
+# Python Libraries
+from __future__ import print_function
+from __future__ import division
+import random
+import multiprocessing
+import numpy
+
+# Number of randomizations drawn from one random stream
+CHUNK_SIZE = 16
+
+# The inputs of the running PermutationEngine. They are set before the worker processes are forked, so that the
+# workers inherit them instead of receiving them with every task.
+_shared = None
+
+###########################################################################################
+#                    Permutation engine
+###########################################################################################
+
+
+def run_chunk(task):
+    """Compute the statistics of one chunk of randomizations (in a worker process or in the main process)."""
+    statistic, key, seed, count = task
+    random_state = numpy.random.RandomState(seed)
+    return [statistic(_shared, key, random_state) for i in range(count)]
+
+
+class PermutationEngine:
+    """Run the randomizations of permutation tests in one persistent pool of worker processes.
+
+    *Keyword arguments:*
+
+        - shared -- The inputs of the statistics (e.g. the reference and query sets). They are inherited by the worker
+                    processes and passed to every statistic, so they are not pickled per task.
+        - cores -- Number of worker processes (1 computes in the main process).
+        - seed -- Seed of the randomizations (default None: drawn from the random module).
+
+    .. note:: A statistic is a module-level function statistic(shared, key, random_state) returning a number or a
+              sequence of numbers. The randomizations are split into chunks of CHUNK_SIZE, each with its own random
+              stream seeded by (seed, run, chunk), so that the results do not depend on the number of cores. Only one
+              engine can be used at a time.
+    """
+
+    def __init__(self, shared, cores=1, seed=None):
+        global _shared
+        _shared = shared
+        self.cores = max(1, cores)
+        if seed is None:
+            seed = random.randint(0, 2 ** 32 - 1)
+        self.seed = seed
+        self.runs = 0
+        self.pool = None
+
+    def run(self, statistic, key, repeat):
+        """Return the statistic of repeat randomizations as a NumPy matrix with one row per randomization.
+
+        *Keyword arguments:*
+
+            - statistic -- Module-level function computing the statistic of one randomization.
+            - key -- Small picklable value telling the statistic what to compute (e.g. the indices of the sets).
+            - repeat -- Number of randomizations.
+        """
+        tasks = [(statistic, key, [self.seed, self.runs, chunk], min(CHUNK_SIZE, repeat - start))
+                 for chunk, start in enumerate(range(0, repeat, CHUNK_SIZE))]
+        self.runs += 1
+        if repeat == 0:
+            return numpy.zeros((0, 1))
+        if self.cores == 1:
+            chunks = map(run_chunk, tasks)
+        else:
+            if self.pool is None:
+                self.pool = multiprocessing.Pool(processes=self.cores)
+            chunks = self.pool.map(run_chunk, tasks)
+        null = numpy.array([value for chunk in chunks for value in chunk], dtype=float)
+        return null.reshape(repeat, -1)
+
+    def close(self):
+        """Stop the worker processes."""
+        global _shared
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        _shared = None
@@ -10,7 +10,9 @@ import numpy
 from rgt.Util import Html
 from rgt.CoverageSet import *
 from rgt.ExperimentalMatrix import *
+from rgt.RegionSampler import RegionSampler
 from shared_function import output_array, group_refque, color_groupded_region, multiple_correction, value2str
+from permutation import PermutationEngine
 # Local test
 dir = os.getcwd()
 ###########################################################################################
@@ -18,6 +20,16 @@ dir = os.getcwd()
 ###########################################################################################
 
 
+def random_projection(shared, key, random_state):
+    """Return the number of random query midpoints inside a reference (see PermutationEngine)."""
+    references, spaces = shared
+    ty, i, size = key
+    sampler = RegionSampler(spaces[ty], seed=random_state)
+    points = sampler.sample(numpy.ones(size, dtype=numpy.int64))
+    return numpy.count_nonzero(references[ty][i].get_index().count_overlaps(points))
+
+
+
 class Projection:
     def __init__(self, reference_path, query_path):
         # Reference
@@ -72,7 +84,17 @@ class Projection:
             qlist = [ q.trim_by(background=bg) for q in self.groupedquery[ty]]
             self.groupedquery[ty] = qlist
 
-    def projection_test(self, organism):
+    def projection_test(self, organism, repeat=0, cores=1, seed=None):
+        """Test the proportion of the midpoints of every query inside every reference with a binomial test.
+
+        *Keyword arguments:*
+
+            - organism -- Define the organism
+            - repeat -- Number of randomizations of the query midpoints (default 0). If positive, the p value is the
+                        two-sided empirical p value of the number of midpoints inside the reference instead.
+            - cores -- Number of processes of the randomizations.
+            - seed -- Seed of the randomizations.
+        """
         self.bglist = OrderedDict()
         self.qlist = OrderedDict()
         self.plist = OrderedDict()
@@ -82,6 +104,19 @@ class Projection:
         # print2(self.parameter, "{0:s}\t{1:s}\t{2:s}\t{3:s}\t{4:s}".format("Reference","Background", "Query", "Proportion", "p value"))
 
         all_p = {}
+        engine = None
+        if repeat > 0:
+            # The randomized midpoints are placed in the background, or in the whole genome
+            spaces = {}
+            for ty in self.groupedquery.keys():
+                if self.background:
+                    spaces[ty] = self.background[ty].get_index().merged()
+                else:
+                    chrom_map = GenomicRegionSet("Genome")
+                    chrom_map.get_genome_data(organism=organism)
+                    spaces[ty] = chrom_map.get_index().merged()
+            engine = PermutationEngine(shared=(self.groupedreference, spaces), cores=cores, seed=seed)
+
         for ty in self.groupedquery.keys():
             # print(ty)
             self.bglist[ty] = OrderedDict()
@@ -103,6 +138,10 @@ class Projection:
                     if r.name == q.name: continue
                     else:
                         bg, ratio, p, interq = r.projection_test(q, organism, extra=True, background=bgset)
+                        if engine and p != "na":
+                            obs = int(round(ratio * len(q)))
+                            null = engine.run(random_projection, (ty, i, len(q)), repeat)[:, 0]
+                            p = min(1.0, 2 * min(numpy.mean(null >= obs), numpy.mean(null <= obs)))
                         self.bglist[ty][r.name][q.name] = bg
                         self.qlist[ty][r.name][q.name] = ratio
                         self.plist[ty][r.name][q.name] = p
@@ -111,6 +150,8 @@ class Projection:
                         # if r in self.backgrounds.keys(): pass
                         # else: self.backgrounds[r] = bg
 
+        if engine: engine.close()
+
         # multiple test correction
         multiple_correction(self.plist)
 
@@ -407,13 +407,6 @@ def compute_coverage(input):
     return result
 
 
-def mp_count_intersets(inps):
-    # [ com, self.rlen[ty][r.name], self.mode_count, threshold ]
-    random_r, random_q = inps[0].random_split(size=inps[1])
-    d = random_r.intersect_count(random_q, mode_count=inps[2], threshold=inps[3])
-    return d
-
-
 def mp_count_intersect(inputs):
     # q, nalist, mode_count, qlen_dict, threshold, counts, frequency, self_frequency, ty, r
     q = inputs[0]
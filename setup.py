@@ -2,7 +2,8 @@ import os
 import sys
 import io
 import re
-from shutil import copy
+import tempfile
+from shutil import copy, rmtree
 from pwd import getpwnam
 from sys import platform, exit
 from distutils import dir_util
@@ -383,6 +384,31 @@ for copy_folder in copy_files_dictionary.keys():
         #         copy(copy_source_file, copy_dest_file)
         #     else:
         #         raise
+
+###################################################################################################
+# Building librgt
+###################################################################################################
+
+"""
+The C library librgt is compiled from c/librgt.c over the copied prebuilt binary, so that the installed
+library provides all functions used by rgt.LibRGT. Without a working C compiler, the prebuilt binary is kept.
+"""
+def build_librgt(source_file, target_file):
+    from distutils.ccompiler import new_compiler
+    from distutils.sysconfig import customize_compiler
+    from distutils.errors import DistutilsError, CCompilerError
+    compiler = new_compiler()
+    customize_compiler(compiler)
+    build_dir = tempfile.mkdtemp()
+    try:
+        objects = compiler.compile([source_file], output_dir=build_dir, extra_preargs=["-fPIC", "-O2"])
+        compiler.link_shared_object(objects, target_file)
+    except (DistutilsError, CCompilerError) as e:
+        print("WARNING: librgt could not be compiled (" + str(e) + "), using the prebuilt " + path.basename(target_file))
+    finally:
+        rmtree(build_dir)
+
+build_librgt(path.join(script_dir, "c", "librgt.c"), path.join(options.param_rgt_data_location, "lib", libRGT))
     
 ###################################################################################################
 # Setup Function
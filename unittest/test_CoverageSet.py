@@ -1,6 +1,13 @@
+import os
+import shutil
+import tempfile
+import time
 import unittest
+import numpy as np
+import pysam
 from rgt.GenomicRegionSet import *
 from rgt.CoverageSet import CoverageSet
+from rgt import CoverageCache
 
 regions = GenomicRegionSet("test")
 regions.add(GenomicRegion("chr1", 10000, 11000, "+"))
@@ -11,8 +18,353 @@ cov = CoverageSet("coverage", regions)
 bamfile = "/projects/lncRNA/local/cardio/total_rna/bam/d4_1.bam"
 bedfile = "~/rgtdata/hg38/genes_hg38.bed"
 
+
+def write_bam(filename, chrom_sizes, reads):
+    """Write and index a BAM file of the given reads, tuples (chrom, start, cigar, flag, length); reads with the
+    unmapped flag are placed at start without an alignment."""
+    header = {"HD": {"VN": "1.0", "SO": "coordinate"}, "SQ": [{"SN": c, "LN": l} for c, l in chrom_sizes]}
+    tids = dict((c, i) for i, (c, l) in enumerate(chrom_sizes))
+    bam = pysam.AlignmentFile(filename, "wb", header=header)
+    for i, (chrom, start, cigar, flag, length) in enumerate(sorted(reads, key=lambda x: (tids[x[0]], x[1]))):
+        read = pysam.AlignedSegment()
+        read.query_name = "read%d" % i
+        read.query_sequence = "A" * length
+        read.flag = flag
+        read.reference_id = tids[chrom]
+        read.reference_start = start
+        read.mapping_quality = 0 if flag & 4 else 30
+        if not flag & 4:
+            read.cigarstring = cigar
+        read.query_qualities = pysam.qualitystring_to_array("I" * length)
+        bam.write(read)
+    bam.close()
+    pysam.index(filename)
+
+
+def random_reads(random, chrom_sizes, n):
+    """Return n random reads (see write_bam) with duplicates, reverse, paired, soft-clipped, spliced and unmapped
+    reads of two read lengths."""
+    reads = []
+    for i in range(n):
+        chrom, size = chrom_sizes[random.randint(len(chrom_sizes))]
+        start = random.randint(0, size - 300)
+        length = random.choice([36, 50])
+        kind = random.randint(10)
+        if kind == 0:
+            cigar = "20M150N%dM" % (length - 20)
+        elif kind == 1:
+            cigar = "5S%dM" % (length - 5)
+        else:
+            cigar = "%dM" % length
+        flag = random.choice([0, 16]) | random.choice([0, 65, 129]) | (4 if kind == 2 else 0)
+        reads.append((chrom, start, cigar, flag, length))
+    # Duplicates on the same and on the other strand
+    reads += reads[:n // 10] + [(c, s, cigar, f ^ 16, l) for c, s, cigar, f, l in reads[n // 10:n // 5]]
+    return reads
+
+
+def old_coverage(bam_file, regions, extension_size, binsize, stepsize, rmdup, paired_reads, no_gaps):
+    """Return the tuples (coverage, strand information, sense information) of the regions computed by the
+    sliding-window loop which coverage_from_bam replaced (without mask file)."""
+    bam = pysam.Samfile(bam_file, "rb")
+    for read in bam.fetch():
+        fragment_size = read.rlen + extension_size
+        break
+    result = []
+    for region in regions:
+        cov = [0] * (len(region) // stepsize)
+        cov_strand = [[0, 0]] * (len(region) // stepsize)
+        cov_sense = [[0, 0]] * (len(region) // stepsize)
+        strand_info = {}
+        sense_info = {}
+        positions = []
+        read_length = -1
+        for read in bam.fetch(region.chrom, max(0, region.initial-fragment_size), region.final+fragment_size):
+            if len(read.get_blocks()) > 1 and no_gaps: continue
+            read_length = read.rlen
+            if not read.is_unmapped:
+                pos = read.pos - extension_size if read.is_reverse else read.pos
+                positions.append(pos)
+                if pos not in strand_info:
+                    strand_info[pos] = (1, 0) if not read.is_reverse else (0, 1)
+                if pos not in sense_info:
+                    if paired_reads and not read.is_read1:
+                        continue
+                    if region.orientation == "+":
+                        sense_info[pos] = (1, 0) if read.is_reverse else (0, 1)
+                    elif region.orientation == "-":
+                        sense_info[pos] = (1, 0) if not read.is_reverse else (0, 1)
+        if rmdup:
+            positions = list(set(positions))
+        positions.sort()
+        positions.reverse()
+        i = 0
+        while positions:
+            win_s = max(0, i * stepsize - binsize*0.5) + region.initial
+            win_e = i * stepsize + binsize*0.5 + region.initial
+            c = 0
+            sum_strand_info = [0, 0]
+            sum_sense_info = [0, 0]
+            taken = []
+            while True:
+                s = positions.pop()
+                taken.append(s)
+                if s < win_e:
+                    c += 1
+                    sum_strand_info[0] += strand_info[s][0]
+                    sum_strand_info[1] += strand_info[s][1]
+                    if s in sense_info:
+                        sum_sense_info[0] += sense_info[s][0]
+                        sum_sense_info[1] += sense_info[s][1]
+                if s >= win_e or not positions:
+                    taken.reverse()
+                    for s in taken:
+                        if s + extension_size + read_length >= win_s:
+                            positions.append(s)
+                        else:
+                            break
+                    break
+            if i < len(cov):
+                cov[i] = c
+                cov_strand[i] = sum_strand_info
+                cov_sense[i] = sum_sense_info
+            i += 1
+        result.append((cov, cov_strand, cov_sense))
+    return result
+
+
 class CoverageSet_Test(unittest.TestCase):
+
     def coverage_from_genomicset(self):
         cov.coverage_from_genomicset(bamfile)
         print(cov.coverage)
-        self.assertEqual(cov.coverage, 4)
\ No newline at end of file
+        self.assertEqual(cov.coverage, 4)
+
+    def test_index2coordinates(self):
+        c = CoverageSet("offsets", regions)
+        c.stepsize = 50
+        c.coverage = [np.zeros(20), np.zeros(20)]
+        self.assertEqual(c.index2coordinates(0, regions), ("chr1", 10000, 10050))
+        self.assertEqual(c.index2coordinates(19, regions), ("chr1", 10950, 11000))
+        self.assertEqual(c.index2coordinates(20, regions), ("chr1", 20000, 20050))
+        self.assertEqual(list(c.get_offsets()), [0, 20, 40])
+
+    def test_index2coordinates_unaligned(self):
+        # Region starts and lengths which are no multiples of the step size, a region without bins
+        unaligned = GenomicRegionSet("unaligned")
+        unaligned.add(GenomicRegion("chr1", 137, 1612))
+        unaligned.add(GenomicRegion("chr1", 4000, 4010))
+        unaligned.add(GenomicRegion("chr2", 333, 478))
+        c = CoverageSet("offsets", unaligned)
+        c.stepsize = 50
+        c.coverage = [np.zeros(len(r) // 50) for r in unaligned]
+        self.assertEqual(list(c.get_offsets()), [0, 29, 29, 31])
+        self.assertEqual(c.index2coordinates(0, unaligned), ("chr1", 137, 187))
+        self.assertEqual(c.index2coordinates(28, unaligned), ("chr1", 1537, 1587))
+        self.assertEqual(c.index2coordinates(29, unaligned), ("chr2", 333, 383))
+        self.assertEqual(c.index2coordinates(30, unaligned), ("chr2", 383, 433))
+
+    def test_count_overlaps(self):
+        c = CoverageSet("counts", regions)
+        starts, ends = np.array([0, 5, 10, 30]), np.array([8, 40, 12, 31])
+        lo, hi = np.array([0, 8, 12, 20, 50]), np.array([5, 10, 30, 20, 60])
+        self.assertEqual(list(c._count_overlaps(starts, ends, lo, hi)), [1, 1, 1, 0, 0])
+        self.assertEqual(list(c._merge_windows(np.array([0, 3, 8, 20, 50]), np.array([5, 10, 30, 20, 60]))),
+                         [(0, 4, 0, 30), (4, 5, 50, 60)])
+
+
+class TestCoverageFromBam(unittest.TestCase):
+
+    def setUp(self):
+        # Do not use the coverage cache of the user
+        self.addCleanup(setattr, CoverageCache, "_cache", CoverageCache._cache)
+        CoverageCache.set_coverage_cache(None)
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.chrom_sizes = [("chr1", 6000), ("chr2", 4000), ("chr3", 3000)]
+        self.bam_file = os.path.join(self.directory, "reads.bam")
+        write_bam(self.bam_file, self.chrom_sizes, random_reads(np.random.RandomState(5), self.chrom_sizes, 600))
+        # Region lengths which are no multiples of the step size, overlapping regions, regions without bins
+        self.regions = GenomicRegionSet("regions")
+        for chrom, initial, final, orientation in [("chr1", 137, 1612, "+"), ("chr1", 1500, 3333, "-"),
+                                                   ("chr1", 4000, 4010, "+"), ("chr2", 0, 3999, None),
+                                                   ("chr3", 250, 1890, "-"), ("chr3", 1890, 2977, "+")]:
+            self.regions.add(GenomicRegion(chrom, initial, final, orientation=orientation))
+
+    def coverage(self, **options):
+        cs = CoverageSet("coverage", self.regions)
+        cs.coverage_from_bam(self.bam_file, get_strand_info=True, get_sense_info=True, **options)
+        return cs
+
+    def test_sliding_window(self):
+        for extension_size, binsize, stepsize in [(0, 100, 50), (200, 100, 50), (75, 60, 25), (30, 25, 40)]:
+            for rmdup in [False, True]:
+                for paired_reads in [False, True]:
+                    for no_gaps in [False, True]:
+                        options = dict(extension_size=extension_size, binsize=binsize, stepsize=stepsize,
+                                       rmdup=rmdup, paired_reads=paired_reads, no_gaps=no_gaps)
+                        cs = self.coverage(single_pass=False, **options)
+                        expected = old_coverage(self.bam_file, self.regions, **options)
+                        self.assertEqual([c.tolist() for c in cs.coverage], [e[0] for e in expected])
+                        self.assertEqual([c.tolist() for c in cs.cov_strand_all], [e[1] for e in expected])
+                        self.assertEqual([c.tolist() for c in cs.cov_sense_all], [e[2] for e in expected])
+                        self.assertEqual(cs.overall_cov.tolist(), sum([e[0] for e in expected], []))
+        self.assertTrue(cs.overall_cov.sum() > 0)
+
+    def test_single_pass(self):
+        mask_file = os.path.join(self.directory, "mask.bed")
+        with open(mask_file, "w") as f:
+            f.write("chr1\t500\t900\nchr1\t850\t1200\nchr3\t2000\t2600\n")
+        for options in [dict(), dict(extension_size=75, binsize=60, stepsize=25, rmdup=True),
+                        dict(paired_reads=True, no_gaps=True), dict(mask_file=mask_file)]:
+            per_region = self.coverage(single_pass=False, **options)
+            single_pass = self.coverage(single_pass=True, **options)
+            self.assertEqual(single_pass.overall_cov.tolist(), per_region.overall_cov.tolist())
+            self.assertEqual(single_pass.overall_cov_strand.tolist(), per_region.overall_cov_strand.tolist())
+            self.assertEqual(single_pass.overall_cov_sense.tolist(), per_region.overall_cov_sense.tolist())
+        masked = self.coverage(mask_file=mask_file)
+        self.assertTrue(masked.overall_cov.sum() < self.coverage().overall_cov.sum())
+
+    def test_mask(self):
+        # A reverse read is masked by its start shifted by its aligned length
+        bam_file = os.path.join(self.directory, "masked.bam")
+        write_bam(bam_file, self.chrom_sizes, [("chr1", 99, "50M", 0, 50), ("chr1", 150, "50M", 0, 50),
+                                               ("chr1", 200, "50M", 0, 50), ("chr1", 230, "5S45M", 16, 50),
+                                               ("chr2", 120, "50M", 16, 50), ("chr2", 150, "50M", 0, 50)])
+        mask_file = os.path.join(self.directory, "mask.bed")
+        with open(mask_file, "w") as f:
+            f.write("chr1\t100\t150\nchr1\t140\t200\nchr2\t100\t160\n")
+        regions = GenomicRegionSet("regions")
+        regions.add(GenomicRegion("chr1", 0, 1000))
+        regions.add(GenomicRegion("chr2", 0, 1000))
+        for single_pass in [False, True]:
+            cs = CoverageSet("masked", regions)
+            cs.coverage_from_bam(bam_file, extension_size=0, binsize=2000, stepsize=1000, mask_file=mask_file,
+                                 single_pass=single_pass)
+            # chr1 keeps 99 and 200, the reverse read at 230 is shifted to 185 and masked; on chr2, the reverse
+            # read at 120 is shifted to 70 and kept
+            self.assertEqual(cs.overall_cov.tolist(), [2, 1])
+
+    def test_cores(self):
+        for options in [dict(), dict(single_pass=True, rmdup=True, stepsize=25)]:
+            serial = self.coverage(cores=1, **options)
+            parallel = self.coverage(cores=2, **options)
+            self.assertEqual([c.tolist() for c in parallel.coverage], [c.tolist() for c in serial.coverage])
+            self.assertEqual(parallel.overall_cov_strand.tolist(), serial.overall_cov_strand.tolist())
+            self.assertEqual(parallel.overall_cov_sense.tolist(), serial.overall_cov_sense.tolist())
+            self.assertEqual(parallel.get_offsets().tolist(), serial.get_offsets().tolist())
+        self.assertTrue(parallel.overall_cov.sum() > 0)
+
+    def test_read_counts(self):
+        regions = GenomicRegionSet("unsorted")
+        for chrom, initial, final, orientation in [("chr2", 2500, 2600, "-"), ("chr1", 1500, 3333, "-"),
+                                                   ("chr1", 137, 1612, "+"), ("chr1", 5000, 5001, "+"),
+                                                   ("chr4", 0, 100, "+"), ("chr3", 250, 1890, None)]:
+            regions.add(GenomicRegion(chrom, initial, final, orientation=orientation))
+        bam = pysam.Samfile(self.bam_file, "rb")
+        for strand_specific in [False, True]:
+            cs = CoverageSet("counts", regions)
+            cs.coverage_from_genomicset(self.bam_file, readSize=100, strand_specific=strand_specific)
+            expected = []
+            for r in regions:
+                if r.chrom not in bam.references:
+                    expected.append(0)
+                    continue
+                reads = list(bam.fetch(r.chrom, max(0, r.initial - 100), r.final + 100))
+                if strand_specific:
+                    reads = [read for read in reads if (r.orientation == "+" and not read.is_reverse) or
+                             (r.orientation == "-" and read.is_reverse)]
+                expected.append(len(reads))
+            self.assertEqual(cs.coverage, expected)
+        names = set(read.qname for r in regions if r.chrom in bam.references
+                    for read in bam.fetch(r.chrom, r.initial, r.final))
+        self.assertEqual(CoverageSet("unique", regions).count_unique_reads(self.bam_file), len(names))
+        self.assertTrue(len(names) > 0)
+
+
+class TestCoverageCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.cache_dir = os.path.join(self.directory, "cache")
+        self.addCleanup(setattr, CoverageCache, "_cache", CoverageCache._cache)
+        CoverageCache.set_coverage_cache(self.cache_dir)
+        self.chrom_sizes = [("chr1", 6000), ("chr2", 4000)]
+        self.reads = random_reads(np.random.RandomState(9), self.chrom_sizes, 300)
+        self.bam_file = os.path.join(self.directory, "reads.bam")
+        write_bam(self.bam_file, self.chrom_sizes, self.reads)
+        self.regions = GenomicRegionSet("regions")
+        self.regions.add(GenomicRegion("chr1", 137, 5612, orientation="+"))
+        self.regions.add(GenomicRegion("chr2", 0, 3999, orientation="-"))
+        # Count the computations which are not answered from the cache
+        self.computed = 0
+        finish = CoverageSet._finish_bam
+        def counting(cs):
+            self.computed += 1
+            finish(cs)
+        self.addCleanup(setattr, CoverageSet, "_finish_bam", finish)
+        CoverageSet._finish_bam = counting
+
+    def coverage(self, **options):
+        cs = CoverageSet("coverage", self.regions)
+        cs.coverage_from_bam(self.bam_file, get_strand_info=True, **options)
+        return cs
+
+    def manifest(self):
+        return CoverageCache.get_coverage_cache()._read_manifest()
+
+    def test_hit(self):
+        computed = self.coverage()
+        cached = self.coverage()
+        self.assertEqual(self.computed, 1)
+        self.assertEqual(len(self.manifest()), 1)
+        self.assertEqual(cached.overall_cov.dtype, computed.overall_cov.dtype)
+        self.assertEqual(cached.overall_cov.tolist(), computed.overall_cov.tolist())
+        self.assertEqual(cached.overall_cov_strand.tolist(), computed.overall_cov_strand.tolist())
+        self.assertEqual([c.tolist() for c in cached.coverage], [c.tolist() for c in computed.coverage])
+        self.assertEqual(cached.get_offsets().tolist(), computed.get_offsets().tolist())
+        self.assertEqual((cached.reads, cached.mapped_reads, cached.binsize, cached.stepsize),
+                         (computed.reads, computed.mapped_reads, computed.binsize, computed.stepsize))
+        # The loaded coverage may be changed without changing the cache
+        cached.overall_cov[:] = 0
+        self.assertEqual(self.coverage().overall_cov.tolist(), computed.overall_cov.tolist())
+        self.assertEqual(self.computed, 1)
+
+    def test_invalidation(self):
+        self.coverage()
+        self.coverage(binsize=200)
+        self.coverage(rmdup=True)
+        self.assertEqual(self.computed, 3)
+        # Modification time of the BAM file
+        status = os.stat(self.bam_file)
+        os.utime(self.bam_file, (status.st_atime, status.st_mtime - 100))
+        self.coverage()
+        self.assertEqual(self.computed, 4)
+        # Size of the BAM file, with the same modification time
+        write_bam(self.bam_file, self.chrom_sizes, self.reads + [("chr1", 1000, "50M", 0, 50)])
+        os.utime(self.bam_file, (status.st_atime, status.st_mtime - 100))
+        self.assertNotEqual(os.path.getsize(self.bam_file), status.st_size)
+        self.coverage()
+        self.assertEqual(self.computed, 5)
+        self.coverage()
+        self.assertEqual(self.computed, 5)
+        self.assertEqual(len(self.manifest()), 5)
+
+    def test_eviction(self):
+        self.coverage(stepsize=50)
+        size = sum(entry["size"] for entry in self.manifest().values())
+        CoverageCache.set_coverage_cache(self.cache_dir, max_size=int(2.5 * size))
+        self.coverage(stepsize=51)
+        # Use the first entry, so that the second one is the least recently used
+        time.sleep(0.01)
+        self.coverage(stepsize=50)
+        self.assertEqual(self.computed, 2)
+        self.coverage(stepsize=52)
+        self.assertEqual(len(self.manifest()), 2)
+        self.assertEqual(len([f for f in os.listdir(self.cache_dir) if f.endswith(".npy")]), 2 * 3)
+        self.coverage(stepsize=50)
+        self.coverage(stepsize=52)
+        self.assertEqual(self.computed, 3)
+        self.coverage(stepsize=51)
+        self.assertEqual(self.computed, 4)
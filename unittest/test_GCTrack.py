@@ -0,0 +1,135 @@
+from __future__ import print_function
+from __future__ import division
+import os
+import shutil
+import tempfile
+import unittest
+import numpy as np
+import pysam
+from rgt import GCTrack as gc_module
+from rgt.CoverageSet import get_gc_context
+from rgt.GCTrack import GCTrack, gc_percentages
+from rgt.GenomicRegion import GenomicRegion
+from rgt.GenomicRegionSet import GenomicRegionSet
+
+
+def write_fasta(filename, sequences):
+    """Write the (name, sequence) pairs <sequences> into the FASTA file <filename> and index it."""
+    with open(filename, "w") as f:
+        for name, sequence in sequences:
+            f.write(">" + name + "\n")
+            for i in range(0, len(sequence), 60):
+                f.write(sequence[i:i + 60] + "\n")
+    pysam.faidx(filename)
+
+
+def random_sequence(random, size):
+    return "".join(random.choice(list("ACGTacgtN"), size))
+
+
+def old_percentages(sequence, binsize, stepsize, bins):
+    """GC content of <bins> bins of <sequence>, computed as by the former get_gc_context (None behind its end)."""
+    result = []
+    for i in range(bins):
+        seq = sequence[i * stepsize: i * stepsize + binsize + 1].upper()
+        if len(seq) > 0:
+            result.append(int(float(seq.count("C") + seq.count("G")) / len(seq) * 100))
+        else:
+            result.append(None)
+    return result
+
+
+def old_gc_context(stepsize, binsize, sequences, cov_list, places):
+    """The former get_gc_context, with the coverage array i starting at places[i] = (chrom, initial)."""
+    content = [[] for _ in range(101)]
+    gc_content_cov = []
+    for (chrom, initial), cov in zip(places, cov_list):
+        sequence = sequences[chrom][initial - initial % stepsize:]
+        values = old_percentages(sequence, binsize, stepsize, len(cov))
+        for c, value in zip(cov, values):
+            if value is not None:
+                content[value].append(round(float(c), 2))
+        gc_content_cov.append([0 if value is None else value for value in values])
+    g_gc = [sum(l) / float(len(l)) if len(l) > 0 else 0 for l in content]
+    return [[g_gc[x] for x in l] for l in gc_content_cov], sum(g_gc) / float(len(g_gc)), g_gc
+
+
+class TestGCTrack(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.addCleanup(gc_module._gc_tracks.clear)
+        self.random = np.random.RandomState(11)
+        self.sequences = {"chr1": random_sequence(self.random, 1037), "chr2": random_sequence(self.random, 523)}
+        self.genome = os.path.join(self.directory, "genome.fa")
+        write_fasta(self.genome, sorted(self.sequences.items()))
+
+    def test_gc_percentages(self):
+        sequence = self.sequences["chr1"]
+        for binsize, stepsize in [(100, 50), (100, 100), (30, 70), (1, 1), (2000, 500)]:
+            bins = (len(sequence) + stepsize - 1) // stepsize
+            self.assertEqual(gc_percentages(sequence, binsize, stepsize).tolist(),
+                             old_percentages(sequence, binsize, stepsize, bins))
+        self.assertEqual(gc_percentages("", 100, 50).tolist(), [])
+
+    def test_lookup(self):
+        track = GCTrack(self.genome, 100, 50)
+        expected = old_percentages(self.sequences["chr2"], 100, 50, 11)
+        self.assertEqual(track.percentages("chr2").tolist(), expected)
+        # A start which is no multiple of the step size is rounded down, bins behind the end are -1
+        result = track.lookup("chr2", 130, 12)
+        self.assertEqual(result.dtype, np.int8)
+        self.assertEqual(result.tolist(), expected[2:] + [-1] * 3)
+        self.assertEqual(track.lookup("chr2", 600, 2).tolist(), [-1, -1])
+
+    def test_store(self):
+        expected = GCTrack(self.genome, 100, 50).percentages("chr1").tolist()
+        self.assertTrue(os.path.isfile(GCTrack(self.genome, 100, 50).filename("chr1")))
+        self.assertFalse(os.path.exists(GCTrack(self.genome, 100, 40).filename("chr1")))
+
+        # A stored track is loaded instead of being built again
+        track = GCTrack(self.genome, 100, 50)
+        track.build = None
+        self.assertEqual(track.percentages("chr1").tolist(), expected)
+
+        # A changed genome of the same size is built again, also when only the modification time is checked
+        status = os.stat(self.genome)
+        self.sequences["chr1"] = random_sequence(self.random, 1037)
+        write_fasta(self.genome, sorted(self.sequences.items()))
+        os.utime(self.genome, (status.st_atime, status.st_mtime + 10))
+        self.assertEqual(os.path.getsize(self.genome), status.st_size)
+        expected = old_percentages(self.sequences["chr1"], 100, 50, 21)
+        self.assertEqual(GCTrack(self.genome, 100, 50).percentages("chr1").tolist(), expected)
+        track = GCTrack(self.genome, 100, 50)
+        track.build = None
+        self.assertEqual(track.percentages("chr1").tolist(), expected)
+
+        # Without store, nothing is read or written
+        track = GCTrack(self.genome, 100, 40, store=False)
+        self.assertEqual(track.percentages("chr1").tolist(), old_percentages(self.sequences["chr1"], 100, 40, 26))
+        self.assertFalse(os.path.exists(track.filename("chr1")))
+
+    def test_get_gc_context(self):
+        chrom_sizes = dict((chrom, len(sequence)) for chrom, sequence in self.sequences.items())
+        regions = GenomicRegionSet("regions")
+        regions.add(GenomicRegion("chr2", 130, 480))
+        regions.add(GenomicRegion("chr1", 0, 1000))
+        regions.add(GenomicRegion("chr2", 400, 700))
+        cov_list = [self.random.randint(0, 50, size) for size in [8, 20, 7]]
+        cov_list[1] = cov_list[1] / 3.0
+
+        places = [(r.chrom, r.initial) for r in regions]
+        for result, expected in [(get_gc_context(50, 100, self.genome, cov_list, chrom_sizes, regions),
+                                  old_gc_context(50, 100, self.sequences, cov_list, places)),
+                                 (get_gc_context(50, 100, self.genome, cov_list, chrom_sizes),
+                                  old_gc_context(50, 100, self.sequences, cov_list, [("chr1", 0)] * 3))]:
+            self.assertEqual(len(result[0]), len(expected[0]))
+            for values, expected_values in zip(result[0], expected[0]):
+                np.testing.assert_allclose(values, expected_values, rtol=1e-12)
+            self.assertAlmostEqual(result[1], expected[1], places=10)
+            np.testing.assert_allclose(result[2], expected[2], rtol=1e-12)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -5,8 +5,11 @@ import unittest
 from rgt.GenomicRegion import *
 from rgt.GenomicRegionSet import *
 import os
+import shutil
+import tempfile
 from rgt.Util import GenomeData
 from rgt.Util import OverlapType
+from rgt import GeneIndex
 
 
 """Unit Test"""
@@ -17,11 +20,13 @@ class TestGenomicRegionSet(unittest.TestCase):
         """ Setting two GenomicRegionSets as self.setA and self.setB for each case test. """
         self.setA = GenomicRegionSet('for Unit Test')
         for i in range(len(listA)):
-            self.setA.add(GenomicRegion(chrom=listA[i][0], initial=listA[i][1], final=listA[i][2]))
+            self.setA.add(GenomicRegion(chrom=listA[i][0], initial=listA[i][1], final=listA[i][2],
+                                        name=listA[i][3] if len(listA[i]) > 3 else None))
         
         self.setB = GenomicRegionSet('for Unit Test')
         for i in range(len(listB)):
-            self.setB.add(GenomicRegion(chrom=listB[i][0], initial=listB[i][1], final=listB[i][2]))
+            self.setB.add(GenomicRegion(chrom=listB[i][0], initial=listB[i][1], final=listB[i][2],
+                                        name=listB[i][3] if len(listB[i]) > 3 else None))
     
     def test_extend(self):
         """
@@ -456,6 +461,21 @@ class TestGenomicRegionSet(unittest.TestCase):
                          [])
         result = self.setA.closest(self.setB)
         self.assertEqual(len(result), 0)
+        """
+        No overlapping
+        A : ------      ---------               -------
+        B :        ----          ------  ------
+        R :        ----          ------  ------
+        """
+        self.region_sets([['chr1',1,5],['chr1',11,20],['chr1',33,38]],
+                         [['chr1',7,9],['chr1',20,25],['chr1',26,31]])
+        result, distances = self.setA.closest(self.setB, return_list=True)
+        self.assertEqual([r.toString() for r in result], ['chr1:7-9', 'chr1:20-25', 'chr1:26-31'])
+        self.assertEqual(distances, [2, 0, 2])
+        result = self.setA.closest(self.setB, max_dis=2)
+        self.assertEqual([r.toString() for r in result], ['chr1:20-25'])
+        result = self.setA.closest(self.setB, top_N=2, return_list=True)[1]
+        self.assertEqual(list(result.values()), [[2, 15], [0, 2], [2, 8]])
         # """
         # One empty set
         # A :   -----
@@ -1015,6 +1035,17 @@ class TestGenomicRegionSet(unittest.TestCase):
         self.assertEqual(len(result), 1)
         result = self.setA.cluster(26)
         self.assertEqual(len(result), 1)
+        """
+        A :  -----  .  -
+        R :  -----     -
+        An empty region at the end of a cluster does not shorten the gap to the next region.
+        """
+        self.region_sets([['chr10',20,143],['chr10',143,143],['chr10',150,151]],
+                         [])
+        result = self.setA.cluster(7)
+        self.assertEqual([(r.initial, r.final) for r in result], [(20, 143), (150, 151)])
+        result = self.setA.cluster(8)
+        self.assertEqual([(r.initial, r.final) for r in result], [(20, 151)])
         
     def test_flank(self):
         """
@@ -1078,6 +1109,10 @@ class TestGenomicRegionSet(unittest.TestCase):
                                           overlap_result=False, 
                                           overlap_input=False)
         result.sort()
+        self.assertEqual(len(result), 100)
+        self.assertEqual(sorted(set(len(r) for r in result)), [10000, 20000, 30000])
+        self.assertFalse(result.within_overlap())
+        self.assertEqual(len(result.intersect(self.setA)), 0)
         #print("-"*80)
         #print("The result random regions are: ")
         #for s in result.sequences:
@@ -1145,12 +1180,180 @@ class TestGenomicRegionSet(unittest.TestCase):
                                           overlap_input=False,
                                           chrom_M=True)
         result.sort()
+        self.assertEqual(len(result), 300)
+        self.assertFalse(result.within_overlap())
+        """Seeded"""
+        result = self.setA.random_regions(organism="mm9", multiply_factor=10, seed=3)
+        self.assertEqual([r.toString() for r in result],
+                         [r.toString() for r in self.setA.random_regions(organism="mm9", multiply_factor=10, seed=3)])
         #print("-"*80)
         #print("The result random regions are: ")
         #for s in result.sequences:
         #    print("\t%s\t%10d\t%10d%10d" % (s.chrom,s.initial,s.final,s.__len__()))
         #print("Overlaps within result: ",result.within_overlap())
 
+    def test_read_bed(self):
+        bed = tempfile.NamedTemporaryFile(suffix=".bed", delete=False)
+        bed.write("track name=test\n"
+                  "chr2\t50\t30\tr1\t0\t+\tx\ty\n"
+                  "chr1\t10\t20\n"
+                  "chr1 30 40 r3 7\n"
+                  "chr1\t5\t5\tempty\n"
+                  "chr1\t7\t9\tr5\t2\t-")
+        bed.close()
+        regions = GenomicRegionSet("bed")
+        regions.read_bed(bed.name)
+        self.assertEqual([(r.toString(), r.name, r.orientation, r.data) for r in regions],
+                         [('chr1:7-9', 'r5', '-', '2'), ('chr1:10-20', None, None, None),
+                          ('chr1:30-40', 'r3', None, '7'), ('chr2:30-50', 'r1', '+', '0\tx\ty')])
+        chunks = [[r.toString() for r in chunk] for chunk in GenomicRegionSet.iter_bed(bed.name, chunk_size=3)]
+        self.assertEqual(chunks, [['chr2:30-50', 'chr1:10-20', 'chr1:30-40'], ['chr1:7-9']])
+        os.remove(bed.name)
+
+    def test_read_bed_long_field(self):
+        # One long name must not be padded to the other lines
+        bed = tempfile.NamedTemporaryFile(suffix=".bed", delete=False)
+        long_name = "n" * 100000
+        for i in range(20000):
+            bed.write("chr1\t%d\t%d\t%s\t0\t+\n" % (i, i + 10, long_name if i == 500 else "r%d" % i))
+        bed.write("%s\t0\t10\n" % ("chr" * 200))
+        bed.close()
+        regions = GenomicRegionSet("bed")
+        regions.read_bed(bed.name)
+        self.assertEqual(len(regions), 20001)
+        names = dict((r.name, r) for r in regions)
+        self.assertEqual(names[long_name].toString(), 'chr1:500-510')
+        self.assertEqual(names['r501'].toString(), 'chr1:501-511')
+        self.assertEqual(names[None].chrom, "chr" * 200)
+        os.remove(bed.name)
+
+    def test_get_distance(self):
+        """
+        A :        ------               -----
+        B : ---       -----    ----           ---
+        """
+        self.region_sets([['chr1',10,20,'a1'],['chr1',40,50,'a2']],
+                         [['chr1',0,5,'b1'],['chr1',15,30,'b2'],['chr1',34,38,'b3'],['chr1',55,60,'b4']])
+        self.assertEqual(self.setA.get_distance(self.setB),
+                         [['a1', '0', 'b2'], ['a2', '-2', 'b3'], ['a2', '+5', 'b4']])
+        self.assertEqual(self.setA.get_distance(self.setB, ignore_overlap=True, threshDist=6),
+                         [['a1', '-5', 'b1'], ['a2', '-2', 'b3'], ['a2', '+5', 'b4']])
+
+    def test_covered_by_aregion(self):
+        """
+        A : ---   ------   --  -----
+        Q :     --------
+        R :       ------
+        """
+        self.region_sets([['chr1',0,3],['chr1',6,12],['chr1',15,17],['chr1',19,24],['chr2',6,12]],
+                         [])
+        result = self.setA.covered_by_aregion(GenomicRegion('chr1', 4, 12))
+        self.assertEqual([r.toString() for r in result], ['chr1:6-12'])
+        self.assertTrue(self.setA.include(GenomicRegion('chr1', 16, 30)))
+        self.assertFalse(self.setA.include(GenomicRegion('chr1', 12, 15)))
+        self.assertFalse(self.setA.include(GenomicRegion('chr3', 0, 30)))
+
+    def test_index(self):
+        self.region_sets([['chr1',0,10],['chr1',20,30]],
+                         [['chr1',5,25]])
+        index = self.setA.get_index()
+        self.assertIs(self.setA.get_index(), index)
+        self.assertEqual(self.setB.counts_per_region(self.setA), [2])
+        # Changing the set drops the index
+        self.setA.add(GenomicRegion('chr1', 12, 14))
+        self.assertEqual(self.setB.counts_per_region(self.setA), [3])
+        self.setA.extend(0, -6)
+        self.assertEqual(self.setB.counts_per_region(self.setA), [2])
+
+    def test_index_modified_regions(self):
+        self.region_sets([['chr1',0,10],['chr1',20,30]],
+                         [['chr1',5,25]])
+        self.assertEqual([r.toString() for r in self.setA.intersect(self.setB)], ['chr1:5-10', 'chr1:20-25'])
+        self.assertEqual([r.toString() for r in self.setB.intersect(self.setA)], ['chr1:5-10', 'chr1:20-25'])
+        # Regions and list items changed directly are noticed as well
+        self.setA.sequences[0].initial = 1000
+        self.setA.sequences[0].final = 1010
+        self.assertEqual([r.toString() for r in self.setA.intersect(self.setB)], ['chr1:20-25'])
+        self.assertEqual([r.toString() for r in self.setB.intersect(self.setA)], ['chr1:20-25'])
+        self.setA.sequences[1] = GenomicRegion('chr1', 22, 24)
+        self.assertEqual([r.toString() for r in self.setA.intersect(self.setB)], ['chr1:22-24'])
+        self.assertEqual([r.toString() for r in self.setB.intersect(self.setA)], ['chr1:22-24'])
+        self.setA.sequences[1].name = "a"
+        self.assertEqual([r.name for r in self.setA.intersect(self.setB, mode=OverlapType.ORIGINAL)], ["a"])
+        self.setA.sequences.sort()
+        self.assertEqual(self.setB.counts_per_region(self.setA), [1])
+
+    def test_coverage_per_region(self):
+        """
+        A : ----------      ----
+        B :   --- --          ------
+                --------
+        R :     1.3          1.5
+        """
+        self.region_sets([['chr1',0,10],['chr1',16,20]],
+                         [['chr1',2,5],['chr1',4,12],['chr1',6,8],['chr1',18,24]])
+        self.assertEqual(self.setA.coverage_per_region(self.setB), [1.3, 1.5])
+        self.assertEqual(self.setA.counts_per_region(self.setB), [3, 1])
+
+    def test_within_overlap(self):
+        self.region_sets([['chr1',0,10],['chr1',10,20],['chr2',5,8]],
+                         [['chr1',0,10],['chr1',30,40],['chr1',9,12]])
+        self.assertFalse(self.setA.within_overlap())
+        self.assertTrue(self.setB.within_overlap())
+
+    def test_read_sequence(self):
+        self.region_sets([['chr2',2,6],['chr1',0,4],['chr3',0,2]],
+                         [])
+        directory = tempfile.mkdtemp()
+        with open(os.path.join(directory, "chr1.fa"), "w") as f:
+            f.write(">chr1\nACGTAC\nGTAC\n")
+        with open(os.path.join(directory, "chr2.fa"), "w") as f:
+            f.write(">chr2\nTTGGCCAA\n")
+        self.setA.read_sequence(directory)
+        self.assertEqual([getattr(r, 'sequence', None) and r.sequence.seq for r in self.setA], ['GGCC', 'ACGT', None])
+        out_file = os.path.join(directory, "out.fa")
+        self.setA.write_sequence(out_file)
+        with open(out_file) as f:
+            self.assertEqual(f.read(), ">chr2:2-6-None\nGGCC\n>chr1:0-4-None\nACGT\n")
+        shutil.rmtree(directory)
+
+    def test_merge_by_name(self):
+        """
+        A : -a---  -b---
+               -a---  -a--
+        R : -a-----------
+                   -b---
+        """
+        self.region_sets([['chr1',0,5,'a'],['chr1',3,8,'a'],['chr1',7,12,'b'],['chr1',10,14,'a']],
+                         [])
+        result = self.setA.merge(w_return=True, namedistinct=True)
+        self.assertEqual([(r.toString(), r.name) for r in result],
+                         [('chr1:0-8', 'a'), ('chr1:7-12', 'b'), ('chr1:10-14', 'a')])
+        # The merged set is a new one
+        self.assertEqual(len(self.setA), 4)
+        self.assertEqual(self.setA[0].final, 5)
+
+    def test_complement(self):
+        self.region_sets([['chr1',0,10],['chr1',20,30],['chr2',100,200]],
+                         [])
+        result = self.setA.complement(organism="hg19")
+        self.assertEqual(len(result), 23 + 2)
+        self.assertEqual([r.toString() for r in result][:3], ['chr1:10-20', 'chr1:30-249250621', 'chr10:0-135534747'])
+
+    def test_gene_association(self):
+        self.region_sets([['chr1',12000,12100],['chr2',1000,1100]],
+                         [])
+        # Use an index which is not written into the data directory
+        key = ("hg19", 1000)
+        self.addCleanup(GeneIndex._gene_indexes.pop, key, None)
+        GeneIndex._gene_indexes[key] = GeneIndex.GeneIndex("hg19", 1000, store=False)
+        result = self.setA.gene_association(organism="hg19")
+        self.assertEqual([r.name for r in result], ['DDX11L1', 'FAM110C(+)'])
+        gene_set = GeneSet("genes")
+        gene_set.genes = ["wash7p"]
+        result = self.setA.gene_association(gene_set=gene_set, organism="hg19", show_dis=True)
+        self.assertEqual([r.name for r in result], ['WASH7P(+2263)', '.'])
+
 """
     
     def test_projection_test(self):
@@ -1162,6 +1365,43 @@ class TestGenomicRegionSet(unittest.TestCase):
         #self.assertEqual(result, 11/31)
 """     
         
+class TestGenomicRegionSetColumnar(TestGenomicRegionSet):
+    """Run the same cases on sets in the columnar storage."""
+
+    def region_sets(self, listA, listB):
+        TestGenomicRegionSet.region_sets(self, listA, listB)
+        self.setA.to_columnar()
+        self.setB.to_columnar()
+
+    def test_storage(self):
+        self.region_sets([['chr2',15,20],['chr1',40,50],['chr1',5,10]],
+                         [])
+        self.assertTrue(self.setA.is_columnar())
+        self.assertEqual(self.setA.get_chrom(), ['chr2', 'chr1', 'chr1'])
+        self.setA.sort()
+        self.assertEqual([r.toString() for r in self.setA], ['chr1:5-10', 'chr1:40-50', 'chr2:15-20'])
+        self.assertEqual(self.setA[-1].chrom, 'chr2')
+        self.assertEqual(self.setA.total_coverage(), 20)
+        self.assertEqual(len(self.setA.any_chrom('chr1')), 2)
+        # Accessing the list switches back to the list storage
+        self.setA.sequences.append(GenomicRegion('chr3', 1, 2))
+        self.assertFalse(self.setA.is_columnar())
+        self.assertEqual(len(self.setA), 4)
+
+    def test_counts_per_region(self):
+        """
+        A :    ------     ------    .
+        B : -----  ---  --     ---- --
+        R :      2          1       0
+        """
+        self.region_sets([['chr1',3,9],['chr1',14,20],['chr1',24,24]],
+                         [['chr1',0,5],['chr1',7,10],['chr1',12,14],['chr1',19,23],['chr1',24,26]])
+        self.assertEqual(self.setA.counts_per_region(self.setB), [2, 1, 0])
+        TestGenomicRegionSet.region_sets(self, [['chr1',3,9],['chr1',14,20],['chr1',24,24]],
+                                         [['chr1',0,5],['chr1',7,10],['chr1',12,14],['chr1',19,23],['chr1',24,26]])
+        self.assertEqual(self.setA.counts_per_region(self.setB), [2, 1, 0])
+
+        
 if __name__ == "__main__":
 
     suite = unittest.TestLoader().loadTestsFromTestCase(TestGenomicRegionSet)
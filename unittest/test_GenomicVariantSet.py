@@ -0,0 +1,47 @@
+from __future__ import print_function
+import unittest
+from rgt.GenomicVariant import GenomicVariant
+from rgt.GenomicVariantSet import GenomicVariantSet
+
+
+class TestGenomicVariantSet(unittest.TestCase):
+    def variant_sets(self):
+        """Set self.setA and self.setB; A holds two variants at chr1:10 and B two at chr1:30."""
+        self.variants = [GenomicVariant('chr1', 30, 'G', 'T', 60, id='c'),
+                         GenomicVariant('chr1', 10, 'A', 'C', 50, id='a1'),
+                         GenomicVariant('chr2', 5, 'T', 'A', 10, id='d'),
+                         GenomicVariant('chr1', 20, 'C', 'G', 40, id='b'),
+                         GenomicVariant('chr1', 10, 'A', 'G', 30, id='a2')]
+        self.setA = GenomicVariantSet(name='A')
+        for v in self.variants:
+            self.setA.add(v)
+        self.setB = GenomicVariantSet(name='B')
+        for pos, id in [(10, 'x'), (30, 'y1'), (30, 'y2'), (40, 'z')]:
+            self.setB.add(GenomicVariant('chr1', pos, 'A', 'T', 1, id=id))
+
+    def test_subtract(self):
+        self.variant_sets()
+        self.setA.subtract(self.setB)
+        self.assertEqual([v.id for v in self.setA], ['b', 'd'])
+        self.assertIs(self.setA[0], self.variants[3])
+        self.assertIs(self.setA[1], self.variants[2])
+        self.assertEqual((self.setA[0].ref, self.setA[0].alt, self.setA[0].qual), ('C', 'G', 40))
+
+    def test_intersect(self):
+        self.variant_sets()
+        self.setA.intersect(self.setB)
+        self.assertEqual(sorted(v.id for v in self.setA), ['a1', 'a2', 'c'])
+        for v in self.setA:
+            self.assertTrue(any(v is w for w in self.variants))
+        self.assertEqual(sorted((v.pos, v.alt) for v in self.setA), [(10, 'C'), (10, 'G'), (30, 'T')])
+
+    def test_empty(self):
+        self.variant_sets()
+        self.setA.subtract(GenomicVariantSet(name='empty'))
+        self.assertEqual(len(self.setA), 5)
+        self.setA.intersect(GenomicVariantSet(name='empty'))
+        self.assertEqual(len(self.setA), 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,99 @@
+from __future__ import print_function
+from __future__ import division
+import os
+import sys
+import unittest
+import numpy as np
+from rgt.GenomicRegion import GenomicRegion
+from rgt.GenomicRegionColumns import GenomicRegionColumns
+from rgt.IntervalIndex import IntervalIndex
+from rgt.LibRGT import LibRGT
+from rgt.Util import Library_path, OverlapType
+
+
+def librgt_path():
+    """Return the path of the installed librgt, or of the prebuilt one of the package, or None if there is none."""
+    try:
+        path = Library_path().get_c_rgt()
+    except Exception:
+        name = "librgt_mac.so" if sys.platform.startswith("darwin") else "librgt_linux.so"
+        path = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "lib", name)
+    return path if os.path.isfile(path) else None
+
+
+def random_regions(random, size, chroms=("chr1", "chr2", "chr3")):
+    """Return GenomicRegionColumns of random, possibly empty, overlapping and duplicated regions."""
+    regions = []
+    for i in range(size):
+        initial = random.randint(0, 2000)
+        regions.append(GenomicRegion(chroms[random.randint(0, len(chroms))], initial,
+                                     initial + random.choice([0, 1, 5, 20, 100, 400]),
+                                     name=random.choice(["a", "b"]), orientation=random.choice(["+", "-"])))
+    regions += regions[:size // 10]
+    columns = GenomicRegionColumns.from_regions(regions)
+    return columns.take(columns.sort_index())
+
+
+def assert_arrays_equal(first, second):
+    for x, y in zip(first, second):
+        np.testing.assert_array_equal(x, y)
+
+
+@unittest.skipIf(librgt_path() is None, "librgt is not available")
+class TestLibRGT(unittest.TestCase):
+    """Compare the librgt kernels with the NumPy implementations of IntervalIndex and GenomicRegionColumns."""
+
+    def setUp(self):
+        # The library has to provide the coded interface: an older build fails here
+        self.librgt = LibRGT(librgt_path())
+        random = np.random.RandomState(3)
+        self.a = random_regions(random, 300, ("chr1", "chr2", "chr3", "chrX"))
+        self.index = IntervalIndex(random_regions(random, 200))
+
+    def test_intersect(self):
+        for mode in [OverlapType.OVERLAP, OverlapType.ORIGINAL, OverlapType.COMP_INCL]:
+            merged = mode == OverlapType.OVERLAP
+            a = self.a.merge() if merged else self.a
+            result = self.librgt.intersect(mode, self.index.coded_query(a), self.index.coded(merged))
+            assert_arrays_equal(result, self.index.intersect_rows(a, mode))
+            self.assertTrue(len(result[0]) > 0)
+
+    def test_jaccard(self):
+        a = self.a.merge()
+        rows, initials, finals = self.index.intersect_rows(a, OverlapType.OVERLAP)
+        inter = (finals - initials).sum()
+        expected = inter / (a.lengths().sum() + self.index.merged().lengths().sum() - inter)
+        self.assertAlmostEqual(self.librgt.jaccard(self.index.coded_query(a), self.index.coded(merged=True)),
+                               expected, places=12)
+
+    def test_subtract(self):
+        for whole_region in [False, True]:
+            result = self.librgt.subtract(self.index.coded_query(self.a), self.index.coded(merged=True), whole_region)
+            assert_arrays_equal(result, self.index.subtract_rows(self.a, whole_region))
+
+    def test_cluster(self):
+        regions = self.index.regions
+        for namedistinct, strand_specific, distance in [(False, False, 0), (True, False, 0), (False, True, 0),
+                                                        (False, False, 50)]:
+            result = self.librgt.cluster(self.index.coded(), regions.segments(namedistinct, strand_specific),
+                                         distance)
+            assert_arrays_equal(result, regions.cluster_rows(namedistinct, strand_specific, distance))
+
+    def test_sum_overlaps(self):
+        counts, lengths = self.librgt.sum_overlaps(self.index.coded_query(self.a), self.index.coded())
+        np.testing.assert_array_equal(counts, self.index.count_overlaps(self.a))
+        np.testing.assert_array_equal(lengths, self.index.overlap_lengths(self.a))
+
+    def test_within_overlap(self):
+        merged = IntervalIndex(self.index.merged())
+        for index in [self.index, merged]:
+            self.assertEqual(self.librgt.within_overlap(index.coded()), bool(index.regions.overlap_mask().any()))
+        self.assertFalse(self.librgt.within_overlap(merged.coded()))
+
+    def test_unique(self):
+        np.testing.assert_array_equal(self.librgt.unique(self.index.coded()),
+                                      np.flatnonzero(~self.index.regions.duplicate_mask()))
+
+
+if __name__ == "__main__":
+    unittest.main()
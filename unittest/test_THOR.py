@@ -0,0 +1,186 @@
+from __future__ import print_function
+from __future__ import division
+import os
+import pickle
+import shutil
+import tempfile
+import unittest
+from glob import glob
+from math import log
+from optparse import Values
+import numpy as np
+from rgt.THOR import get_extension_size
+from rgt.THOR import checkpoint
+
+try:
+    from rgt.THOR.neg_bin import NegBin
+    from rgt.THOR import get_fast_gen_pvalue
+except ImportError:
+    # THOR needs mpmath and scikit-learn
+    get_fast_gen_pvalue = None
+
+"""Unit Test"""
+
+
+def _old_log_pvalue(x, y, side, distr):
+    """Return the log10 p-value of a pair of counts computed by the per-pair loop which get_log_pvalues replaced."""
+    if side == 'l':
+        x, y = y, x
+    current_p = get_fast_gen_pvalue.get_log_value(x, distr) + get_fast_gen_pvalue.get_log_value(y, distr)
+    return get_fast_gen_pvalue.compute_pvalue(distr, x + y, 'r', current_p, x) / log(10)
+
+
+@unittest.skipIf(get_fast_gen_pvalue is None, "THOR dependencies are not installed")
+class TestNegBin(unittest.TestCase):
+
+    def test_logpdf_array(self):
+        for mu, alpha in [(8.5, 0.3), (0.2, 2.), (150., 0.01)]:
+            m = NegBin(mu, alpha)
+            counts = np.array([0, 1, 2, 5, 17, 100, 1000])
+            np.testing.assert_allclose(m.logpdf_array(counts), [float(m.logpdf(x)) for x in counts],
+                                       rtol=1e-10, atol=1e-10)
+
+    def test_logpdf_array_invalid(self):
+        # Like logpdf on a ValueError, invalid parameters give 1 for every count
+        m = NegBin(0., 0.3)
+        self.assertEqual(m.logpdf_array(np.arange(3)).tolist(), [1, 1, 1])
+
+
+@unittest.skipIf(get_fast_gen_pvalue is None, "THOR dependencies are not installed")
+class TestGetFastGenPvalue(unittest.TestCase):
+
+    def setUp(self):
+        # get_log_value keeps the binomial log-pmf of every count regardless of the distribution
+        get_fast_gen_pvalue.lookup_pmf.clear()
+
+    def check_pvalues(self, distr, pairs):
+        x, y = [p[0] for p in pairs], [p[1] for p in pairs]
+        for side in ['l', 'r']:
+            result = get_fast_gen_pvalue.get_log_pvalues(x, y, side, distr)
+            expected = [_old_log_pvalue(a, b, side, distr) for a, b in pairs]
+            np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-12)
+        # Sides per pair
+        sides = ['l' if a > b else 'r' for a, b in pairs]
+        result = get_fast_gen_pvalue.get_log_pvalues(x, y, sides, distr)
+        expected = [_old_log_pvalue(a, b, s, distr) for (a, b), s in zip(pairs, sides)]
+        np.testing.assert_allclose(result, expected, rtol=1e-9, atol=1e-12)
+
+    def test_negative_binomial(self):
+        distr = {'distr_name': 'nb', 'distr': NegBin(8.5, 0.3)}
+        pairs = [(0, 0), (0, 3), (3, 0), (5, 5), (12, 40), (40, 12), (7, 8), (100, 3), (0, 0), (12, 40)]
+        self.check_pvalues(distr, pairs)
+
+    def test_binomial(self):
+        distr = {'distr_name': 'binomial', 'n': 60, 'p': 0.1}
+        pairs = [(0, 0), (1, 0), (0, 1), (2, 9), (9, 2), (6, 6), (20, 1), (0, 0)]
+        self.check_pvalues(distr, pairs)
+
+    def test_empty(self):
+        distr = {'distr_name': 'nb', 'distr': NegBin(8.5, 0.3)}
+        self.assertEqual(len(get_fast_gen_pvalue.get_log_pvalues([], [], 'l', distr)), 0)
+
+    def test_single_pair(self):
+        distr = {'distr_name': 'nb', 'distr': NegBin(3., 0.5)}
+        self.assertAlmostEqual(get_fast_gen_pvalue.get_log_pvalue_new(0, 0, 'r', distr), -log(2) / log(10))
+        self.assertAlmostEqual(get_fast_gen_pvalue.get_log_pvalue_new(30, 2, 'l', distr),
+                               _old_log_pvalue(30, 2, 'l', distr))
+
+
+class TestGetExtensionSize(unittest.TestCase):
+
+    def setUp(self):
+        # Small windows, so that the regions cross several of them
+        self.fft_size = get_extension_size.FFT_SIZE
+        get_extension_size.FFT_SIZE = 2 ** 12
+
+    def tearDown(self):
+        get_extension_size.FFT_SIZE = self.fft_size
+
+    def test_ccf(self):
+        random = np.random.RandomState(7)
+        forward = np.unique(random.randint(0, 50000, 3000))
+        reverse = np.unique(np.concatenate((forward[::2] + 170, random.randint(0, 50000, 2000))))
+        reverse_set = set(reverse.tolist())
+        for first, last in [(-50, 595), (0, 0), (-300, -100), (1000, 5000)]:
+            expected = [sum(1 for p in forward.tolist() if p + k in reverse_set) for k in range(first, last + 1)]
+            self.assertEqual(get_extension_size.ccf(forward, reverse, first, last).tolist(), expected)
+        self.assertEqual(get_extension_size.ccf(forward, reverse[:0], 0, 10).tolist(), [0] * 11)
+
+
+class TestCheckpoint(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.regions = os.path.join(self.directory, "regions.bed")
+        with open(self.regions, "w") as f:
+            f.write("chr1\t0\t1000\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def get_parameters(self, **options):
+        values = {"binsize": 100, "stepsize": 50, "exts": [], "regions": self.regions}
+        values.update(options)
+        return checkpoint.get_parameters(Values(values), ["a.bam", "b.bam"], None, "chrom.sizes", [1, 1], None)
+
+    def get_checkpoint(self, **options):
+        return checkpoint.Checkpoint(os.path.join(self.directory, "checkpoint"), self.get_parameters(**options))
+
+    def test_save_load(self):
+        cp = self.get_checkpoint()
+        self.assertIsNone(cp.load("training"))
+        cp.save("training", {"factors": [1.5, 2.], "mu": np.arange(3)})
+        data = self.get_checkpoint().load("training")
+        self.assertEqual(data["factors"], [1.5, 2.])
+        self.assertEqual(data["mu"].tolist(), [0, 1, 2])
+        # The temporary file is renamed to the stage file
+        self.assertEqual(glob(cp.filename("*", ".pkl.*")), [])
+        self.assertEqual(os.listdir(cp.directory), ["training.pkl"])
+
+    def test_other_parameters(self):
+        self.get_checkpoint().save("training", {"factors": [1.5, 2.]})
+        self.assertIsNone(self.get_checkpoint(binsize=200).load("training"))
+        self.assertIsNotNone(self.get_checkpoint().load("training"))
+
+    def test_changed_file(self):
+        self.get_checkpoint().save("training", {"factors": [1.5, 2.]})
+        status = os.stat(self.regions)
+        os.utime(self.regions, (status.st_atime, status.st_mtime - 100))
+        self.assertIsNone(self.get_checkpoint().load("training"))
+        os.utime(self.regions, (status.st_atime, status.st_mtime))
+        self.assertIsNotNone(self.get_checkpoint().load("training"))
+        with open(self.regions, "a") as f:
+            f.write("chr1\t2000\t3000\n")
+        os.utime(self.regions, (status.st_atime, status.st_mtime))
+        self.assertIsNone(self.get_checkpoint().load("training"))
+
+    def test_unreadable_file(self):
+        cp = self.get_checkpoint()
+        cp.save("training", {"factors": [1.5, 2.]})
+        with open(cp.filename("training"), "rb") as f:
+            content = f.read()
+        with open(cp.filename("training"), "wb") as f:
+            f.write(content[:len(content) // 2])
+        self.assertIsNone(cp.load("training"))
+        for data in [[1, 2], {"other": 1}, "text"]:
+            with open(cp.filename("training"), "wb") as f:
+                pickle.dump(data, f)
+            self.assertIsNone(cp.load("training"))
+        with open(cp.filename("training"), "wb") as f:
+            f.write(b"not a pickle")
+        self.assertIsNone(cp.load("training"))
+
+    def test_is_resumed(self):
+        directory = os.path.join(self.directory, "checkpoint")
+        self.assertFalse(checkpoint.is_resumed(directory, self.get_parameters()))
+        cp = self.get_checkpoint()
+        self.assertFalse(checkpoint.is_resumed(directory, self.get_parameters()))
+        cp.save("chromosome-0", {"peaks": []})
+        self.assertFalse(checkpoint.is_resumed(directory, self.get_parameters()))
+        cp.save("extension_sizes", {"exts": [200, 200], "exts_inputs": []})
+        self.assertTrue(checkpoint.is_resumed(directory, self.get_parameters()))
+        self.assertFalse(checkpoint.is_resumed(directory, self.get_parameters(binsize=200)))
+
+
+if __name__ == "__main__":
+    unittest.main()